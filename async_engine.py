@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于asyncio的下载引擎（可选模式，需要安装 aiohttp）
+
+列表页抓取、帖子页抓取和视频流式下载都以协程方式运行在同一个事件循环上，
+去重、文件索引和帖子记录全部复用 Rule34FixedDownloader 的逻辑。
+"""
+
+import os
+import time
+import asyncio
+from urllib.parse import urlparse
+
+from http_client import DownloadVerificationError
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp 为可选依赖
+    aiohttp = None
+
+
+def is_available():
+    """检查asyncio引擎依赖是否可用"""
+    return aiohttp is not None
+
+
+class AsyncDownloadEngine:
+    """asyncio下载引擎，每个在途任务只占用一个协程而不是一个系统线程"""
+
+    def __init__(self, downloader, max_concurrency=None):
+        if aiohttp is None:
+            raise RuntimeError("asyncio引擎需要安装 aiohttp: pip install aiohttp")
+        self.downloader = downloader
+        self.max_concurrency = max_concurrency or downloader.max_workers
+        self.resolve_concurrency = downloader.resolve_workers
+        # 已解析、等待下载的帖子上限（与线程池模式的有界队列对应）
+        self.queue_size = downloader.pipeline_queue_size or self.max_concurrency * 2
+        self.waiting = 0  # 已解析、等待下载槽位的帖子数
+        self.chunk_size = 65536
+        # 写入 .part 的缓冲大小：攒够后在线程中一次写入并更新MD5，不阻塞事件循环
+        self.write_buffer_size = 1024 * 1024
+        self.connection_slots = None  # 全局媒体连接上限，在事件循环中创建
+
+    def run(self, tags, download_dir="downloads"):
+        """同步入口，运行事件循环直到所有页面处理完成"""
+        return asyncio.run(self.download_videos_by_tags(tags, download_dir))
+
+    async def get(self, session, url, timeout, headers=None):
+        """限速 + 重试的GET请求，与线程池模式共用同一个限速器和重试策略
+
+        返回的响应需要调用方用 async with 释放；重试耗尽时抛出 aiohttp.ClientResponseError
+        """
+        client = self.downloader.client
+        host = urlparse(url).netloc
+        attempt = 0
+        while True:
+            delay = client.limiter.reserve(host)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                client.record_sleep("rate_limit", delay)
+            start = time.monotonic()
+            try:
+                response = await session.get(url, timeout=timeout, headers=headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                client.record_request(url, "error", time.monotonic() - start)
+                wait_time = client.should_retry_error(url, e, attempt)
+                if wait_time is None:
+                    raise
+                await asyncio.sleep(wait_time)
+                client.record_sleep("backoff", wait_time)
+                attempt += 1
+                continue
+            client.record_request(url, response.status, time.monotonic() - start)
+
+            if response.status >= 400:
+                wait_time = client.should_retry_status(
+                    url, response.status, response.headers.get('Retry-After'), attempt, start
+                )
+                if wait_time is not None:
+                    response.release()
+                    if wait_time > 0:
+                        await asyncio.sleep(wait_time)
+                        client.record_sleep("backoff", wait_time)
+                    attempt += 1
+                    continue
+                response.release()
+                response.raise_for_status()
+
+            client.limiter.on_success(host)
+            return response
+
+    async def fetch_text(self, session, url, label, ttl=0):
+        """GET请求并返回文本（经过页面缓存）；429重试耗尽返回None
+
+        页面缓存在磁盘上读写，begin/finish 放到线程中执行
+        """
+        cache = self.downloader.page_cache
+        entry, text, headers = await asyncio.to_thread(cache.begin, url, ttl) if cache else (None, None, {})
+        if text is not None:
+            return text
+        try:
+            async with await self.get(session, url, aiohttp.ClientTimeout(total=30), headers=headers) as response:
+                text = await response.text()
+                if cache:
+                    text = await asyncio.to_thread(cache.finish, url, entry, response.status, response.headers, text)
+                return text
+        except aiohttp.ClientResponseError as e:
+            if e.status == 429:
+                print(f"❌ {label} 多次重试后仍然429错误，跳过")
+                return None
+            raise
+
+    async def fetch_listing_page(self, session, tags, page_index, use_api):
+        """抓取一个列表页，返回 (帖子ID列表, {post_id: [视频URL]})；抓取或解析失败时返回None"""
+        d = self.downloader
+        if not use_api:
+            page_url = d.build_page_url(tags, page_index * d.posts_per_page)
+            try:
+                page_text = await self.fetch_text(session, page_url, f"页面 {page_url}", d.listing_ttl)
+            except aiohttp.ClientError as e:
+                print(f"⚠️ 列表页请求失败: {e}")
+                return None
+            if page_text is None:
+                return None
+            posts = await asyncio.to_thread(d.parse_listing, page_text, False)
+            return d.index_listing_posts(posts) if posts is not None else None
+
+        try:
+            page_text = await self.fetch_text(session, d.build_api_url(tags, page_index), "API", d.listing_ttl)
+        except aiohttp.ClientError as e:
+            print(f"⚠️ API请求失败: {e}")
+            return None
+        if page_text is None:
+            return None
+        posts = await asyncio.to_thread(d.parse_api_posts, page_text)
+        if posts is None:
+            print(f"⚠️ API返回了无法识别的内容: {page_text[:100]!r}")
+            return None
+        return d.index_api_posts(posts)
+
+    async def download_video(self, session, video_url, post_id, download_dir):
+        """流式下载单个视频文件：写入 .part，支持 Range 续传，校验通过后原子重命名；校验失败时重新下载
+
+        返回值与 Rule34FixedDownloader.download_video 相同: (状态, 文件路径)
+        """
+        d = self.downloader
+        if d.should_stop:
+            return "stopped", None
+        # 文件索引首次建立时会遍历磁盘，放到线程中执行
+        filepath = await asyncio.to_thread(d.prepare_download, video_url, post_id, download_dir)
+        if not filepath:
+            return "exists", None
+
+        start = time.monotonic()
+        try:
+            with d.tracer.span("download", post_id):
+                for attempt in range(1, d.download_attempts + 1):
+                    try:
+                        result = await self.transfer_media(session, video_url, post_id, filepath)
+                        d.file_seconds.observe(time.monotonic() - start, result="ok" if result else "stopped")
+                        return ("downloaded", result) if result else ("stopped", None)
+                    except DownloadVerificationError as e:
+                        if attempt >= d.download_attempts or d.should_stop:
+                            raise
+                        print(f"\n⚠️ {os.path.basename(filepath)} 校验失败: {e}，重新下载 "
+                              f"(尝试 {attempt + 1}/{d.download_attempts})")
+
+        except Exception as e:
+            d.file_seconds.observe(time.monotonic() - start, result="error")
+            print(f"\n❌ 下载失败: {e}")
+            d.abort_download(video_url, post_id)
+            return "failed", None
+
+    @staticmethod
+    def write_part(f, hasher, data):
+        """在线程中写入一块数据并更新MD5，返回写入耗时"""
+        write_start = time.perf_counter()
+        f.write(data)
+        write_time = time.perf_counter() - write_start
+        if hasher:
+            hasher.update(data)
+        return write_time
+
+    async def complete_download(self, video_url, post_id, filepath, downloaded_size, expected_length,
+                                hasher=None):
+        """在线程中校验并重命名 .part、写入文件记录，返回路径"""
+        d = self.downloader
+        md5 = await asyncio.to_thread(d.complete_part_file, filepath, downloaded_size, expected_length,
+                                      post_id, hasher)
+        await asyncio.to_thread(d.finish_download, video_url, post_id, filepath, md5)
+        return filepath
+
+    async def transfer_media(self, session, video_url, post_id, filepath):
+        """传输一次媒体文件，边写边计算MD5；完成返回路径，中断返回None
+
+        磁盘读写（sidecar、续传时重新计算MD5、写入、校验和重命名）都在线程中执行，
+        媒体连接数受 max_connections 限制。
+        """
+        d = self.downloader
+        part_path, _ = d.get_part_paths(filepath)
+        resume_from, expected_length, headers = await asyncio.to_thread(d.get_resume_state, video_url, filepath)
+        if resume_from and resume_from == expected_length:
+            return await self.complete_download(video_url, post_id, filepath, resume_from, expected_length)
+
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=60, sock_read=60)
+        async with self.connection_slots:
+            transfer_start = time.perf_counter()
+            try:
+                response = await self.get(session, video_url, timeout, headers=headers)
+            except aiohttp.ClientResponseError as e:
+                if resume_from and e.status == 416:
+                    # 请求范围超出文件末尾：.part 已包含完整内容
+                    return await self.complete_download(video_url, post_id, filepath, resume_from, 0)
+                raise
+
+            async with response:
+                mode, downloaded_size, total_size = await asyncio.to_thread(
+                    d.begin_part_file, video_url, filepath, resume_from, response.status, response.headers
+                )
+                hasher = await asyncio.to_thread(d.new_hasher, part_path if mode == 'ab' else None)
+                slot = d.progress.start_transfer(f"post {post_id}", os.path.basename(filepath),
+                                                 total_size, downloaded_size)
+                write_time = bandwidth_wait = 0.0
+                buffer = bytearray()
+                pending_write = None
+                f = await asyncio.to_thread(open, part_path, mode)
+                try:
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        if d.should_stop:
+                            # 保留 .part 以便下次续传
+                            print(f"\n🛑 检测到停止信号，中断下载: {filepath}")
+                            d.abort_download(video_url, post_id)
+                            return None
+                        if d.bandwidth_budget:
+                            delay = d.bandwidth_budget.reserve(len(chunk))
+                            if delay > 0:
+                                await asyncio.sleep(delay)
+                                bandwidth_wait += delay
+                        buffer += chunk
+                        slot.add(len(chunk))
+                        if len(buffer) >= self.write_buffer_size:
+                            pending_write = asyncio.ensure_future(
+                                asyncio.to_thread(self.write_part, f, hasher, bytes(buffer)))
+                            buffer.clear()
+                            write_time += await asyncio.shield(pending_write)
+                finally:
+                    # 完成、中断或任务被取消时都先等线程中的写入结束，再写入缓冲中剩余的数据并关闭文件
+                    if pending_write is not None and not pending_write.done():
+                        await asyncio.wait([pending_write])
+                    if buffer:
+                        write_time += await asyncio.to_thread(self.write_part, f, hasher, bytes(buffer))
+                    await asyncio.to_thread(f.close)
+                    d.progress.end_transfer(slot)
+                    d.trace_transfer(transfer_start, slot, write_time, bandwidth_wait)
+
+        return await self.complete_download(video_url, post_id, filepath, slot.downloaded, total_size, hasher)
+
+    async def process_single_post(self, session, stages, post_id, download_dir, video_urls=None):
+        """处理单个帖子：抓取帖子页→解析视频链接→下载→记录；video_urls 已知时跳过帖子页
+
+        stages 为 (解析信号量, 排队信号量, 下载信号量)：解析和下载各自限制并发，
+        排队信号量限制已解析但尚未开始下载的帖子数。
+        """
+        d = self.downloader
+        resolve_slots, queue_slots, download_slots = stages
+        await queue_slots.acquire()
+        queued = True
+        try:
+            async with resolve_slots:
+                if d.should_stop:
+                    return post_id, []
+                print(f"🔄 开始处理帖子 {post_id}...")
+                if video_urls is None:
+                    start = time.monotonic()
+                    with d.tracer.span("post.fetch", post_id):
+                        page_text = await self.fetch_text(session, d.build_post_url(post_id), f"帖子 {post_id}",
+                                                          d.post_ttl)
+                    with d.tracer.span("post.parse", post_id):
+                        # 快速路径找不到链接时会回退到BeautifulSoup完整解析，放到线程中执行
+                        video_urls = (await asyncio.to_thread(d.parse_video_urls, page_text, post_id)
+                                      if page_text is not None else [])
+                    d.resolve_stats.record(time.monotonic() - start, error=not video_urls)
+
+            if not video_urls:
+                await asyncio.to_thread(d.record_post_result, post_id, [], False)
+                return post_id, []
+
+            start = time.monotonic()
+            self.waiting += 1
+            peak_waiting = self.waiting
+            async with download_slots:
+                self.waiting -= 1
+                d.resolve_stats.add_blocked(time.monotonic() - start, peak_waiting)
+                queue_slots.release()
+                queued = False
+                if d.should_stop:
+                    return post_id, []
+
+                start = time.monotonic()
+                downloaded_files = []
+                statuses = []
+                for video_url in video_urls:
+                    status, filepath = await self.download_video(session, video_url, post_id, download_dir)
+                    statuses.append(status)
+                    if filepath:
+                        downloaded_files.append(filepath)
+                # 文件已存在也算处理成功；中断或失败的帖子不记录
+                recorded = await asyncio.to_thread(d.record_download_result, post_id, downloaded_files, statuses)
+                d.download_stats.record(time.monotonic() - start, error=not recorded)
+                return post_id, downloaded_files
+        finally:
+            if queued:
+                queue_slots.release()
+
+    async def download_videos_by_tags(self, tags, download_dir="downloads"):
+        """根据标签下载视频，逐页处理，页面完成判定与线程池模式一致"""
+        d = self.downloader
+        print("🚀 Rule34 修复版视频下载器")
+        print("=" * 80)
+        print(f"🏷️ 搜索标签: {tags}")
+        print(f"📄 页数: 动态检测")
+        print(f"⚡ 最大并发协程数: {self.max_concurrency}")
+        print(f"📦 处理模式: 逐页处理 (asyncio, {'API' if d.listing_mode == 'api' else 'HTML'}列表)")
+        print("=" * 80)
+
+        page_num = 1
+        page_index = 0
+        use_api = d.listing_mode == "api"
+        query_tags, _ = await asyncio.to_thread(d.begin_crawl, tags)
+        crawl_complete = False
+        all_downloaded_files = []
+        total_processed_posts = 0
+
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency * 2)
+        async with aiohttp.ClientSession(headers=dict(d.session.headers), connector=connector) as session:
+            stages = (asyncio.Semaphore(self.resolve_concurrency),
+                      asyncio.Semaphore(self.queue_size + self.resolve_concurrency),
+                      asyncio.Semaphore(self.max_concurrency))
+            self.connection_slots = asyncio.Semaphore(d.max_connections)
+            d.resolve_stats.workers = self.resolve_concurrency
+            d.download_stats.workers = self.max_concurrency
+            listing_lock = asyncio.Lock()  # 列表页按顺序逐个抓取
+            prefetched_pages = {}  # page_index -> Task[(帖子ID列表, 已知视频URL)]
+
+            async def fetch_listing(index, api):
+                async with listing_lock:
+                    with d.tracer.span("listing", page=index):
+                        return await self.fetch_listing_page(session, query_tags, index, api)
+
+            while True:
+                if d.should_stop:
+                    print("\n🛑 检测到停止信号，停止处理...")
+                    break
+
+                print(f"\n🔄 开始处理第 {page_num} 页")
+                print("=" * 60)
+
+                if use_api:
+                    page_url = d.build_api_url(query_tags, page_index)
+                else:
+                    page_url = d.build_page_url(query_tags, page_index * d.posts_per_page)
+                print(f"🔗 URL: {page_url}")
+
+                # 提交当前页和预取页的抓取任务
+                for ahead_index in range(page_index, page_index + d.prefetch_pages + 1):
+                    if ahead_index not in prefetched_pages:
+                        prefetched_pages[ahead_index] = asyncio.create_task(fetch_listing(ahead_index, use_api))
+
+                # 步骤1: 检测当前页的帖子ID
+                print(f"🔍 步骤1: 检测第 {page_num} 页的帖子...")
+                listing = await prefetched_pages.pop(page_index)
+
+                if listing is None:
+                    for task in prefetched_pages.values():
+                        task.cancel()
+                    prefetched_pages.clear()
+                    if use_api and page_index == 0:
+                        print("⚠️ API列表不可用，回退到HTML列表模式")
+                        use_api = False
+                        continue
+                    # 抓取失败不等于没有更多帖子：不标记抓取完整，标签高水位保持不变
+                    print(f"❌ 第 {page_num} 页{'API' if use_api else '列表页'}请求失败，保存进度并停止（不更新高水位）")
+                    await asyncio.to_thread(d.save_detected_posts)
+                    break
+
+                page_post_ids, known_urls = listing
+                await asyncio.to_thread(d.print_page_post_ids, page_post_ids)
+                d.note_listing_page(page_post_ids)
+
+                if not page_post_ids:
+                    print(f"📄 第 {page_num} 页没有找到内容，停止搜索")
+                    crawl_complete = True
+                    break
+
+                new_post_ids = [post_id for post_id in page_post_ids if post_id not in d.detected_posts]
+
+                print(f"📋 第 {page_num} 页检测到 {len(page_post_ids)} 个帖子")
+                print(f"🆕 其中 {len(new_post_ids)} 个新帖子需要处理")
+                print(f"⏭️ 跳过已检测: {len(page_post_ids) - len(new_post_ids)} 个")
+
+                if not new_post_ids:
+                    # 增量模式下 id:> 过滤返回的都是高水位之后的帖子，整页已检测不代表后续页面也已处理，
+                    # 因此与全量模式一样继续翻页，直到空页才算抓取完整
+                    print(f"⏭️ 第 {page_num} 页无新帖子，跳过")
+                    page_num += 1
+                    page_index += 1
+                    continue
+
+                # 本地存档中已有相同MD5文件的帖子不再抓取帖子页
+                new_post_ids = await asyncio.to_thread(d.skip_known_md5_posts, new_post_ids, download_dir)
+                if not new_post_ids:
+                    print(f"⏭️ 第 {page_num} 页新帖子的文件均已存在，跳过")
+                    await asyncio.to_thread(d.save_detected_posts)
+                    page_num += 1
+                    page_index += 1
+                    continue
+
+                # 步骤2: 以协程方式下载当前页的所有帖子
+                print(f"📥 步骤2: 下载第 {page_num} 页的帖子...")
+                page_downloaded_files = []
+                page_processed_posts = 0
+                page_start = time.monotonic()
+
+                tasks = [
+                    asyncio.create_task(self.process_single_post(
+                        session, stages, post_id, download_dir, known_urls.get(post_id)
+                    ))
+                    for post_id in d.order_post_ids(new_post_ids)
+                ]
+                for next_done in asyncio.as_completed(tasks):
+                    try:
+                        post_id, downloaded_files = await next_done
+                    except Exception as e:
+                        print(f"❌ 处理帖子时出错: {e}")
+                        continue
+
+                    if downloaded_files:
+                        page_downloaded_files.extend(downloaded_files)
+                    page_processed_posts += 1
+                    progress = (page_processed_posts / len(new_post_ids)) * 100
+                    print(f"📈 页面进度: {progress:.1f}% ({page_processed_posts}/{len(new_post_ids)}) - 帖子 {post_id}")
+
+                    if d.should_stop:
+                        # 取消还在排队或等待限速的任务，等它们清理完毕后结束本页
+                        for task in tasks:
+                            task.cancel()
+                        await asyncio.gather(*tasks, return_exceptions=True)
+                        break
+                d.page_seconds.observe(time.monotonic() - page_start)
+
+                # 步骤3: 页面完成检查
+                remaining_posts = await asyncio.to_thread(d.check_page_completion, page_num, page_post_ids)
+                if remaining_posts:
+                    break
+                all_downloaded_files.extend(page_downloaded_files)
+                total_processed_posts += page_processed_posts
+
+                d.print_page_statistics(page_num, page_post_ids, remaining_posts, page_downloaded_files,
+                                        total_processed_posts, all_downloaded_files)
+
+                await asyncio.to_thread(d.save_detected_posts)
+
+                page_num += 1
+                page_index += 1
+
+            for task in prefetched_pages.values():
+                task.cancel()
+
+        await asyncio.to_thread(d.finish_crawl, tags, crawl_complete)
+        d.total_posts = total_processed_posts
+        return all_downloaded_files
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端吞吐量基准：启动本地替身站点（列表页、帖子页、dapi、媒体主机），
+用 download_videos_by_tags 完整跑一遍，报告 帖子/s、MB/s 和首字节时间
+
+用法:
+    python benchmarks/bench_e2e.py [--posts 126] [--file-size-kb 256] [--workers 3]
+    python benchmarks/bench_e2e.py --listing-mode api --engine async --latency 0.05 --throttle-rate 0.05
+    python benchmarks/bench_e2e.py --label "before-change"      # 给这次结果加标签
+
+指标:
+    posts/s   处理的帖子数 / 总耗时
+    MB/s      服务端发出的媒体字节数 / 总耗时
+    TTFB      从开始运行到服务端发出第一个媒体字节的时间
+
+每次结果追加到 benchmarks/results/e2e.jsonl（含git版本），并与相同参数的上一次结果对比，
+便于发现版本之间的性能回退。
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import datetime
+import subprocess
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rule34_fixed_downloader import Rule34FixedDownloader  # noqa: E402
+from stub_server import StubSite, start_server, add_site_arguments, site_options, parse_sizes  # noqa: E402
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'e2e.jsonl')
+
+# 参与"相同参数"比较的字段
+CONFIG_KEYS = ("posts", "file_size_kb", "listing_mode", "engine", "workers", "rate", "max_rate",
+               "latency", "bandwidth_kbps", "throttle_rate")
+
+
+def git_revision():
+    """当前git版本（有未提交修改时加 -dirty），不在git仓库中时返回None"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ("-dirty" if dirty else "")
+
+
+def run_once(args, site, server_url):
+    """在临时目录中运行一次完整下载，返回结果字典"""
+    # 页面走 localhost、媒体走 127.0.0.1，与真实站点一样使用两个连接池
+    page_url = server_url.replace("127.0.0.1", "localhost")
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                downloader = Rule34FixedDownloader(
+                    max_workers=args.workers, state_db=":memory:", engine=args.engine,
+                    listing_mode=args.listing_mode, base_url=page_url, api_base_url=page_url,
+                    rate_limit={"rate": args.rate, "max_rate": args.max_rate}, progress_interval=0,
+                    page_cache={"enabled": False}
+                )
+                site.reset_stats()
+                start = time.monotonic()
+                try:
+                    files = downloader.download_videos_by_tags("stub video", os.path.join(tmp, "downloads"))
+                finally:
+                    downloader.close()
+                elapsed = time.monotonic() - start
+        finally:
+            os.chdir(cwd)
+
+    if args.verbose:
+        print(output.getvalue())
+    stats = site.stats
+    media_mb = stats["media_bytes"] / (1024 * 1024)
+    first_byte = stats["first_media_byte"]
+    return {
+        "files": len(files or []),
+        "seconds": round(elapsed, 3),
+        "posts_per_second": round(len(site.posts) / elapsed, 2) if elapsed > 0 else 0.0,
+        "mb_per_second": round(media_mb / elapsed, 2) if elapsed > 0 else 0.0,
+        "ttfb": round(first_byte - start, 3) if first_byte is not None else None,
+        "media_mb": round(media_mb, 2),
+        "requests": dict(sorted(stats["requests"].items())),
+        "throttled": stats["throttled"]
+    }
+
+
+def load_previous(path, config):
+    """结果文件中与 config 参数相同的最近一次结果"""
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if all(entry.get("config", {}).get(key) == config[key] for key in CONFIG_KEYS):
+                previous = entry
+    return previous
+
+
+def format_change(current, previous, higher_is_better=True):
+    if not previous or current is None:
+        return ""
+    change = (current - previous) / previous * 100
+    better = change >= 0 if higher_is_better else change <= 0
+    return f" ({'+' if change >= 0 else ''}{change:.1f}% {'✅' if better else '⚠️'})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端吞吐量基准")
+    parser.add_argument('--posts', type=int, default=126, help="合成帖子数（默认3页）")
+    parser.add_argument('--listing-mode', choices=("html", "api"), default="html")
+    parser.add_argument('--engine', choices=("thread", "async"), default="thread")
+    parser.add_argument('--workers', type=int, default=3, help="下载并发数")
+    parser.add_argument('--rate', type=float, default=2.0, help="每个主机的初始请求速率（同 rate_limit.rate）")
+    parser.add_argument('--max-rate', type=float, default=8.0, help="每个主机的最大请求速率（同 rate_limit.max_rate）")
+    parser.add_argument('--repeat', type=int, default=1, help="重复次数（报告中位数那次）")
+    parser.add_argument('--label', default="", help="结果标签")
+    parser.add_argument('--results', default=RESULTS_FILE, help="结果文件（JSONL）")
+    parser.add_argument('--no-save', action='store_true', help="不保存结果")
+    parser.add_argument('--verbose', action='store_true', help="显示下载器输出")
+    add_site_arguments(parser)
+    parser.set_defaults(synthetic=None)
+    args = parser.parse_args()
+    posts = args.synthetic or args.posts
+
+    site = StubSite.synthetic(posts, parse_sizes(args.file_size_kb), **site_options(args))
+    server, server_url = start_server(site)
+
+    config = {
+        "posts": posts,
+        "file_size_kb": args.file_size_kb,
+        "listing_mode": args.listing_mode,
+        "engine": args.engine,
+        "workers": args.workers,
+        "rate": args.rate,
+        "max_rate": args.max_rate,
+        "latency": args.latency,
+        "bandwidth_kbps": args.bandwidth_kbps,
+        "throttle_rate": args.throttle_rate
+    }
+    print("=" * 70)
+    print(f"🧪 端到端基准: {posts} 个帖子, {args.listing_mode.upper()}列表, {args.engine} 引擎, {args.workers} 并发")
+    print(f"🚦 限速 {args.rate}-{args.max_rate} 请求/s/主机")
+    print(f"🌐 延迟 {args.latency}s, 带宽 {args.bandwidth_kbps or '不限'} KB/s/连接, 429比例 {args.throttle_rate}")
+    print("=" * 70)
+
+    runs = []
+    try:
+        for i in range(args.repeat):
+            result = run_once(args, site, server_url)
+            runs.append(result)
+            print(f"  第 {i + 1} 次: {result['seconds']:.2f}s, {result['posts_per_second']:.1f} 帖子/s, "
+                  f"{result['mb_per_second']:.1f} MB/s, TTFB {result['ttfb']}s, 429 {result['throttled']} 次")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    result = sorted(runs, key=lambda run: run["seconds"])[len(runs) // 2]
+    if result["files"] != posts:
+        print(f"❌ 只下载了 {result['files']}/{posts} 个文件")
+
+    previous = load_previous(args.results, config)
+    previous_result = previous["result"] if previous else {}
+    print("=" * 70)
+    print(f"📊 帖子/s: {result['posts_per_second']}"
+          f"{format_change(result['posts_per_second'], previous_result.get('posts_per_second'))}")
+    print(f"📊 MB/s:   {result['mb_per_second']}"
+          f"{format_change(result['mb_per_second'], previous_result.get('mb_per_second'))}")
+    print(f"📊 TTFB:   {result['ttfb']}s"
+          f"{format_change(result['ttfb'], previous_result.get('ttfb'), higher_is_better=False)}")
+    print(f"📨 请求数: {result['requests']}")
+    if previous:
+        print(f"🔁 对比: {previous.get('revision')} {previous.get('label', '')} ({previous.get('time')})")
+
+    if not args.no_save:
+        entry = {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "label": args.label,
+            "config": config,
+            "result": result
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+        with open(args.results, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        print(f"💾 结果已追加到: {args.results}")
+    print("=" * 70)
+    return 0 if result["files"] == posts else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
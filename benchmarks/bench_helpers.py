@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+解析与URL辅助函数的微基准，可与记录的基线对比作为性能回退门禁
+
+用法:
+    python benchmarks/bench_helpers.py                    # 运行并与基线对比（只报告）
+    python benchmarks/bench_helpers.py --check            # 任一项慢于基线 tolerance 倍时返回非0
+    python benchmarks/bench_helpers.py --save-baseline    # 用本次结果覆盖基线
+    python benchmarks/bench_helpers.py --only listing     # 只运行名称包含 listing 的项
+
+覆盖的函数（每页/每个帖子都会调用）:
+    parse_post_ids              42个帖子的列表页、1000个帖子的超大列表页（含大量无关链接）
+    parse_video_urls            普通帖子页、含大量标签/评论链接的帖子页（fast 与 soup）
+    normalize_video_url         URL语料
+    is_valid_video_url          URL语料
+    generate_unique_filename    URL语料
+
+语料为 benchmarks/pages/ 中保存的页面加上 corpus.py 生成的合成页面。
+不同机器的绝对耗时不可比，基线中同时保存一个纯Python校准循环的耗时，
+对比时使用 耗时/校准耗时 的比值。
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rule34_fixed_downloader import Rule34FixedDownloader  # noqa: E402
+import corpus  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'helpers.json')
+
+
+def calibrate(repeat=20):
+    """纯Python校准循环（整数运算 + 字符串处理）的耗时（取最小值），用于把结果换算到与机器无关的比值"""
+    def loop():
+        total = 0
+        for i in range(20000):
+            text = f"https://wimg.rule34.xxx/images/{i}/{i:032x}.mp4?{i}"
+            total += len(text.split('/')[-1]) + text.find('.mp4') + i % 7
+        return total
+
+    return measure(loop, repeat, 1)
+
+
+def measure(func, repeat, number=None, min_round=0.05):
+    """运行 repeat 轮、每轮 number 次，返回单次调用的最小耗时（秒）
+
+    number 为None时自动选择，使每轮至少运行 min_round 秒
+    """
+    if number is None:
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            if time.perf_counter() - start >= min_round:
+                break
+            number *= 2
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def url_corpus(count=1000):
+    """媒体URL语料：标准URL、双斜杠、其它子域名、waifu2x、非视频和无hash文件名"""
+    urls = []
+    for i in range(count):
+        post_id = 12000000 + i
+        md5 = corpus.post_md5(post_id)
+        folder = post_id // 5000
+        kind = i % 6
+        if kind == 0:
+            urls.append(f"https://wimg.rule34.xxx//images/{folder}/{md5}.mp4?{post_id}")
+        elif kind == 1:
+            urls.append(f"https://ws-cdn-video.rule34.xxx/images/{folder}/{md5}.webm?{post_id}")
+        elif kind == 2:
+            urls.append(f"https://api-cdn-mp4.rule34.xxx/images/{folder}/{md5}_{post_id}.mp4")
+        elif kind == 3:
+            urls.append(f"https://waifu2x.booru.pics/Home/fromlink?url=https://wimg.rule34.xxx/images/{folder}/{md5}.mp4")
+        elif kind == 4:
+            urls.append(f"https://wimg.rule34.xxx/images/{folder}/{md5}.jpeg?{post_id}")
+        else:
+            urls.append(f"https://example.com/media/clip_{i}.mov")
+    return urls
+
+
+def build_cases(downloader, download_dir):
+    """返回 [(名称, 函数)]"""
+    cases = []
+
+    listing = corpus.make_listing_page(corpus.synthetic_listing_posts(42), filler_links=200)
+    huge_listing = corpus.make_listing_page(corpus.synthetic_listing_posts(1000), filler_links=5000)
+    cases.append(("parse_post_ids/listing_42", lambda: downloader.parse_post_ids(listing, False)))
+    cases.append(("parse_post_ids/listing_1000", lambda: downloader.parse_post_ids(huge_listing, False)))
+    for name, page_text in corpus.saved_pages('listing'):
+        cases.append((f"parse_post_ids/{name}",
+                      lambda page_text=page_text: downloader.parse_post_ids(page_text, False)))
+
+    _, post_page = corpus.synthetic_post_pages(1)[0]
+    media_url = f"https://wimg.rule34.xxx//images/2400/{corpus.post_md5(12000000)}.mp4?12000000"
+    big_post_page = corpus.make_post_page(12000000, media_url, tag_links=1000, comment_blocks=1000)
+    for parser in ("fast", "soup"):
+        cases.append((f"parse_video_urls/{parser}/post",
+                      lambda parser=parser: downloader.parse_video_urls(post_page, "0", parser=parser)))
+        cases.append((f"parse_video_urls/{parser}/post_many_links",
+                      lambda parser=parser: downloader.parse_video_urls(big_post_page, "0", parser=parser)))
+    for name, page_text in corpus.saved_pages('post'):
+        cases.append((f"parse_video_urls/fast/{name}",
+                      lambda page_text=page_text: downloader.parse_video_urls(page_text, "0", parser="fast")))
+
+    urls = url_corpus()
+    cases.append(("normalize_video_url/1000_urls", lambda: [downloader.normalize_video_url(url) for url in urls]))
+    cases.append(("is_valid_video_url/1000_urls", lambda: [downloader.is_valid_video_url(url) for url in urls]))
+    cases.append(("generate_unique_filename/1000_urls",
+                  lambda: [downloader.generate_unique_filename(url, i, download_dir) for i, url in enumerate(urls)]))
+    return cases
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析与URL辅助函数微基准")
+    parser.add_argument('--repeat', type=int, default=7, help="每项的轮数（取最小值）")
+    parser.add_argument('--only', default="", help="只运行名称包含该字符串的项")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="基线文件")
+    parser.add_argument('--save-baseline', action='store_true', help="用本次结果覆盖基线")
+    parser.add_argument('--check', action='store_true', help="有项目超过基线 tolerance 倍时返回非0")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="允许的变慢倍数")
+    parser.add_argument('--retries', type=int, default=2, help="超出容差的项重新测量的次数")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline)
+    baseline_cases = (baseline or {}).get("cases", {})
+    calibration = calibrate()
+
+    # 校准循环穿插在各项之间运行，取所有校准的最小值，减少CPU频率波动和抢占的影响
+    with tempfile.TemporaryDirectory() as tmp:
+        with contextlib.redirect_stdout(io.StringIO()):
+            downloader = Rule34FixedDownloader(max_workers=1, state_db=":memory:", page_cache={"enabled": False})
+        cases = [case for case in build_cases(downloader, tmp) if args.only in case[0]]
+        print(f"⏱️ 辅助函数微基准: {len(cases)} 项, 每项 {args.repeat} 轮")
+        timings = {}
+        for name, func in cases:
+            with contextlib.redirect_stdout(io.StringIO()):
+                timings[name] = measure(func, args.repeat)
+            calibration = min(calibration, calibrate(5))
+
+        # 超出容差的项重新测量（最多 retries 次，取最小值），排除偶发的系统抖动
+        for name, func in cases:
+            for _ in range(args.retries):
+                baseline_case = baseline_cases.get(name)
+                if not baseline_case or timings[name] / calibration <= baseline_case["relative"] * args.tolerance:
+                    break
+                with contextlib.redirect_stdout(io.StringIO()):
+                    timings[name] = min(timings[name], measure(func, args.repeat))
+                calibration = min(calibration, calibrate(5))
+        downloader.close()
+
+    print("=" * 90)
+    print(f"{'项目':<48}{'耗时(ms)':>12}{'相对校准':>12}{'基线比':>10}  结果")
+    print("=" * 90)
+    results = {}
+    regressions = []
+    for name, seconds in timings.items():
+        relative = seconds / calibration
+        results[name] = {"seconds": round(seconds, 7), "relative": round(relative, 5)}
+
+        baseline_case = baseline_cases.get(name)
+        if baseline_case:
+            ratio = relative / baseline_case["relative"]
+            slower = ratio > args.tolerance
+            if slower:
+                regressions.append(name)
+            verdict = f"{ratio:>9.2f}x  {'❌ 变慢' if slower else '✅'}"
+        else:
+            verdict = f"{'-':>10}  无基线"
+        print(f"{name[:47]:<48}{seconds * 1000:>12.3f}{relative:>12.4f}{verdict}")
+
+    print("=" * 90)
+    print(f"🎯 校准循环: {calibration * 1000:.3f} ms")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        merged = dict(baseline_cases) if args.only else {}
+        merged.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({"calibration": round(calibration, 7), "python": sys.version.split()[0],
+                       "cases": dict(sorted(merged.items()))}, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"💾 基线已保存: {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"❌ {len(regressions)} 项慢于基线 {args.tolerance} 倍: {', '.join(regressions)}")
+        return 1 if args.check else 0
+    print("✅ 没有超过基线容差的项" if baseline else "⚠️ 没有基线，使用 --save-baseline 记录")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+帖子页解析基准：对比快速路径(fast)与BeautifulSoup完整解析(soup)的耗时，并校验两者提取的URL完全一致
+
+用法:
+    python benchmarks/bench_post_parser.py [--repeat 20] [--pages 20]
+
+语料为 benchmarks/pages/post_*.html 中的帖子页，加上按真实页面结构生成的合成帖子页。
+pages/ 下的帖子页同样是合成的：按真实帖子页的标记手工整理，帖子ID和MD5都是编造的，
+覆盖 mp4/webm 视频、图片帖子、已删除帖子、评论中出现 "Original image" 文字、
+侧边栏缺少 Original image 链接等情况，结果不代表真实站点页面的分布。
+
+快速路径只在找到 Original image 锚点、或页面中没有任何视频扩展名时跳过完整解析；
+页面有视频链接但侧边栏缺少 Original image 锚点时（post_video_no_original）仍回退
+BeautifulSoup 完整解析，这类页面的加速比约为1x。
+"""
+
+import os
+import io
+import sys
+import time
+import argparse
+import contextlib
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rule34_fixed_downloader import Rule34FixedDownloader  # noqa: E402
+import corpus  # noqa: E402
+
+
+def make_downloader():
+    """创建只用于解析的下载器（内存数据库，不输出加载信息）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Rule34FixedDownloader(max_workers=1, state_db=":memory:", page_cache={"enabled": False})
+
+
+def time_parser(downloader, page_text, parser, repeat):
+    """返回 (每次解析耗时中位数秒, 解析结果)"""
+    timings = []
+    result = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = downloader.parse_video_urls(page_text, "0", parser=parser)
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="帖子页解析基准")
+    parser.add_argument('--repeat', type=int, default=20, help="每个页面每种解析方式的重复次数")
+    parser.add_argument('--pages', type=int, default=20, help="合成帖子页数量")
+    args = parser.parse_args()
+
+    downloader = make_downloader()
+    pages = corpus.saved_pages('post') + corpus.synthetic_post_pages(args.pages)
+
+    print("=" * 80)
+    print(f"📄 帖子页解析基准: {len(pages)} 个页面, 每个重复 {args.repeat} 次")
+    print("=" * 80)
+    print(f"{'页面':<36}{'soup(ms)':>12}{'fast(ms)':>12}{'加速比':>10}  结果")
+
+    total_soup = total_fast = 0.0
+    mismatches = 0
+    fallback_pages = []
+    for name, page_text in pages:
+        soup_time, soup_urls = time_parser(downloader, page_text, "soup", args.repeat)
+        fast_time, fast_urls = time_parser(downloader, page_text, "fast", args.repeat)
+        total_soup += soup_time
+        total_fast += fast_time
+        same = soup_urls == fast_urls
+        if not same:
+            mismatches += 1
+        if soup_time / fast_time < 2:
+            fallback_pages.append(name)
+        print(f"{name[:35]:<36}{soup_time * 1000:>12.3f}{fast_time * 1000:>12.3f}"
+              f"{soup_time / fast_time:>9.1f}x  {'✅ 一致' if same else f'❌ 不一致 {soup_urls} != {fast_urls}'}")
+
+    print("=" * 80)
+    print(f"📊 总计: soup {total_soup * 1000:.2f} ms, fast {total_fast * 1000:.2f} ms, "
+          f"加速 {total_soup / total_fast:.1f}x")
+    if fallback_pages:
+        print(f"ℹ️ 以下页面快速路径回退了完整解析（有视频链接但没有 Original image 锚点），"
+              f"加速比约1x: {', '.join(fallback_pages)}")
+    if mismatches:
+        print(f"❌ {mismatches} 个页面提取结果不一致")
+        return 1
+    print("✅ 所有页面提取结果一致")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
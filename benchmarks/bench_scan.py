@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载目录扫描基准：报告冷扫描（无缓存）和热扫描（缓存命中）的吞吐量(MB/s)
+
+用法:
+    python benchmarks/bench_scan.py [--files 200] [--size-mb 4] [--workers N]
+    python benchmarks/bench_scan.py --dir downloads     # 扫描已有目录（不会修改其中的文件）
+
+对比项:
+    serial-4k  旧实现：单线程、4 KB 分块读取
+    cold       进程池 + 内存映射，无缓存
+    warm       使用冷扫描写入的缓存
+"""
+
+import os
+import io
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scan_downloads  # noqa: E402
+
+
+def legacy_file_hash(file_path):
+    """旧实现：4 KB 分块读取"""
+    hash_md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(4096), b""):
+            hash_md5.update(chunk)
+    return hash_md5.hexdigest()
+
+
+def make_corpus(root, files, size):
+    """在 root/bench 下生成 files 个大小为 size 的文件"""
+    folder = os.path.join(root, "bench")
+    os.makedirs(folder, exist_ok=True)
+    block = os.urandom(1024 * 1024)
+    for i in range(files):
+        with open(os.path.join(folder, f"{i:032x}_{i}.mp4"), 'wb') as f:
+            remaining = size
+            while remaining > 0:
+                f.write(block[:min(remaining, len(block))])
+                remaining -= len(block)
+
+
+def drop_page_cache(root):
+    """尽量让冷扫描从磁盘读取（需要Linux且有权限，否则忽略）"""
+    try:
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                fd = os.open(os.path.join(dirpath, name), os.O_RDONLY)
+                try:
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                finally:
+                    os.close(fd)
+    except (AttributeError, OSError):
+        pass
+
+
+def run_scan(root, cache_path, workers, use_cache):
+    """执行一次扫描，返回 (耗时秒, 统计, 结果)"""
+    stats = {}
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = scan_downloads.scan_downloads_folder(root, cache_path, workers, use_cache, stats)
+    return time.perf_counter() - start, stats, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="下载目录扫描基准")
+    parser.add_argument('--dir', help="扫描已有目录（默认生成临时语料）")
+    parser.add_argument('--files', type=int, default=200, help="生成的文件数")
+    parser.add_argument('--size-mb', type=float, default=4, help="每个文件大小(MB)")
+    parser.add_argument('--workers', type=int, default=None, help="哈希进程数（默认CPU核数）")
+    parser.add_argument('--skip-serial', action='store_true', help="跳过旧实现基线")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.dir
+        if root is None:
+            root = os.path.join(tmp, "downloads")
+            make_corpus(root, args.files, int(args.size_mb * 1024 * 1024))
+        cache_path = os.path.join(tmp, "scan_hash_cache.json")
+
+        print("=" * 70)
+        print(f"📁 扫描目录: {root}")
+        print("=" * 70)
+        print(f"{'模式':<14}{'文件数':>8}{'总MB':>10}{'耗时(s)':>10}{'MB/s':>12}{'重新哈希':>10}")
+
+        def report(name, elapsed, files, total_bytes, hashed):
+            mb = total_bytes / (1024 * 1024)
+            print(f"{name:<14}{files:>8}{mb:>10.1f}{elapsed:>10.3f}{mb / max(elapsed, 1e-9):>12.1f}{hashed:>10}")
+
+        serial_hashes = {}
+        if not args.skip_serial:
+            drop_page_cache(root)
+            paths = [os.path.join(dirpath, name) for dirpath, _, names in os.walk(root) for name in names]
+            start = time.perf_counter()
+            serial_hashes = {path: legacy_file_hash(path) for path in paths}
+            elapsed = time.perf_counter() - start
+            report("serial-4k", elapsed, len(paths), sum(os.path.getsize(p) for p in paths), len(paths))
+
+        drop_page_cache(root)
+        elapsed, stats, cold = run_scan(root, cache_path, args.workers, use_cache=False)
+        report("cold", elapsed, stats["files"], stats["bytes"], stats["hashed_files"])
+
+        elapsed, stats, warm = run_scan(root, cache_path, args.workers, use_cache=True)
+        report("warm", elapsed, stats["files"], stats["bytes"], stats["hashed_files"])
+
+        print("=" * 70)
+        mismatched = [path for path, info in cold.items()
+                      if serial_hashes and serial_hashes.get(os.path.join(root, path)) != info["hash"]]
+        if cold != warm or mismatched:
+            print("❌ 扫描结果不一致")
+            return 1
+        print("✅ 冷/热扫描结果一致" + ("，与旧实现哈希一致" if serial_hashes else ""))
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
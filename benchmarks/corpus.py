@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试用的页面语料：按 rule34 页面结构生成列表页和帖子页，并加载 benchmarks/pages/ 下保存的页面
+
+benchmarks/pages/ 下的页面不是从站点抓取的，而是按真实帖子页的标记手工整理的合成页面，
+其中的帖子ID、MD5和用户名都是编造的，只用于覆盖解析器需要处理的页面结构。
+"""
+
+import os
+import glob
+import hashlib
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'pages')
+
+
+def post_md5(post_id):
+    """帖子的确定性MD5（合成数据用）"""
+    return hashlib.md5(f"post-{post_id}".encode()).hexdigest()
+
+
+def make_listing_page(posts, filler_links=0):
+    """生成搜索结果页，posts 为 (post_id, folder, md5) 列表"""
+    parts = [
+        '<!DOCTYPE html><html><head><title>Rule 34 / list</title></head><body>',
+        '<div id="header"><ul id="navbar">',
+    ]
+    parts.extend(f'<li><a href="index.php?page=wiki&amp;s=view&amp;id={i}">wiki {i}</a></li>' for i in range(filler_links))
+    parts.append('</ul></div><div id="content"><div class="image-list">')
+    for post_id, folder, md5 in posts:
+        parts.append(
+            f'<span id="s{post_id}" class="thumb">'
+            f'<a id="p{post_id}" href="index.php?page=post&amp;s=view&amp;id={post_id}" >'
+            f'<img src="https://wimg.rule34.xxx/thumbnails/{folder}/thumbnail_{md5}.jpg?{post_id}" '
+            f'alt="video animated" border="0" title=" video animated score:10 rating:explicit" class="preview" />'
+            f'</a></span>\n'
+        )
+    parts.append('</div><div class="pagination"><a href="?page=post&amp;s=list&amp;pid=42">2</a></div>')
+    parts.append('</div></body></html>')
+    return ''.join(parts)
+
+
+def make_post_page(post_id, media_url, tag_links=40, comment_blocks=20):
+    """生成帖子页：侧边栏第6个div为Options，其第2个li为Original image链接（与真实页面结构一致）"""
+    tags = ''.join(
+        f'<li class="tag-type-general tag"><a href="index.php?page=post&amp;s=list&amp;tags=tag_{i}">tag {i}</a> '
+        f'<span class="tag-count">{i * 7}</span></li>'
+        for i in range(tag_links)
+    )
+    comments = ''.join(
+        f'<div class="comment"><a href="index.php?page=account&amp;s=profile&amp;id={i}">user{i}</a>'
+        f'<p>comment body {i} with <a href="https://example.com/{i}.mp4.html">a link</a></p></div>'
+        for i in range(comment_blocks)
+    )
+    return (
+        '<!DOCTYPE html><html><head><title>Rule 34 - post</title></head><body>'
+        '<div id="content"><div id="post-view">'
+        '<div class="sidebar">'
+        '<div class="sidebar3"><form><input name="tags" /></form></div>'
+        f'<div><h5>Tags</h5><ul id="tag-sidebar">{tags}</ul></div>'
+        f'<div id="stats"><h5>Statistics</h5><ul><li>Id: {post_id}</li><li>Rating: Explicit</li></ul></div>'
+        '<div><h5>Related</h5><ul><li><a href="#">Similar</a></li></ul></div>'
+        '<div><h5>History</h5><ul><li><a href="#">Tag history</a></li></ul></div>'
+        '<div><h5>Options</h5><ul>'
+        '<li><a href="#" onclick="toggle(\'edit_form\')">Edit</a></li>'
+        f'<li><a href="{media_url}" style="font-weight: bold;">Original image</a></li>'
+        f'<li><a href="https://waifu2x.booru.pics/Home/fromlink?url={media_url}">Image upscale (waifu2x)</a></li>'
+        '<li><a href="#" onclick="addFav()">Add to favorites</a></li>'
+        '</ul></div>'
+        '</div>'
+        '<div class="content"><video controls><source src="' + media_url + '" type="video/mp4" /></video>'
+        f'<div id="comments">{comments}</div></div>'
+        '</div></div></body></html>'
+    )
+
+
+def synthetic_post_pages(count=20, tag_links=40, comment_blocks=20):
+    """生成一组合成帖子页，返回 [(名称, HTML)]"""
+    pages = []
+    for i in range(count):
+        post_id = 12000000 + i
+        md5 = post_md5(post_id)
+        media_url = f"https://wimg.rule34.xxx//images/{post_id // 5000}/{md5}.mp4?{post_id}"
+        pages.append((f"synthetic_post_{post_id}", make_post_page(post_id, media_url, tag_links, comment_blocks)))
+    return pages
+
+
+def synthetic_listing_posts(count=42, first_id=12000000):
+    """生成列表页的 (post_id, folder, md5) 列表"""
+    return [(str(first_id - i), str((first_id - i) // 5000), post_md5(first_id - i)) for i in range(count)]
+
+
+def saved_pages(kind):
+    """加载 benchmarks/pages/{kind}_*.html 中手工整理的合成页面，kind 为 post 或 listing"""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(PAGES_DIR, f'{kind}_*.html'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地替身服务器：模拟 rule34 的列表页、帖子页、dapi 接口和媒体主机，用于离线测试
+
+用法:
+    # 回放录制的dapi响应（benchmarks/recorded/dapi_pid_*.json）
+    python benchmarks/stub_server.py --recorded benchmarks/recorded --port 8034
+
+    # 合成 500 个帖子，每个请求延迟 50ms，每个连接限速 2MB/s，5% 的请求返回429
+    python benchmarks/stub_server.py --synthetic 500 --file-size-kb 512,4096 --latency 0.05 \\
+        --bandwidth-kbps 2048 --throttle-rate 0.05
+
+    # 录制真实的dapi响应
+    python benchmarks/stub_server.py --record "mightyniku video" --pages 2 --recorded benchmarks/recorded
+
+然后在 rule34_config.json 中设置:
+    "listing_mode": "api", "api_base_url": "http://127.0.0.1:8034"
+或 HTML 列表模式:
+    "listing_mode": "html", "base_url": "http://localhost:8034"
+（页面使用 localhost、媒体使用 127.0.0.1，两者走不同的连接池，与真实站点的页面/媒体主机分离一致）
+
+录制响应中的 file_url 会被改写为指向本服务器，媒体内容按帖子ID确定性生成，
+hash 字段同时改写为生成内容的MD5，保证下载结果可以校验。
+"""
+
+import os
+import re
+import sys
+import json
+import glob
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from corpus import make_listing_page, make_post_page
+
+DEFAULT_FILE_SIZE = 256 * 1024
+POSTS_PER_PAGE = 42
+MEDIA_CHUNK = 64 * 1024
+
+
+def generate_content(post_id, size):
+    """按帖子ID生成确定性的媒体内容"""
+    seed = hashlib.sha256(str(post_id).encode()).digest()
+    repeat = size // len(seed) + 1
+    return (seed * repeat)[:size]
+
+
+class StubSite:
+    """替身站点数据：帖子元数据 + 媒体内容 + 模拟的网络条件
+
+    latency        每个请求在响应前等待的秒数
+    bandwidth      每个连接的媒体传输速率（字节/秒），0为不限
+    throttle_rate  随机返回429的请求比例（带 Retry-After: retry_after）
+    failing_pages  总是返回429的列表页，{(路由, pid)}，路由为 listing 或 api
+    """
+
+    def __init__(self, posts, base_url="", latency=0.0, bandwidth=0, throttle_rate=0.0, retry_after=1, seed=0):
+        self.base_url = base_url
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.failing_pages = set()
+        self.posts = []
+        self.posts_by_id = {}
+        self.media = {}  # md5 -> bytes
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+        for post in posts:
+            self.add_post(post)
+
+    def reset_stats(self):
+        """清空服务端统计（请求数、429次数、媒体字节数、首个媒体字节的时间）"""
+        with self.stats_lock:
+            self.stats = {"requests": {}, "throttled": 0, "media_bytes": 0, "first_media_byte": None}
+
+    def count_request(self, route):
+        with self.stats_lock:
+            self.stats["requests"][route] = self.stats["requests"].get(route, 0) + 1
+
+    def should_throttle(self, route=None, pid=None):
+        if (route, pid) in self.failing_pages:
+            with self.stats_lock:
+                self.stats["throttled"] += 1
+            return True
+        if not self.throttle_rate:
+            return False
+        with self.stats_lock:
+            throttled = self.random.random() < self.throttle_rate
+            if throttled:
+                self.stats["throttled"] += 1
+            return throttled
+
+    def count_media_bytes(self, size):
+        with self.stats_lock:
+            if self.stats["first_media_byte"] is None:
+                self.stats["first_media_byte"] = time.monotonic()
+            self.stats["media_bytes"] += size
+
+    def add_post(self, post):
+        post = dict(post)
+        size = int(post.get('size') or DEFAULT_FILE_SIZE)
+        content = generate_content(post['id'], size)
+        md5 = hashlib.md5(content).hexdigest()
+        ext = os.path.splitext(urlparse(post.get('file_url', '')).path)[1] or '.mp4'
+        post['hash'] = md5
+        post['image'] = f"{md5}{ext}"
+        post['size'] = size
+        post['_path'] = f"/images/{post.get('directory', 0)}/{md5}{ext}"
+        self.media[md5] = content
+        self.posts.append(post)
+        self.posts_by_id[str(post['id'])] = post
+
+    def media_url(self, post):
+        return f"{self.base_url}{post['_path']}?{post['id']}"
+
+    def matching_posts(self, tags):
+        """按查询标签中的 id:>N 过滤帖子（其它标签忽略）"""
+        match = re.search(r'id:>(\d+)', tags)
+        if not match:
+            return self.posts
+        return [post for post in self.posts if int(post['id']) > int(match.group(1))]
+
+    def listing_page(self, offset, tags=""):
+        """搜索结果页（pid 为帖子偏移量，每页 POSTS_PER_PAGE 个缩略图），支持 id:>N 过滤，超出范围时返回没有帖子的页面"""
+        page = self.matching_posts(tags)[offset:offset + POSTS_PER_PAGE]
+        return make_listing_page([(str(post['id']), str(post.get('directory', 0)), post['hash']) for post in page])
+
+    def post_page(self, post_id):
+        """帖子页，帖子不存在时返回None"""
+        post = self.posts_by_id.get(str(post_id))
+        if post is None:
+            return None
+        return make_post_page(post['id'], self.media_url(post))
+
+    def api_page(self, pid, limit, tags=""):
+        """返回dapi一页的帖子（file_url指向本服务器），支持 id:>N 过滤"""
+        page = self.matching_posts(tags)[pid * limit:(pid + 1) * limit]
+        result = []
+        for post in page:
+            item = {k: v for k, v in post.items() if not k.startswith('_')}
+            item['file_url'] = self.media_url(post)
+            result.append(item)
+        return result
+
+    @classmethod
+    def from_recorded(cls, recorded_dir, **options):
+        """从录制目录加载 dapi_pid_*.json，按页码顺序拼接"""
+        def page_number(path):
+            match = re.search(r'dapi_pid_(\d+)\.json$', path)
+            return int(match.group(1)) if match else 0
+
+        posts = []
+        for path in sorted(glob.glob(os.path.join(recorded_dir, 'dapi_pid_*.json')), key=page_number):
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+            if content:
+                posts.extend(json.loads(content))
+        return cls(posts, **options)
+
+    @classmethod
+    def synthetic(cls, count, file_size=DEFAULT_FILE_SIZE, first_id=10000000, **options):
+        """生成 count 个合成帖子（ID递减，与站点默认排序一致）
+
+        file_size 可以是一个整数，或一组大小（按帖子顺序循环使用）
+        """
+        sizes = file_size if isinstance(file_size, (list, tuple)) else [file_size]
+        posts = [
+            {"id": first_id + count - i, "directory": (first_id + count - i) // 5000,
+             "size": sizes[i % len(sizes)], "tags": "stub video", "file_url": "x.mp4"}
+            for i in range(count)
+        ]
+        return cls(posts, **options)
+
+
+def make_handler(site):
+    """创建绑定到站点数据的请求处理器"""
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status, body, content_type, extra_headers=None, head_only=False):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (extra_headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            if head_only:
+                return
+            if not content_type.startswith('video/'):
+                self.wfile.write(body)
+                return
+            # 媒体内容按 site.bandwidth 分块限速发送
+            for offset in range(0, len(body), MEDIA_CHUNK):
+                chunk = body[offset:offset + MEDIA_CHUNK]
+                self.wfile.write(chunk)
+                site.count_media_bytes(len(chunk))
+                if site.bandwidth:
+                    time.sleep(len(chunk) / site.bandwidth)
+
+        def send_media(self, md5, content, head_only=False):
+            """返回媒体内容，支持 Range / If-Range"""
+            etag = f'"{md5}"'
+            headers = {'Accept-Ranges': 'bytes', 'ETag': etag}
+            range_header = self.headers.get('Range')
+            if_range = self.headers.get('If-Range')
+            match = re.match(r'bytes=(\d+)-(\d*)$', range_header or '')
+            if match and (not if_range or if_range == etag):
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else len(content) - 1
+                if start >= len(content):
+                    headers['Content-Range'] = f"bytes */{len(content)}"
+                    self.send_body(416, b'', 'text/plain', headers, head_only)
+                    return
+                end = min(end, len(content) - 1)
+                headers['Content-Range'] = f"bytes {start}-{end}/{len(content)}"
+                self.send_body(206, content[start:end + 1], 'video/mp4', headers, head_only)
+                return
+            self.send_body(200, content, 'video/mp4', headers, head_only)
+
+        def do_HEAD(self):
+            parsed = urlparse(self.path)
+            if parsed.path.startswith('/images/'):
+                md5 = os.path.splitext(os.path.basename(parsed.path))[0]
+                content = site.media.get(md5)
+                if content is not None:
+                    self.send_media(md5, content, head_only=True)
+                    return
+            self.send_body(404, b'', 'text/plain', head_only=True)
+
+        def route(self, parsed, query):
+            if parsed.path.startswith('/images/'):
+                return 'media'
+            if parsed.path.endswith('index.php') and query.get('page') == 'dapi':
+                return 'api'
+            if parsed.path.endswith('index.php') and query.get('page') == 'post':
+                return {'list': 'listing', 'view': 'post'}.get(query.get('s'), 'other')
+            return 'other'
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            route = self.route(parsed, query)
+            site.count_request(route)
+
+            if site.latency:
+                time.sleep(site.latency)
+            pid = int(query.get('pid', 0)) if route in ('listing', 'api') else None
+            if site.should_throttle(route, pid):
+                self.send_body(429, b'too many requests', 'text/plain', {'Retry-After': str(site.retry_after)})
+                return
+
+            if route == 'api':
+                posts = site.api_page(int(query.get('pid', 0)), int(query.get('limit', 100)), query.get('tags', ''))
+                body = json.dumps(posts).encode() if posts else b''
+                self.send_body(200, body, 'application/json')
+                return
+
+            if route == 'listing':
+                body = site.listing_page(int(query.get('pid', 0)), query.get('tags', '')).encode()
+                self.send_body(200, body, 'text/html; charset=utf-8')
+                return
+
+            if route == 'post':
+                page = site.post_page(query.get('id', ''))
+                if page is None:
+                    self.send_body(404, b'not found', 'text/plain')
+                    return
+                self.send_body(200, page.encode(), 'text/html; charset=utf-8')
+                return
+
+            if route == 'media':
+                md5 = os.path.splitext(os.path.basename(parsed.path))[0]
+                content = site.media.get(md5)
+                if content is None:
+                    self.send_body(404, b'not found', 'text/plain')
+                    return
+                self.send_media(md5, content)
+                return
+
+            self.send_body(404, b'not found', 'text/plain')
+
+    return StubHandler
+
+
+def start_server(site, host="127.0.0.1", port=0):
+    """在后台线程启动替身服务器，返回 (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), make_handler(site))
+    server.daemon_threads = True
+    base_url = f"http://{host}:{server.server_address[1]}"
+    site.base_url = base_url
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, base_url
+
+
+def record_api(tags, pages, out_dir, api_base_url="https://api.rule34.xxx"):
+    """录制真实的dapi响应到 out_dir/dapi_pid_N.json"""
+    import requests
+
+    os.makedirs(out_dir, exist_ok=True)
+    query_tags = '+'.join(tags.split())
+    for pid in range(pages):
+        url = f"{api_base_url}/index.php?page=dapi&s=post&q=index&json=1&limit=1000&pid={pid}&tags={query_tags}"
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        path = os.path.join(out_dir, f"dapi_pid_{pid}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(response.text)
+        print(f"💾 已录制: {path}")
+        if not response.text.strip():
+            break
+
+
+def parse_sizes(text):
+    """"512,4096" -> [524288, 4194304]（KB转字节）"""
+    return [int(float(part) * 1024) for part in str(text).split(',') if part.strip()]
+
+
+def add_site_arguments(parser):
+    """替身站点的网络条件参数（替身服务器和端到端基准共用）"""
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N', help="生成 N 个合成帖子（不使用录制数据）")
+    parser.add_argument('--file-size-kb', default=str(DEFAULT_FILE_SIZE // 1024),
+                        help="合成帖子的文件大小(KB)，逗号分隔多个大小时循环使用")
+    parser.add_argument('--latency', type=float, default=0.0, help="每个请求的延迟(秒)")
+    parser.add_argument('--bandwidth-kbps', type=float, default=0, help="每个连接的媒体传输速率(KB/s)，0为不限")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="随机返回429的请求比例(0-1)")
+    parser.add_argument('--retry-after', type=int, default=1, help="429响应的 Retry-After 秒数")
+    parser.add_argument('--seed', type=int, default=0, help="429注入的随机种子")
+
+
+def site_options(args):
+    return {
+        "latency": args.latency,
+        "bandwidth": int(args.bandwidth_kbps * 1024),
+        "throttle_rate": args.throttle_rate,
+        "retry_after": args.retry_after,
+        "seed": args.seed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="rule34 本地替身服务器")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8034)
+    parser.add_argument('--recorded', default=os.path.join(os.path.dirname(__file__), 'recorded'),
+                        help="录制的dapi响应目录")
+    parser.add_argument('--record', metavar='TAGS', help="录制指定标签的真实dapi响应后退出")
+    parser.add_argument('--pages', type=int, default=1, help="录制的页数")
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    if args.record:
+        record_api(args.record, args.pages, args.recorded)
+        return
+
+    options = site_options(args)
+    if args.synthetic:
+        site = StubSite.synthetic(args.synthetic, parse_sizes(args.file_size_kb), **options)
+    else:
+        site = StubSite.from_recorded(args.recorded, **options)
+    server, base_url = start_server(site, args.host, args.port)
+    print(f"🧪 替身服务器已启动: {base_url} ({len(site.posts)} 个帖子)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
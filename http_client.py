@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统一的HTTP请求层：按主机共享的自适应令牌桶限速 + 重试/退避/抖动，
+以及按主机划分、按并发数设定大小的连接池
+"""
+
+import time
+import random
+import socket
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.connection import HTTPConnection
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class DownloadVerificationError(IOError):
+    """下载内容长度或MD5与预期不符，需要重新下载"""
+
+
+def parse_retry_after(value):
+    """解析Retry-After头（秒数或HTTP日期），返回秒数，无法解析时返回None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_time = parsedate_to_datetime(value)
+        return max(0.0, retry_time.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """单个主机的令牌桶状态"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.decreased_at = 0.0  # 上次因429降速的时间
+
+
+class HostRateLimiter:
+    """按主机划分的自适应令牌桶限速器，所有工作线程共享
+
+    遇到429时速率减半并暂停该主机（优先使用Retry-After），
+    请求成功时速率线性回升，直到 max_rate。
+    降速前已发出的请求返回的429不会再次降速，一轮限流只减半一次。
+    """
+
+    def __init__(self, rate=2.0, burst=2, min_rate=0.2, max_rate=8.0,
+                 increase_step=0.1, decrease_factor=0.5, host_rates=None):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.host_rates = host_rates or {}  # 主机 -> 初始速率
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.total_wait = 0.0  # 累计限速等待时间（秒）
+        self.throttle_count = 0
+
+    def _bucket(self, host):
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(self.host_rates.get(host, self.rate), self.burst)
+            self.buckets[host] = bucket
+        return bucket
+
+    def reserve(self, host):
+        """预订一个令牌，返回调用方需要等待的秒数（0表示立即发送）"""
+        with self.lock:
+            bucket = self._bucket(host)
+            now = time.monotonic()
+            bucket.tokens = min(bucket.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+            bucket.tokens -= 1
+            delay = 0.0 if bucket.tokens >= 0 else -bucket.tokens / bucket.rate
+            delay = max(delay, bucket.blocked_until - now)
+            self.total_wait += delay
+            return delay
+
+    def acquire(self, host):
+        """阻塞直到可以向该主机发送请求，返回实际等待秒数"""
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def on_success(self, host):
+        """请求成功，线性提高速率"""
+        with self.lock:
+            bucket = self._bucket(host)
+            bucket.rate = min(self.max_rate, bucket.rate + self.increase_step)
+
+    def on_throttle(self, host, wait_time, sent_at=None):
+        """遇到429，降低速率并在 wait_time 秒内暂停该主机
+
+        sent_at 为该请求发出时的 time.monotonic()；在上次降速之前发出的请求只暂停主机，不再降速
+        """
+        with self.lock:
+            bucket = self._bucket(host)
+            now = time.monotonic()
+            if sent_at is None or sent_at >= bucket.decreased_at:
+                bucket.rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+                bucket.decreased_at = now
+            bucket.tokens = min(bucket.tokens, 0)
+            bucket.blocked_until = max(bucket.blocked_until, now + wait_time)
+            self.throttle_count += 1
+
+    def get_rate(self, host):
+        """当前主机速率（请求/秒）"""
+        with self.lock:
+            return self._bucket(host).rate
+
+
+class RetryPolicy:
+    """重试策略：指数退避 + 抖动，优先使用服务器给出的Retry-After"""
+
+    def __init__(self, max_retries=5, max_429_retries=20, backoff_base=1.0, backoff_max=60.0, jitter=0.5):
+        self.max_retries = max_retries
+        self.max_429_retries = max_429_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+
+    def backoff(self, attempt, retry_after=None):
+        """第 attempt 次重试前的等待秒数"""
+        if retry_after is not None:
+            delay = min(self.backoff_max, retry_after)
+        else:
+            delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay + random.uniform(0, delay * self.jitter)
+
+    def retry_limit(self, status_code):
+        """该状态码允许的最大重试次数"""
+        return self.max_429_retries if status_code == 429 else self.max_retries
+
+
+def keepalive_socket_options(idle=60, interval=15, count=4):
+    """TCP keep-alive 套接字选项：空闲连接定期探测，避免被中间设备静默断开"""
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', interval), ('TCP_KEEPCNT', count)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """可设定大小和 keep-alive 的连接池适配器，统计连接复用情况
+
+    重试由 HttpClient 负责，这里不做urllib3层面的重试。
+    """
+
+    def __init__(self, pool_maxsize=10, keepalive=True):
+        self.keepalive = keepalive
+        super().__init__(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.keepalive:
+            pool_kwargs['socket_options'] = HTTPConnection.default_socket_options + keepalive_socket_options()
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+
+    def stats(self):
+        """连接池统计: 请求数、新建连接数（未命中）、复用连接数（命中）"""
+        requests_count = connections = 0
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests_count += pool.num_requests
+                connections += pool.num_connections
+        return {"requests": requests_count, "misses": connections, "hits": max(0, requests_count - connections)}
+
+
+class Http2Adapter(BaseAdapter):
+    """通过 httpx 的HTTP/2连接发送请求，同一主机的并发请求在一个连接上多路复用
+
+    返回完整读取的 requests.Response，只用于页面/API这类小响应。需要安装 httpx[http2]。
+    """
+
+    def __init__(self, max_connections=10, keepalive=True):
+        super().__init__()
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_connections if keepalive else 0)
+        self.client = httpx.Client(http2=True, limits=limits)
+        self.lock = threading.Lock()  # 多个工作线程共用一个适配器，保护下面的计数
+        self.requests = 0
+        self.connections = set()  # 见过的底层连接，用于区分复用和新建
+        self.hits = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        else:
+            timeout = httpx.Timeout(timeout)
+        try:
+            response = self.client.request(request.method, request.url, headers=dict(request.headers),
+                                           content=request.body, timeout=timeout)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e, request=request)
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+
+        connection = id(response.extensions.get("network_stream"))
+        with self.lock:
+            self.requests += 1
+            if connection in self.connections:
+                self.hits += 1
+            else:
+                self.connections.add(connection)
+        result = requests.Response()
+        result.status_code = response.status_code
+        result.reason = response.reason_phrase
+        result.headers = CaseInsensitiveDict(response.headers.items())
+        result.encoding = get_encoding_from_headers(result.headers)
+        result.url = request.url
+        result.request = request
+        result.connection = self
+        result._content = response.content  # httpx已解压
+        result._content_consumed = True
+        return result
+
+    def close(self):
+        self.client.close()
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "misses": self.requests - self.hits, "hits": self.hits}
+
+
+class ConnectionPools:
+    """会话的按主机连接池：页面/API主机和媒体主机各用独立的连接池
+
+    页面主机挂载在各自的URL前缀上，其余主机（媒体CDN）使用默认的 http(s):// 适配器。
+    启用 http2 且安装了 httpx[http2] 时，页面主机改用HTTP/2多路复用。
+    """
+
+    def __init__(self, session, page_urls, page_pool_size=10, media_pool_size=10, keepalive=True, http2=False):
+        self.session = session
+        self.page_prefixes = [url.rstrip('/') + '/' for url in page_urls]
+        self.keepalive = keepalive
+        self.http2 = http2 and self.http2_available()
+        if http2 and not self.http2:
+            print("⚠️ 未安装 httpx[http2]，页面主机使用HTTP/1.1连接池")
+        self.page_adapter = None
+        self.media_adapter = None
+        self.retired = {"page": {}, "media": {}}  # 调整大小前的统计
+        self.resize(page_pool_size, media_pool_size)
+
+    @staticmethod
+    def http2_available():
+        if httpx is None:
+            return False
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def resize(self, page_pool_size, media_pool_size):
+        """按新的大小重建两个连接池（在没有进行中的请求时调用）"""
+        if (self.page_adapter is not None and self.page_size == page_pool_size
+                and self.media_size == media_pool_size):
+            return
+        self.retire()
+        self.page_size = page_pool_size
+        self.media_size = media_pool_size
+        if self.http2:
+            self.page_adapter = Http2Adapter(page_pool_size, self.keepalive)
+        else:
+            self.page_adapter = PooledHTTPAdapter(page_pool_size, self.keepalive)
+        self.media_adapter = PooledHTTPAdapter(media_pool_size, self.keepalive)
+        for prefix in ('https://', 'http://'):
+            self.session.mount(prefix, self.media_adapter)
+        for prefix in self.page_prefixes:
+            self.session.mount(prefix, self.page_adapter)
+
+    def retire(self):
+        """保存旧连接池的统计并关闭"""
+        for name, adapter in (("page", self.page_adapter), ("media", self.media_adapter)):
+            if adapter is None:
+                continue
+            for key, value in adapter.stats().items():
+                self.retired[name][key] = self.retired[name].get(key, 0) + value
+            adapter.close()
+
+    def stats(self):
+        """各连接池的统计: {page: {size, requests, hits, misses}, media: {...}}"""
+        result = {}
+        for name, adapter, size in (("page", self.page_adapter, self.page_size),
+                                    ("media", self.media_adapter, self.media_size)):
+            stats = adapter.stats()
+            for key, value in self.retired[name].items():
+                stats[key] += value
+            stats["size"] = size
+            result[name] = stats
+        result["page"]["http2"] = self.http2
+        return result
+
+
+class HttpClient:
+    """所有请求点共用的HTTP客户端：限速、重试、退避都在这里完成"""
+
+    def __init__(self, session, limiter=None, retry_policy=None, lock=None, metrics=None, tracer=None):
+        self.session = session
+        self.limiter = limiter or HostRateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.lock = lock or threading.Lock()  # 仅用于输出
+        self.counter_lock = threading.Lock()
+        self.retry_count = 0
+        self.tracer = tracer  # 可选的 tracing.Tracer，记录限速和退避等待
+        self.requests_total = self.request_seconds = self.throttled_total = self.retries_total = None
+        self.limiter_wait_total = None
+        if metrics is not None:
+            self.requests_total = metrics.counter("rule34_http_requests_total", "HTTP请求数（按主机和状态码）",
+                                                  ("host", "status"))
+            self.request_seconds = metrics.histogram("rule34_http_request_seconds", "HTTP请求耗时（到收到响应头）",
+                                                     ("host",))
+            self.throttled_total = metrics.counter("rule34_http_throttled_total", "429响应数", ("host",))
+            self.retries_total = metrics.counter("rule34_http_retries_total", "重试次数", ("host", "reason"))
+            metrics.gauge("rule34_rate_limit_wait_seconds_total", "限速器累计等待时间",
+                          func=lambda: self.limiter.total_wait)
+            metrics.gauge("rule34_host_rate", "各主机当前限速（请求/秒）", ("host",),
+                          func=lambda: {(host,): bucket.rate for host, bucket in list(self.limiter.buckets.items())})
+
+    def record_sleep(self, kind, seconds):
+        """记录一次等待（限速/退避）"""
+        if self.tracer is not None:
+            self.tracer.sleep(kind, seconds)
+
+    def record_request(self, url, status, elapsed):
+        """记录一次请求的指标；status 为状态码，连接失败/超时为 'error'"""
+        if self.requests_total is None:
+            return
+        host = urlparse(url).netloc
+        self.requests_total.inc(host=host, status=status)
+        self.request_seconds.observe(elapsed, host=host)
+
+    def should_retry_status(self, url, status_code, retry_after_header, attempt, sent_at=None):
+        """处理可重试状态码；返回需要等待的秒数，超过重试次数时返回None
+
+        429 的等待通过限速器对整个主机生效，其它状态码由调用方自行等待。
+        sent_at 为请求发出时的 time.monotonic()，用于避免同一轮限流中重复降速。
+        """
+        if status_code not in RETRY_STATUS_CODES:
+            return None
+        if attempt >= self.retry_policy.retry_limit(status_code):
+            return None
+        wait_time = self.retry_policy.backoff(attempt, parse_retry_after(retry_after_header))
+        with self.counter_lock:
+            self.retry_count += 1
+        if self.retries_total is not None:
+            self.retries_total.inc(host=urlparse(url).netloc, reason=status_code)
+            if status_code == 429:
+                self.throttled_total.inc(host=urlparse(url).netloc)
+        if status_code == 429:
+            self.limiter.on_throttle(urlparse(url).netloc, wait_time, sent_at)
+            with self.lock:
+                print(f"⚠️ {url} 遇到429错误，{wait_time:.1f} 秒后重试 (尝试 {attempt + 1}/{self.retry_policy.retry_limit(429)})")
+            return 0.0
+        with self.lock:
+            print(f"⚠️ {url} 返回 {status_code}，{wait_time:.1f} 秒后重试 (尝试 {attempt + 1}/{self.retry_policy.max_retries})")
+        return wait_time
+
+    def should_retry_error(self, url, error, attempt):
+        """处理连接错误/超时；返回需要等待的秒数，超过重试次数时返回None"""
+        if attempt >= self.retry_policy.max_retries:
+            return None
+        wait_time = self.retry_policy.backoff(attempt)
+        with self.counter_lock:
+            self.retry_count += 1
+        if self.retries_total is not None:
+            self.retries_total.inc(host=urlparse(url).netloc, reason="error")
+        with self.lock:
+            print(f"⚠️ {url} 请求失败: {error}，{wait_time:.1f} 秒后重试 (尝试 {attempt + 1}/{self.retry_policy.max_retries})")
+        return wait_time
+
+    def get(self, url, **kwargs):
+        """限速 + 重试的GET请求"""
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        """限速 + 重试的HEAD请求"""
+        return self.request('HEAD', url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """限速 + 重试的请求，成功返回响应；重试耗尽时抛出 requests.HTTPError 或连接异常"""
+        host = urlparse(url).netloc
+        attempt = 0
+        while True:
+            self.record_sleep("rate_limit", self.limiter.acquire(host))
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.record_request(url, "error", time.monotonic() - start)
+                wait_time = self.should_retry_error(url, e, attempt)
+                if wait_time is None:
+                    raise
+                time.sleep(wait_time)
+                self.record_sleep("backoff", wait_time)
+                attempt += 1
+                continue
+            self.record_request(url, response.status_code, time.monotonic() - start)
+
+            if response.status_code in RETRY_STATUS_CODES:
+                wait_time = self.should_retry_status(
+                    url, response.status_code, response.headers.get('Retry-After'), attempt, start
+                )
+                if wait_time is not None:
+                    response.close()
+                    if wait_time > 0:
+                        time.sleep(wait_time)
+                        self.record_sleep("backoff", wait_time)
+                    attempt += 1
+                    continue
+                response.raise_for_status()
+
+            # 只有2xx/3xx算成功；403/404等不可重试的错误不能让主机速率回升
+            if response.status_code < 400:
+                self.limiter.on_success(host)
+            response.raise_for_status()
+            return response
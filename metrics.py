@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+指标注册表：计数器 / 仪表 / 直方图，按 Prometheus 文本格式输出，可选本地HTTP端点
+
+    registry = MetricsRegistry()
+    requests_total = registry.counter("rule34_http_requests_total", "HTTP请求数", ("host", "status"))
+    requests_total.inc(host="rule34.xxx", status="200")
+    registry.serve("127.0.0.1", 9134)   # curl http://127.0.0.1:9134/metrics
+
+计数器和仪表可以传入 func，在抓取时读取当前值（累计字节数、队列深度、活动下载数等），
+热路径上不需要任何更新。
+"""
+
+import math
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """指标基类：按标签值分组保存数据
+
+    给出 func 时在输出时调用 func() 读取当前值：无标签返回数值，有标签返回 {标签值元组: 值}
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=(), func=None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.func = func
+        self.lock = threading.Lock()
+        self.values = {}  # 标签值元组 -> 数据
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def collect(self):
+        """调用 func 刷新当前值"""
+        try:
+            value = self.func()
+        except Exception:
+            return
+        values = value if isinstance(value, dict) else {(): value}
+        with self.lock:
+            self.values = {key if isinstance(key, tuple) else (key,): v for key, v in values.items()}
+
+    def samples(self):
+        if self.func is not None:
+            self.collect()
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{format_labels(self.labels, key)} {format_value(value)}" for key, value in items]
+
+    def render(self):
+        return self.header() + self.samples()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            data = self.values.get(key)
+            if data is None:
+                data = self.values[key] = [[0] * len(self.buckets), 0.0, 0]  # [各桶计数, 总和, 次数]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[0][index] += 1
+                    break
+            data[1] += value
+            data[2] += 1
+
+    def samples(self):
+        with self.lock:
+            items = sorted((key, ([*data[0]], data[1], data[2])) for key, data in self.values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labels, key, ("le", format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表，同名指标只创建一次"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def register(self, cls, name, *args, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labels=(), func=None):
+        return self.register(Counter, name, help_text, labels, func)
+
+    def gauge(self, name, help_text, labels=(), func=None):
+        return self.register(Gauge, name, help_text, labels, func)
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram, name, help_text, labels, buckets)
+
+    def render(self):
+        """Prometheus 文本格式"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host="127.0.0.1", port=9134):
+        """在后台线程启动 /metrics 端点，返回实际监听的端口"""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+        return self.server.server_address[1]
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列表页/帖子页的磁盘HTTP缓存：有 ETag/Last-Modified 时发送条件请求（未变化返回304），
+否则在TTL内直接使用缓存；按总大小和存放时间淘汰
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+DEFAULT_CACHE_DIR = ".page_cache"
+
+
+class PageCache:
+    """按URL缓存页面文本，每个条目一个JSON文件"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_mb=200, max_age_days=30):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self.lock = threading.Lock()
+        self.entries = {}  # key -> [大小, 最近使用时间]
+        self.total_bytes = 0
+        self.hits = 0  # TTL内直接命中
+        self.revalidated = 0  # 304
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.load_index()
+        self.evict()
+
+    def key(self, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def load_index(self):
+        """扫描缓存目录，建立大小/使用时间索引"""
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json') and entry.is_file():
+                    st = entry.stat()
+                    self.entries[entry.name[:-5]] = [st.st_size, st.st_mtime]
+                    self.total_bytes += st.st_size
+
+    def remove(self, key):
+        """删除一个条目（调用方持有锁）"""
+        info = self.entries.pop(key, None)
+        if info:
+            self.total_bytes -= info[0]
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """淘汰过期条目，再按最近使用时间淘汰直到总大小不超过上限"""
+        now = time.time()
+        with self.lock:
+            for key, (_, used) in list(self.entries.items()):
+                if now - used > self.max_age:
+                    self.remove(key)
+            if self.total_bytes > self.max_bytes:
+                for key, _ in sorted(self.entries.items(), key=lambda item: item[1][1]):
+                    if self.total_bytes <= self.max_bytes:
+                        break
+                    self.remove(key)
+
+    def lookup(self, url):
+        """读取缓存条目，不存在或已过期时返回None"""
+        key = self.key(url)
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url or time.time() - entry.get('stored', 0) > self.max_age:
+            return None
+        return entry
+
+    def is_fresh(self, entry, ttl):
+        """没有验证器的条目在TTL内可以直接使用"""
+        return time.time() - entry.get('stored', 0) < ttl
+
+    def conditional_headers(self, entry):
+        """条件请求头"""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, response_headers, text, stored=None):
+        """写入缓存（先写临时文件再原子替换）"""
+        key = self.key(url)
+        entry = {
+            'url': url,
+            'etag': response_headers.get('etag'),
+            'last_modified': response_headers.get('last-modified'),
+            'stored': stored or time.time(),
+            'text': text
+        }
+        path = self.path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self.lock:
+            old = self.entries.get(key)
+            if old:
+                self.total_bytes -= old[0]
+            self.entries[key] = [size, time.time()]
+            self.total_bytes += size
+            over_limit = self.total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def refresh(self, url, entry, response_headers):
+        """收到304：更新存放时间和验证器"""
+        headers = {
+            'etag': response_headers.get('etag') or entry.get('etag'),
+            'last-modified': response_headers.get('last-modified') or entry.get('last_modified')
+        }
+        self.store(url, headers, entry['text'])
+
+    def begin(self, url, ttl):
+        """请求前检查缓存，返回 (缓存条目, 可直接使用的文本, 条件请求头)
+
+        TTL内的条目直接返回文本；有验证器的条目返回条件请求头。
+        """
+        entry = self.lookup(url)
+        if entry is None:
+            return None, None, {}
+        if self.is_fresh(entry, ttl):
+            with self.lock:
+                self.hits += 1
+                info = self.entries.get(self.key(url))
+                if info:
+                    info[1] = time.time()  # 最近使用时间，用于按大小淘汰
+            return entry, entry['text'], {}
+        return entry, None, self.conditional_headers(entry)
+
+    def finish(self, url, entry, status, response_headers, text):
+        """请求完成后更新缓存，304时返回缓存内容"""
+        if status == 304 and entry is not None:
+            with self.lock:
+                self.revalidated += 1
+            self.refresh(url, entry, response_headers)
+            return entry['text']
+        with self.lock:
+            self.misses += 1
+        if status == 200:
+            self.store(url, response_headers, text)
+        return text
+
+    def get_text(self, url, ttl, fetch):
+        """通过缓存获取页面文本，fetch(headers) 发出GET请求并返回 (状态码, 响应头, 文本)"""
+        entry, text, headers = self.begin(url, ttl)
+        if text is not None:
+            return text
+        status, response_headers, text = fetch(headers)
+        return self.finish(url, entry, status, response_headers, text)
+
+    def stats(self):
+        """缓存统计"""
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "size_mb": round(self.total_bytes / (1024 * 1024), 2),
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses
+            }
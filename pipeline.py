@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+两级下载流水线：解析线程把帖子ID解析为媒体URL，经有界队列交给下载线程
+
+解析（抓取帖子页）和下载（传输媒体文件）各有独立的线程数和统计，
+慢速的大文件下载不会占住解析线程，帖子页请求也不会占住下载线程；
+队列满时解析线程阻塞等待，内存中最多积压 queue_size 个已解析的帖子；
+下载线程按调度策略（见 scheduler.py）从队列中取出下一个帖子。
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+from scheduler import DownloadScheduler
+
+
+class StageStats:
+    """单个阶段的统计：处理数、出错数、工作耗时、阻塞耗时"""
+
+    def __init__(self, name, workers=0):
+        self.name = name
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0  # 工作耗时（秒）
+        self.blocked = 0.0  # 解析阶段: 等待队列空位；下载阶段: 等待任务
+        self.peak_queue = 0
+        self.histogram = None  # 可选的耗时直方图（metrics.Histogram）
+
+    def record(self, busy, error=False):
+        with self.lock:
+            self.items += 1
+            self.busy += busy
+            if error:
+                self.errors += 1
+        if self.histogram is not None:
+            self.histogram.observe(busy, result="error" if error else "ok")
+
+    def add_blocked(self, seconds, queue_size=0):
+        with self.lock:
+            self.blocked += seconds
+            self.peak_queue = max(self.peak_queue, queue_size)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "name": self.name,
+                "workers": self.workers,
+                "items": self.items,
+                "errors": self.errors,
+                "busy": round(self.busy, 2),
+                "blocked": round(self.blocked, 2),
+                "avg": round(self.busy / self.items, 3) if self.items else 0.0,
+                "peak_queue": self.peak_queue
+            }
+
+
+class PostPipeline:
+    """线程池模式的两级流水线，解析/下载逻辑全部复用 Rule34FixedDownloader
+
+    submit() 为每个帖子返回一个 Future，结果为下载的文件列表；未开始解析的帖子可以取消。
+    """
+
+    def __init__(self, downloader, resolve_workers=2, download_workers=3, queue_size=None):
+        self.downloader = downloader
+        self.resolve_queue = queue.Queue()
+        self.download_queue = DownloadScheduler(downloader.schedule_policy, queue_size or download_workers * 2,
+                                                downloader.size_classes_mb)
+        self.resolve_stats = downloader.resolve_stats
+        self.download_stats = downloader.download_stats
+        self.resolve_stats.workers = resolve_workers
+        self.download_stats.workers = download_workers
+        self.resolve_threads = [
+            threading.Thread(target=self.resolve_worker, name=f"resolve_{i}", daemon=True)
+            for i in range(resolve_workers)
+        ]
+        self.download_threads = [
+            threading.Thread(target=self.download_worker, name=f"download_{i}", daemon=True)
+            for i in range(download_workers)
+        ]
+        for thread in self.resolve_threads + self.download_threads:
+            thread.start()
+
+    def submit(self, post_id, download_dir="downloads", video_urls=None):
+        """提交一个帖子；video_urls 已知时（API模式）跳过帖子页抓取"""
+        future = Future()
+        self.resolve_queue.put((future, post_id, download_dir, video_urls))
+        return future
+
+    def resolve_worker(self):
+        d = self.downloader
+        while True:
+            job = self.resolve_queue.get()
+            if job is None:
+                return
+            future, post_id, download_dir, video_urls = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            if d.should_stop:
+                future.set_result([])
+                continue
+
+            with d.lock:
+                print(f"🔄 开始处理帖子 {post_id}...")
+            if video_urls is None:
+                start = time.monotonic()
+                try:
+                    video_urls = d.extract_video_url_from_post(post_id)
+                except Exception as e:
+                    self.resolve_stats.record(time.monotonic() - start, error=True)
+                    future.set_exception(e)
+                    continue
+                self.resolve_stats.record(time.monotonic() - start, error=not video_urls)
+
+            if not video_urls:
+                d.record_post_result(post_id, [], False)
+                future.set_result([])
+                continue
+
+            size = d.get_expected_size(post_id, video_urls)
+            start = time.monotonic()
+            self.download_queue.put((future, post_id, download_dir, video_urls), size, post_id)
+            self.resolve_stats.add_blocked(time.monotonic() - start, self.download_queue.qsize())
+
+    def download_worker(self):
+        d = self.downloader
+        while True:
+            start = time.monotonic()
+            job = self.download_queue.get()
+            self.download_stats.add_blocked(time.monotonic() - start)
+            if job is None:
+                return
+            future, post_id, download_dir, video_urls = job
+            if d.should_stop:
+                future.set_result([])
+                continue
+
+            start = time.monotonic()
+            downloaded_files = []
+            statuses = []
+            try:
+                for video_url in video_urls:
+                    status, filepath = d.download_video(video_url, post_id, download_dir)
+                    statuses.append(status)
+                    if filepath:
+                        downloaded_files.append(filepath)
+                # 文件已存在也算处理成功；中断或失败的帖子不记录
+                recorded = d.record_download_result(post_id, downloaded_files, statuses)
+            except Exception as e:
+                self.download_stats.record(time.monotonic() - start, error=True)
+                future.set_exception(e)
+                continue
+            self.download_stats.record(time.monotonic() - start, error=not recorded)
+            future.set_result(downloaded_files)
+
+    def shutdown(self):
+        """等待已提交的帖子处理完并结束所有线程"""
+        for _ in self.resolve_threads:
+            self.resolve_queue.put(None)
+        for thread in self.resolve_threads:
+            thread.join()
+        self.download_queue.close()
+        for thread in self.download_threads:
+            thread.join()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载进度汇总：工作线程只累加各自的计数器，由一个后台线程按固定频率统一输出
+
+每个传输占用一个 TransferSlot，只有所属的工作线程（或协程）会写它，
+渲染线程只读取，因此下载循环里不需要加锁，也不做除写文件以外的任何I/O。
+"""
+
+import time
+import threading
+
+
+def format_rate(bytes_per_second):
+    """格式化传输速率"""
+    for unit in ('B/s', 'KB/s', 'MB/s'):
+        if bytes_per_second < 1024:
+            return f"{bytes_per_second:.1f} {unit}"
+        bytes_per_second /= 1024
+    return f"{bytes_per_second:.1f} GB/s"
+
+
+class TransferSlot:
+    """单个传输的计数器，只由所属的工作线程写入"""
+
+    __slots__ = ('worker', 'filename', 'total', 'downloaded', 'started')
+
+    def __init__(self, worker, filename, total, downloaded=0):
+        self.worker = worker
+        self.filename = filename
+        self.total = total
+        self.downloaded = downloaded
+        self.started = downloaded  # 续传时的起始字节数，不计入本次速率
+
+    def add(self, size):
+        self.downloaded += size
+
+
+class ProgressReporter:
+    """后台渲染的进度汇总器，显示每个工作者和总体的下载速率"""
+
+    def __init__(self, interval=1.0, lock=None):
+        self.interval = interval
+        self.lock = lock or threading.Lock()  # 仅用于输出
+        self.slots = {}  # id(slot) -> TransferSlot
+        self.finished_bytes = 0  # 已结束传输的字节数（只在结束传输时更新）
+        self.finished_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def start_transfer(self, worker, filename, total, downloaded=0):
+        """登记一个传输，返回供下载循环累加的计数器"""
+        slot = TransferSlot(worker, filename, total, downloaded)
+        self.slots[id(slot)] = slot
+        return slot
+
+    def end_transfer(self, slot):
+        """传输结束（成功、失败或中断）"""
+        if id(slot) in self.slots:
+            with self.finished_lock:
+                self.finished_bytes += slot.downloaded - slot.started
+            self.slots.pop(id(slot), None)
+
+    def start(self):
+        """启动渲染线程"""
+        if not self.enabled or self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="progress", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止渲染线程"""
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    def transferred_bytes(self, slots):
+        """本次运行累计传输的字节数"""
+        return self.finished_bytes + sum(slot.downloaded - slot.started for slot in slots)
+
+    def run(self):
+        last_time = time.monotonic()
+        last_total = self.transferred_bytes([])
+        last_downloaded = {}  # id(slot) -> 上次渲染时的字节数
+        while not self.stop_event.wait(self.interval):
+            now = time.monotonic()
+            elapsed = max(now - last_time, 1e-6)
+            slots = list(self.slots.values())
+            total = self.transferred_bytes(slots)
+
+            parts = []
+            current = {}
+            for slot in slots:
+                downloaded = slot.downloaded
+                previous = last_downloaded.get(id(slot), slot.started)
+                current[id(slot)] = downloaded
+                rate = max(0, downloaded - previous) / elapsed
+                if slot.total > 0:
+                    parts.append(f"[{slot.worker}] {slot.filename[:20]} "
+                                 f"{downloaded / slot.total * 100:.1f}% {format_rate(rate)}")
+                else:
+                    parts.append(f"[{slot.worker}] {slot.filename[:20]} {downloaded} 字节 {format_rate(rate)}")
+
+            if slots:
+                aggregate = format_rate(max(0, total - last_total) / elapsed)
+                with self.lock:
+                    print(f"📊 下载中 {len(slots)} 个, 总速率 {aggregate} | " + " | ".join(parts))
+
+            last_time = now
+            last_total = total
+            last_downloaded = current
@@ -3,23 +3,93 @@ import re
 import os
 import time
 import json
+import html
+import hashlib
 from urllib.parse import urlparse
 from bs4 import BeautifulSoup
 import threading
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import signal
 import sys
+import argparse
+from state_store import StateStore, DEFAULT_STATE_DB
+from http_client import HttpClient, HostRateLimiter, RetryPolicy, ConnectionPools, DownloadVerificationError
+from progress import ProgressReporter
+from page_cache import PageCache, DEFAULT_CACHE_DIR
+from pipeline import PostPipeline, StageStats
+from scheduler import DownloadScheduler, BandwidthBudget, DEFAULT_SIZE_CLASSES_MB
+from metrics import MetricsRegistry
+from tracing import Tracer
+import async_engine
 
 # 默认配置
 DEFAULT_CONFIG = {
     "tags": "mightyniku video",
-    "max_workers": 2
+    "max_workers": 2,
+    "export_json": False,
+    "engine": "thread",  # thread: 线程池模式; async: asyncio模式(需要aiohttp)
+    "async_concurrency": 50,
+    "prefetch_pages": 1,  # 下载当前页时预先抓取的后续列表页数量，0为不预取
+    "pipeline": {  # 解析帖子页和下载媒体分为两级，下载线程数即 max_workers
+        "resolve_workers": 2,  # 解析帖子页的线程数（asyncio模式下为并发数）
+        "queue_size": 0  # 已解析、等待下载的帖子上限，0 表示下载线程数的2倍
+    },
+    "scheduling": {  # 下载顺序：shortest 小文件优先 / newest 新帖子优先 / size_classes 按大小分档轮流 / fifo
+        "policy": "shortest",
+        "probe_size": False,  # 大小未知时（HTML列表）先HEAD探测媒体大小
+        "size_classes_mb": list(DEFAULT_SIZE_CLASSES_MB),
+        "bandwidth_limit_mbps": 0  # 所有下载共用的总带宽上限（MB/s），0 表示不限制
+    },
+    "full_rescan": False,  # True: 忽略标签高水位，从头抓取全部页面
+    "skip_known_md5": True,  # 列表页/API给出的MD5已在本地存档中时直接记为已处理，不抓取帖子页
+    "listing_mode": "html",  # html: 解析搜索页和帖子页; api: 使用dapi接口直接获取file_url
+    "base_url": "https://rule34.xxx",
+    "api_base_url": "https://api.rule34.xxx",
+    "api_key": "",  # dapi接口认证（可选）
+    "user_id": "",
+    "segmented": {  # 大文件分段多连接下载
+        "enabled": False,
+        "threshold_mb": 64,  # 超过该大小才分段
+        "segments": 4
+    },
+    "max_connections": 8,  # 所有媒体下载共用的最大连接数
+    "connection_pool": {  # 页面/API主机和媒体主机使用独立的连接池，大小按并发数自动设定
+        "keepalive": True,  # TCP keep-alive 探测空闲连接
+        "http2": False  # 页面/API主机使用HTTP/2多路复用（需要 pip install httpx[http2]）
+    },
+    "progress_interval": 1.0,  # 下载进度输出间隔（秒），0 表示不输出
+    "verify_md5": True,  # 下载时边写边计算MD5，与文件名中的hash比对
+    "page_cache": {  # 列表页/帖子页磁盘缓存，支持ETag/Last-Modified条件请求
+        "enabled": True,
+        "dir": DEFAULT_CACHE_DIR,
+        "max_mb": 200,
+        "max_age_days": 30,
+        "listing_ttl": 300,  # 列表页在该秒数内直接使用缓存，之后重新验证
+        "post_ttl": 86400  # 帖子页缓存秒数
+    },
+    "post_parser": "fast",  # fast: 快速扫描Original image链接; soup: BeautifulSoup完整解析
+    "metrics": {  # Prometheus 文本格式的指标端点 http://host:port/metrics
+        "enabled": False,
+        "host": "127.0.0.1",
+        "port": 9134
+    },
+    "tracing": {  # 记录每个帖子各阶段耗时（JSONL），结果文件中附加各阶段 p50/p95/p99
+        "enabled": False,
+        "file": "trace.jsonl"
+    },
+    "rate_limit": {  # 每个主机的自适应限速（请求/秒），遇到429自动降速，成功后逐步回升
+        "rate": 2.0,
+        "max_rate": 8.0
+    }
 }
 
-def get_default_download_dir():
-    """根据默认配置的tags[0]创建下载目录"""
-    tags = DEFAULT_CONFIG["tags"].split()
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.avi', '.mov', '.mkv', '.flv', '.wmv')
+
+def get_default_download_dir(tags=None):
+    """根据标签（默认为默认配置的标签）的第一个标签创建下载目录"""
+    tags = re.split(r'[+\s]+', tags if tags is not None else DEFAULT_CONFIG["tags"])
+    tags = [tag for tag in tags if tag]
     if tags:
         first_tag = tags[0]
         download_dir = os.path.join("downloads", first_tag)
@@ -28,6 +98,34 @@ def get_default_download_dir():
     return "downloads"
 
 CONFIG_FILE = "rule34_config.json"
+BATCH_FILE = "rule34_batch.json"
+
+def load_batch_queries(path=BATCH_FILE):
+    """读取批量任务文件，返回按优先级从高到低排序的查询列表
+
+    文件格式: {"queries": [{"tags": "tag1 tag2", "download_dir": "downloads/tag1", "priority": 10}, ...]}
+    download_dir 省略时使用 downloads/第一个标签，priority 省略时为0
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    entries = data.get("queries", []) if isinstance(data, dict) else data
+    
+    queries = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"tags": entry}
+        tag_list = [tag for tag in re.split(r'[+\s]+', entry.get("tags", "")) if tag]
+        if not tag_list:
+            print(f"⚠️ 跳过没有标签的批量任务: {entry}")
+            continue
+        tags = '+'.join(tag_list)
+        queries.append({
+            "tags": tags,
+            "download_dir": entry.get("download_dir") or get_default_download_dir(tags),
+            "priority": entry.get("priority", 0)
+        })
+    queries.sort(key=lambda query: -query["priority"])
+    return queries
 
 def save_config(config):
     """保存配置到文件"""
@@ -38,14 +136,24 @@ def save_config(config):
     except Exception as e:
         print(f"❌ 保存配置失败: {e}")
 
+def merge_config(config):
+    """用默认配置补全缺失的项，嵌套的配置（如 page_cache）按键合并"""
+    merged = dict(DEFAULT_CONFIG)
+    for key, value in config.items():
+        if isinstance(value, dict) and isinstance(DEFAULT_CONFIG.get(key), dict):
+            merged[key] = {**DEFAULT_CONFIG[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
 def load_config():
-    """从文件加载配置"""
+    """从文件加载配置，文件中没有的项使用默认配置"""
     try:
         if os.path.exists(CONFIG_FILE):
             with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
                 config = json.load(f)
             print(f"✅ 配置已从 {CONFIG_FILE} 加载")
-            return config
+            return merge_config(config)
         else:
             print(f"⚠️ 配置文件 {CONFIG_FILE} 不存在，使用默认配置")
             return DEFAULT_CONFIG
@@ -54,7 +162,13 @@ def load_config():
         return DEFAULT_CONFIG
 
 class Rule34FixedDownloader:
-    def __init__(self, max_workers=3):
+    def __init__(self, max_workers=3, state_db=DEFAULT_STATE_DB, export_json=False,
+                 engine="thread", async_concurrency=None, prefetch_pages=1, rate_limit=None,
+                 listing_mode="html", base_url="https://rule34.xxx", api_base_url="https://api.rule34.xxx",
+                 api_key="", user_id="", post_parser="fast", segmented=None, max_connections=8,
+                 progress_interval=1.0, verify_md5=True, page_cache=None, full_rescan=False,
+                 connection_pool=None, pipeline=None, scheduling=None, metrics=None, tracing=None,
+                 skip_known_md5=True):
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -65,17 +179,124 @@ class Rule34FixedDownloader:
         })
         
         self.lock = threading.Lock()
+        
+        # 指标：请求/重试/字节数/各阶段耗时，可通过本地HTTP端点以Prometheus格式抓取
+        self.metrics = MetricsRegistry()
+        
+        # 分阶段计时（可选）：列表页、帖子页、解析、等待、传输、写盘、校验
+        tracing = tracing or {}
+        self.tracer = Tracer(tracing.get("file", "trace.jsonl") if tracing.get("enabled", False) else None)
+        
+        # 统一请求层：所有工作线程共享按主机的限速器和重试策略
+        self.rate_limiter = HostRateLimiter(**(rate_limit or {}))
+        self.client = HttpClient(self.session, self.rate_limiter, RetryPolicy(), self.lock, self.metrics,
+                                 self.tracer)
+        
         self.downloaded_count = 0
         self.total_posts = 0
         self.downloaded_urls = set()  # 记录已下载的URL，避免重复
         self.max_workers = max_workers  # 并发线程数
+        # 两级流水线：解析线程抓取帖子页，下载线程传输媒体，多个页面/批量任务共用
+        pipeline = pipeline or {}
+        self.resolve_workers = max(1, pipeline.get("resolve_workers", 2))
+        self.pipeline_queue_size = pipeline.get("queue_size", 0)
+        self.pipeline = None
+        self.async_engine = None  # 运行中的asyncio引擎（用于读取队列深度）
+        self.resolve_stats = StageStats("解析", self.resolve_workers)
+        self.download_stats = StageStats("下载", max_workers)
         
-        # 重复文件检测
+        # 下载调度：按大小/帖子ID决定下载顺序，中断时留下尽量多的完整文件
+        scheduling = scheduling or {}
+        self.schedule_policy = scheduling.get("policy", "shortest")
+        self.probe_sizes = scheduling.get("probe_size", False)
+        self.size_classes_mb = scheduling.get("size_classes_mb", DEFAULT_SIZE_CLASSES_MB)
+        self.bandwidth_budget = None
+        if scheduling.get("bandwidth_limit_mbps"):
+            self.bandwidth_budget = BandwidthBudget(scheduling["bandwidth_limit_mbps"] * 1024 * 1024)
+        self.engine = engine  # 下载引擎: thread / async
+        self.async_concurrency = async_concurrency or max_workers  # asyncio模式下的最大在途任务数
+        self.prefetch_pages = max(0, prefetch_pages)  # 列表页预取深度
+        self.posts_per_page = 42
+        
+        # 增量抓取：记录每个标签查询完整抓取过的最大帖子ID，之后只抓取更新的帖子
+        self.full_rescan = full_rescan
+        self.crawl_max_post_id = 0
+        
+        # MD5索引：缩略图/API给出的MD5已在本地存档中的帖子不再抓取帖子页
+        self.skip_known_md5 = skip_known_md5
+        self.md5_skipped = 0
+        
+        # 列表模式：html 逐帖解析页面；api 通过dapi接口一次获取最多1000个帖子的file_url
+        self.listing_mode = listing_mode
+        self.base_url = base_url.rstrip('/')
+        self.api_base_url = api_base_url.rstrip('/')
+        self.api_key = api_key
+        self.user_id = user_id
+        self.api_page_limit = 1000
+        self.post_metadata = {}  # post_id -> dapi返回的元数据（md5、大小等）
+        
+        # 分段下载：超过阈值且服务器支持Range的文件拆成多段并行下载
+        segmented = segmented or {}
+        self.segmented_enabled = segmented.get("enabled", False)
+        self.segment_threshold = int(segmented.get("threshold_mb", 64) * 1024 * 1024)
+        self.segment_count = max(1, segmented.get("segments", 4))
+        self.min_segment_size = 4 * 1024 * 1024
+        if self.segmented_enabled and engine == "async":
+            print("⚠️ asyncio引擎不支持分段下载，segmented 设置将被忽略（线程池模式才会分段下载）")
+        # 全局媒体连接上限，分段和普通下载共用，避免连接数暴涨引发429
+        self.max_connections = max(1, max_connections)
+        self.connection_slots = threading.BoundedSemaphore(self.max_connections)
+        
+        # 连接池：页面/API主机和媒体主机分开，避免默认10个连接的池被占满后反复握手
+        connection_pool = connection_pool or {}
+        page_size, media_size = self.get_pool_sizes()
+        self.pools = ConnectionPools(self.session, [self.base_url, self.api_base_url], page_size, media_size,
+                                     connection_pool.get("keepalive", True), connection_pool.get("http2", False))
+        
+        # 下载进度由后台线程统一输出，下载循环只累加计数器
+        self.progress = ProgressReporter(progress_interval, self.lock)
+        
+        # 下载完整性校验：校验失败的文件不记录，重新下载
+        self.verify_md5 = verify_md5
+        self.download_attempts = 3
+        self.md5_filename_pattern = re.compile(r'^([0-9a-f]{32})_')
+        
+        # 页面缓存：未变化的列表页/帖子页只需一次304或直接命中
+        # 与 DEFAULT_CONFIG 使用同一份默认值（默认启用），未给出的项取默认配置
+        page_cache = {**DEFAULT_CONFIG["page_cache"], **(page_cache or {})}
+        self.page_cache = None
+        if page_cache["enabled"]:
+            self.page_cache = PageCache(page_cache.get("dir", DEFAULT_CACHE_DIR),
+                                        page_cache.get("max_mb", 200), page_cache.get("max_age_days", 30))
+        self.listing_ttl = page_cache.get("listing_ttl", 300)
+        self.post_ttl = page_cache.get("post_ttl", 86400)
+        
+        # 状态存储（SQLite），JSON配置文件仅作为可选导出
         self.downloaded_files_config = "downloaded_files_config.json"
+        self.detected_posts_config = "detected_posts_config.json"
+        self.export_json = export_json
+        self.store = StateStore(state_db)
+        imported_posts, imported_files = self.store.import_json(
+            self.detected_posts_config, self.downloaded_files_config
+        )
+        if imported_posts or imported_files:
+            print(f"📦 已从JSON导入 {imported_posts} 个帖子记录、{imported_files} 个文件记录到 {state_db}")
+        
+        # 重复文件检测
         self.downloaded_files = self.load_downloaded_files()
         
+        # 文件索引：filename -> 文件路径，post_id -> 文件名集合，md5 -> 文件名集合
+        self.file_index = {}
+        self.post_file_index = {}
+        self.md5_file_index = {}
+        self.file_md5s = {}  # filename -> md5（文件名开头的hash或下载时校验过的摘要）
+        self.indexed_dirs = set()  # 已完成磁盘扫描的目录
+        self.filename_post_pattern = re.compile(r'_(\d+)(?:_duplicate_\d+)?\.[A-Za-z0-9]+$')
+        file_md5s = self.load_file_md5s()
+        for filename in self.downloaded_files:
+            self.index_file(filename, md5=file_md5s.get(filename))
+        
         # 帖子检测记录
-        self.detected_posts_config = "detected_posts_config.json"
         self.detected_posts = self.load_detected_posts()
         
         # 程序控制标志
@@ -87,11 +308,97 @@ class Rule34FixedDownloader:
             r'https://wimg\.rule34\.xxx/thumbnails/(\d+)/thumbnail_([a-f0-9]+)\.jpg\?(\d+)',
             re.IGNORECASE
         )
+        # 列表页单次扫描：缩略图URL（文件夹、MD5、帖子ID）或帖子链接（帖子ID），按页面顺序匹配
+        # 不使用 IGNORECASE（会让整个扫描慢2-3倍），只有MD5部分允许大写
+        self.listing_pattern = re.compile(
+            r'https://wimg\.rule34\.xxx/thumbnails/(\d+)/thumbnail_([a-fA-F0-9]+)\.jpg\?(\d+)'
+            r'|page=post&s=view&id=(\d+)'
+        )
+        
+        # 帖子页解析：fast 快速路径（失败时回退完整解析）/ soup 完整解析
+        self.post_parser = post_parser
+        self.original_anchor_pattern = re.compile(
+            r'<a\s[^>]*?\bhref\s*=\s*(["\'])(.*?)\1[^>]*>\s*$',
+            re.IGNORECASE | re.DOTALL
+        )
+        self.video_href_pattern = re.compile(r'href="((?!.*waifu2x)[^"]*\.mp4[^"]*)"', re.IGNORECASE)
+        # is_valid_video_url 接受的扩展名；页面中一个都没有时完整解析也不可能找到视频
+        self.video_extension_pattern = re.compile(r'\.(?:mp4|avi|mov|mkv|webm)', re.IGNORECASE)
+        
+        self.setup_metrics()
+        metrics = metrics or {}
+        if metrics.get("enabled", False):
+            try:
+                port = self.metrics.serve(metrics.get("host", "127.0.0.1"), metrics.get("port", 9134))
+                print(f"📈 指标端点: http://{metrics.get('host', '127.0.0.1')}:{port}/metrics")
+            except OSError as e:
+                print(f"⚠️ 无法启动指标端点: {e}")
         
         # 注册信号处理器
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
     
+    def setup_metrics(self):
+        """注册下载器层面的指标（请求相关指标由 HttpClient 注册）"""
+        m = self.metrics
+        self.page_seconds = m.histogram("rule34_page_seconds", "处理一个列表页（下载该页所有帖子）的耗时")
+        self.file_seconds = m.histogram("rule34_file_download_seconds", "单个文件下载耗时", ("result",))
+        self.resolve_stats.histogram = m.histogram("rule34_post_resolve_seconds", "帖子页解析耗时", ("result",))
+        self.download_stats.histogram = m.histogram("rule34_post_download_seconds", "帖子媒体下载耗时",
+                                                    ("result",))
+        m.counter("rule34_downloaded_bytes_total", "本次运行下载的字节数",
+                  func=lambda: self.progress.transferred_bytes(list(self.progress.slots.values())))
+        m.counter("rule34_files_downloaded_total", "下载完成的文件数", func=lambda: self.downloaded_count)
+        m.counter("rule34_posts_processed_total", "各阶段处理的帖子数", ("stage",),
+                  func=lambda: {("resolve",): self.resolve_stats.items, ("download",): self.download_stats.items})
+        m.gauge("rule34_active_downloads", "正在传输的文件数", func=lambda: len(self.progress.slots))
+        m.gauge("rule34_queue_depth", "流水线队列深度", ("queue",), func=self.get_queue_depths)
+        m.gauge("rule34_workers", "各阶段并发数", ("stage",),
+                func=lambda: {("resolve",): self.resolve_stats.workers, ("download",): self.download_stats.workers})
+        m.counter("rule34_bandwidth_wait_seconds_total", "带宽预算累计等待时间",
+                  func=lambda: self.bandwidth_budget.total_wait if self.bandwidth_budget else 0)
+    
+    def get_queue_depths(self):
+        """流水线各队列的当前深度"""
+        if self.async_engine is not None:
+            return {("resolve",): 0, ("download",): self.async_engine.waiting}
+        pipeline = self.pipeline
+        if pipeline is None:
+            return {("resolve",): 0, ("download",): 0}
+        return {("resolve",): pipeline.resolve_queue.qsize(), ("download",): pipeline.download_queue.qsize()}
+    
+    def set_max_workers(self, max_workers, async_concurrency=None):
+        """设置并发线程数（asyncio模式未单独配置时使用相同的并发数）"""
+        if max_workers != self.max_workers:
+            self.close()
+        self.max_workers = max_workers
+        self.async_concurrency = async_concurrency or max_workers
+        self.pools.resize(*self.get_pool_sizes())
+    
+    def get_pool_sizes(self):
+        """按并发数计算连接池大小，返回 (页面池, 媒体池)
+
+        页面池：每个解析线程一个帖子页请求，加上列表页抓取线程；
+        媒体池：每个下载线程一个连接（分段下载时每段一个），不超过全局媒体连接上限。
+        """
+        page_size = self.resolve_workers + 1
+        media_size = self.max_workers * (self.segment_count if self.segmented_enabled else 1)
+        return page_size, max(1, min(media_size, self.max_connections))
+    
+    def get_pipeline(self):
+        """共用的解析/下载流水线（首次使用时创建）"""
+        if self.pipeline is None:
+            self.pipeline = PostPipeline(self, self.resolve_workers, self.max_workers,
+                                         self.pipeline_queue_size or None)
+        return self.pipeline
+    
+    def close(self):
+        """关闭解析/下载流水线，写出计时记录"""
+        if self.pipeline is not None:
+            self.pipeline.shutdown()
+            self.pipeline = None
+        self.tracer.flush()
+    
     def signal_handler(self, signum, frame):
         """处理Ctrl+C信号，优雅退出"""
         with self.lock:
@@ -125,38 +432,25 @@ class Rule34FixedDownloader:
     def load_detected_posts(self):
         """加载已检测的帖子记录"""
         detected_posts = set()
-        if os.path.exists(self.detected_posts_config):
-            try:
-                with open(self.detected_posts_config, 'r', encoding='utf-8') as f:
-                    config_data = json.load(f)
-                    if 'posts' in config_data:
-                        for post_info in config_data['posts']:
-                            if 'post_id' in post_info:
-                                detected_posts.add(post_info['post_id'])
+        try:
+            detected_posts = self.store.load_posts()
+            if detected_posts:
                 print(f"📋 已加载 {len(detected_posts)} 个已检测帖子记录")
-            except Exception as e:
-                print(f"⚠️ 读取已检测帖子记录失败: {e}")
-        else:
-            print("📋 未找到已检测帖子记录，将创建新记录")
+            else:
+                print("📋 未找到已检测帖子记录，将创建新记录")
+        except Exception as e:
+            print(f"⚠️ 读取已检测帖子记录失败: {e}")
         return detected_posts
     
     def save_detected_posts(self):
-        """保存已检测的帖子记录到JSON配置文件"""
+        """帖子记录已逐条写入数据库；启用export_json时额外导出JSON配置文件"""
+        if not self.export_json:
+            return
         try:
-            # 生成配置文件
-            config_data = {
-                "scan_time": datetime.now().isoformat(),
-                "total_posts": len(self.detected_posts),
-                "posts": [{"post_id": post_id} for post_id in sorted(self.detected_posts)]
-            }
-            
-            # 保存配置文件
-            with open(self.detected_posts_config, 'w', encoding='utf-8') as f:
-                json.dump(config_data, f, ensure_ascii=False, indent=2)
-            
-            print(f"💾 已保存 {len(self.detected_posts)} 个帖子记录到 {self.detected_posts_config}")
+            total = self.store.export_posts_json(self.detected_posts_config)
+            print(f"💾 已导出 {total} 个帖子记录到 {self.detected_posts_config}")
         except Exception as e:
-            print(f"❌ 保存帖子记录失败: {e}")
+            print(f"❌ 导出帖子记录失败: {e}")
     
     def is_post_detected(self, post_id):
         """检查帖子是否已检测过"""
@@ -165,99 +459,192 @@ class Rule34FixedDownloader:
     def add_detected_post(self, post_id):
         """添加已检测的帖子到记录"""
         self.detected_posts.add(post_id)
+        try:
+            self.store.add_post(post_id)
+        except Exception as e:
+            print(f"❌ 写入帖子记录失败: {e}")
     
     # 移除waifu2x处理方法 - 完全跳过增强版链接
     
     def load_downloaded_files(self):
         """加载已下载文件记录"""
         downloaded_files = set()
-        if os.path.exists(self.downloaded_files_config):
-            try:
-                with open(self.downloaded_files_config, 'r', encoding='utf-8') as f:
-                    config_data = json.load(f)
-                    if 'files' in config_data:
-                        for file_info in config_data['files']:
-                            if 'filename' in file_info:
-                                downloaded_files.add(file_info['filename'])
+        try:
+            downloaded_files = self.store.load_filenames()
+            if downloaded_files:
                 print(f"📋 已加载 {len(downloaded_files)} 个已下载文件记录")
-            except Exception as e:
-                print(f"⚠️ 读取已下载文件记录失败: {e}")
-        else:
-            print("📋 未找到已下载文件记录，将创建新记录")
+            else:
+                print("📋 未找到已下载文件记录，将创建新记录")
+        except Exception as e:
+            print(f"⚠️ 读取已下载文件记录失败: {e}")
         return downloaded_files
     
-    def save_downloaded_files(self, download_dir="downloads"):
-        """保存已下载文件记录到JSON配置文件"""
+    def load_file_md5s(self):
+        """加载文件记录中校验过的MD5"""
         try:
-            # 扫描下载目录获取文件信息
-            file_details = []
-            total_size = 0
-            
-            for root, dirs, files in os.walk(download_dir):
-                for file in files:
-                    if file.lower().endswith(('.mp4', '.webm', '.avi', '.mov', '.mkv', '.flv', '.wmv')):
-                        file_path = os.path.join(root, file)
+            return self.store.load_file_md5s()
+        except Exception as e:
+            print(f"⚠️ 读取文件MD5记录失败: {e}")
+            return {}
+    
+    def snapshot_download_dir(self, download_dir="downloads"):
+        """用 os.scandir 遍历一次下载目录，返回目录快照并刷新文件索引
+
+        快照: {"download_dir", "scan_time", "dir_count", "files": [{filename, filepath, directory,
+        size, mtime, post_id, is_video}]}，启动时的同步、清单、0字节清理和摘要都基于同一份快照。
+        """
+        snapshot = {
+            "download_dir": download_dir,
+            "scan_time": datetime.now().isoformat(),
+            "dir_count": 0,
+            "files": []
+        }
+        if not os.path.exists(download_dir):
+            return snapshot
+        
+        pending = [download_dir]
+        while pending:
+            root = pending.pop(0)
+            snapshot["dir_count"] += 1
+            current_dir = os.path.relpath(root, download_dir)
+            if current_dir == ".":
+                current_dir = "根目录"
+            subdirs = []
+            try:
+                with os.scandir(root) as entries:
+                    for entry in entries:
                         try:
-                            file_size = os.path.getsize(file_path)
-                            file_mtime = os.path.getmtime(file_path)
-                            current_dir = os.path.relpath(root, download_dir)
-                            if current_dir == ".":
-                                current_dir = "根目录"
-                            
-                            file_details.append({
-                                "filename": file,
-                                "filepath": file_path,
-                                "size": file_size,
-                                "size_mb": round(file_size / (1024 * 1024), 2),
-                                "modified_time": datetime.fromtimestamp(file_mtime).isoformat(),
-                                "directory": current_dir,
-                                "extension": os.path.splitext(file)[1].lower()
-                            })
-                            total_size += file_size
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                                continue
+                            if not entry.is_file():
+                                continue
+                            st = entry.stat()
                         except OSError:
                             continue
+                        snapshot["files"].append({
+                            "filename": entry.name,
+                            "filepath": entry.path,
+                            "directory": current_dir,
+                            "size": st.st_size,
+                            "mtime": st.st_mtime,
+                            "post_id": self.get_post_id_from_filename(entry.name),
+                            "is_video": entry.name.lower().endswith(VIDEO_EXTENSIONS)
+                        })
+            except OSError as e:
+                print(f"⚠️ 无法读取目录 {root}: {e}")
+            pending[0:0] = sorted(subdirs)  # 与 os.walk 一样自上而下
+        
+        for file_info in snapshot["files"]:
+            if file_info["is_video"]:
+                self.index_file(file_info["filename"], file_info["filepath"])
+        self.indexed_dirs.add(os.path.abspath(download_dir))
+        return snapshot
+    
+    def save_downloaded_files(self, download_dir="downloads", snapshot=None):
+        """根据目录快照更新文件记录；启用export_json时额外导出JSON配置文件
+
+        未传入快照时重新扫描一次下载目录（例如下载结束后）
+        """
+        try:
+            if snapshot is None:
+                snapshot = self.snapshot_download_dir(download_dir)
+            
+            file_details = []
+            total_size = 0
+            for file_info in snapshot["files"]:
+                if not file_info["is_video"]:
+                    continue
+                file_details.append({
+                    "filename": file_info["filename"],
+                    "filepath": file_info["filepath"],
+                    "size": file_info["size"],
+                    "size_mb": round(file_info["size"] / (1024 * 1024), 2),
+                    "modified_time": datetime.fromtimestamp(file_info["mtime"]).isoformat(),
+                    "directory": file_info["directory"],
+                    "extension": os.path.splitext(file_info["filename"])[1].lower(),
+                    "post_id": file_info["post_id"],
+                    "mtime": file_info["mtime"]
+                })
+                total_size += file_info["size"]
             
             # 按目录和文件名排序
             file_details.sort(key=lambda x: (x["directory"], x["filename"]))
             
-            # 生成配置文件
-            config_data = {
-                "scan_time": datetime.now().isoformat(),
-                "download_directory": download_dir,
-                "total_files": len(file_details),
-                "total_size_bytes": total_size,
-                "total_size_mb": round(total_size / (1024 * 1024), 2),
-                "files": file_details
-            }
-            
-            # 保存配置文件
-            with open(self.downloaded_files_config, 'w', encoding='utf-8') as f:
-                json.dump(config_data, f, ensure_ascii=False, indent=2)
-            
-            print(f"💾 已保存 {len(file_details)} 个文件记录到 {self.downloaded_files_config}")
-            print(f"📊 总大小: {config_data['total_size_mb']} MB")
+            # 写入数据库（单个事务）
+            # 只替换该目录下的记录，批量模式中其它查询目录的记录保留
+            self.store.replace_files([
+                {
+                    "filename": d["filename"],
+                    "filepath": d["filepath"],
+                    "size": d["size"],
+                    "modified_time": d.pop("mtime"),
+                    "post_id": d.pop("post_id")
+                }
+                for d in file_details
+            ], download_dir)
+            self.store.set_meta("download_directory", download_dir)
+            self.store.set_meta("scan_time", snapshot["scan_time"])
+            
+            print(f"💾 已保存 {len(file_details)} 个文件记录到 {self.store.db_path}")
+            print(f"📊 总大小: {round(total_size / (1024 * 1024), 2)} MB")
+            
+            if self.export_json:
+                config_data = {
+                    "scan_time": snapshot["scan_time"],
+                    "download_directory": download_dir,
+                    "total_files": len(file_details),
+                    "total_size_bytes": total_size,
+                    "total_size_mb": round(total_size / (1024 * 1024), 2),
+                    "files": file_details
+                }
+                with open(self.downloaded_files_config, 'w', encoding='utf-8') as f:
+                    json.dump(config_data, f, ensure_ascii=False, indent=2)
+                print(f"💾 已导出文件记录到 {self.downloaded_files_config}")
         except Exception as e:
             print(f"❌ 保存文件记录失败: {e}")
     
-    def generate_file_list_summary(self, download_dir="downloads"):
-        """生成文件列表摘要信息"""
+    def generate_file_list_summary(self, download_dir="downloads", snapshot=None):
+        """生成文件列表摘要信息；传入快照时直接基于快照统计，否则读取数据库记录"""
         try:
-            if not os.path.exists(self.downloaded_files_config):
-                print("⚠️ 文件列表配置文件不存在，请先运行扫描")
-                return
-            
-            with open(self.downloaded_files_config, 'r', encoding='utf-8') as f:
-                config_data = json.load(f)
+            files = []
+            if snapshot is not None:
+                scan_time = snapshot["scan_time"]
+                scan_dir = snapshot["download_dir"]
+                for file_info in snapshot["files"]:
+                    if file_info["is_video"]:
+                        files.append({
+                            'directory': file_info["directory"],
+                            'extension': os.path.splitext(file_info["filename"])[1].lower(),
+                            'size': file_info["size"]
+                        })
+            else:
+                scan_time = self.store.get_meta("scan_time")
+                if not scan_time:
+                    print("⚠️ 文件记录不存在，请先运行扫描")
+                    return
+                scan_dir = self.store.get_meta('download_directory', download_dir)
+                for record in self.store.load_files():
+                    filepath = record['filepath'] or record['filename']
+                    dir_name = os.path.relpath(os.path.dirname(filepath) or ".", download_dir)
+                    if dir_name == ".":
+                        dir_name = "根目录"
+                    files.append({
+                        'directory': dir_name,
+                        'extension': os.path.splitext(record['filename'])[1].lower(),
+                        'size': record['size'] or 0
+                    })
+            total_size = sum(file_info['size'] for file_info in files)
             
             print(f"\n📋 文件列表摘要:")
-            print(f"   📁 扫描目录: {config_data['download_directory']}")
-            print(f"   📅 扫描时间: {config_data['scan_time']}")
-            print(f"   📊 文件总数: {config_data['total_files']}")
-            print(f"   💾 总大小: {config_data['total_size_mb']} MB")
+            print(f"   📁 扫描目录: {scan_dir}")
+            print(f"   📅 扫描时间: {scan_time}")
+            print(f"   📊 文件总数: {len(files)}")
+            print(f"   💾 总大小: {round(total_size / (1024 * 1024), 2)} MB")
             
             # 按目录统计
             dir_stats = {}
-            for file_info in config_data['files']:
+            for file_info in files:
                 dir_name = file_info['directory']
                 if dir_name not in dir_stats:
                     dir_stats[dir_name] = {'count': 0, 'size': 0}
@@ -271,7 +658,7 @@ class Rule34FixedDownloader:
             
             # 按扩展名统计
             ext_stats = {}
-            for file_info in config_data['files']:
+            for file_info in files:
                 ext = file_info['extension']
                 if ext not in ext_stats:
                     ext_stats[ext] = {'count': 0, 'size': 0}
@@ -296,94 +683,163 @@ class Rule34FixedDownloader:
         if filename in self.downloaded_files:
             return True, "记录中存在"
         
-        # 检查实际文件
-        for root, dirs, files in os.walk(download_dir):
-            if filename in files:
-                file_path = os.path.join(root, filename)
-                try:
-                    file_size = os.path.getsize(file_path)
-                    if file_size > 0:
-                        return True, f"文件存在 ({file_size} 字节)"
-                    else:
-                        return False, "文件大小为0"
-                except OSError:
-                    return False, "无法读取文件"
+        # 通过索引定位实际文件
+        self.ensure_file_index(download_dir)
+        file_path = self.file_index.get(filename)
+        if file_path is None:
+            return False, "文件不存在"
         
-        return False, "文件不存在"
+        try:
+            file_size = os.path.getsize(file_path)
+            if file_size > 0:
+                return True, f"文件存在 ({file_size} 字节)"
+            else:
+                return False, "文件大小为0"
+        except OSError:
+            return False, "无法读取文件"
     
-    def add_downloaded_file(self, filename):
-        """添加已下载文件到记录"""
+    def add_downloaded_file(self, filename, filepath=None, md5=None):
+        """添加已下载文件到记录，md5 为下载时校验过的摘要"""
         self.downloaded_files.add(filename)
+        self.index_file(filename, filepath, md5)
+        try:
+            size = mtime = None
+            if filepath and os.path.exists(filepath):
+                size = os.path.getsize(filepath)
+                mtime = os.path.getmtime(filepath)
+            self.store.add_file(filename, filepath, size, mtime, self.get_post_id_from_filename(filename), md5)
+        except Exception as e:
+            print(f"❌ 写入文件记录失败: {e}")
     
-    def find_files_by_post_id(self, post_id, download_dir="downloads"):
-        """根据post_id查找已存在的文件"""
-        existing_files = []
+    def get_post_id_from_filename(self, filename):
+        """从文件名中解析post_id，支持 hash_postid.ext 和 hash_postid_duplicate_N.ext"""
+        match = self.filename_post_pattern.search(filename)
+        return match.group(1) if match else None
+    
+    def index_file(self, filename, filepath=None, md5=None):
+        """将文件加入索引；md5 为校验过的摘要，未给出时取文件名开头的32位hash
         
-        # 检查配置文件中的文件
-        for filename in self.downloaded_files:
-            if f"_{post_id}" in filename or f"_{post_id}_" in filename:
-                existing_files.append(filename)
+        只索引媒体文件：.part、.part.json 等未完成或非媒体文件不算已存档
+        """
+        if not filename.lower().endswith(VIDEO_EXTENSIONS):
+            return
+        if filepath is not None or filename not in self.file_index:
+            self.file_index[filename] = filepath
+        post_id = self.get_post_id_from_filename(filename)
+        if post_id:
+            self.post_file_index.setdefault(post_id, set()).add(filename)
+        if md5 is None:
+            match = self.md5_filename_pattern.match(filename)
+            md5 = match.group(1) if match else None
+        if md5:
+            md5 = md5.lower()
+            self.file_md5s[filename] = md5
+            self.md5_file_index.setdefault(md5, set()).add(filename)
+    
+    def unindex_file(self, filename):
+        """从索引中移除文件"""
+        self.file_index.pop(filename, None)
+        post_id = self.get_post_id_from_filename(filename)
+        files = self.post_file_index.get(post_id)
+        if files is not None:
+            files.discard(filename)
+            if not files:
+                del self.post_file_index[post_id]
+        md5 = self.file_md5s.pop(filename, None)
+        files = self.md5_file_index.get(md5)
+        if files is not None:
+            files.discard(filename)
+            if not files:
+                del self.md5_file_index[md5]
+    
+    def build_file_index(self, download_dir="downloads"):
+        """遍历一次下载目录，建立文件索引"""
+        self.snapshot_download_dir(download_dir)
+    
+    def ensure_file_index(self, download_dir="downloads"):
+        """确保下载目录已建立索引（只在首次使用时遍历磁盘）"""
+        if os.path.abspath(download_dir) in self.indexed_dirs:
+            return
+        with self.lock:
+            if os.path.abspath(download_dir) not in self.indexed_dirs:
+                self.build_file_index(download_dir)
+    
+    def skip_known_md5_posts(self, post_ids, download_dir="downloads"):
+        """MD5（来自缩略图URL或API）已在本地存档中的帖子直接记为已处理，返回其余帖子ID
         
-        # 检查文件系统中的文件
-        if os.path.exists(download_dir):
-            for root, dirs, files in os.walk(download_dir):
-                for file in files:
-                    if f"_{post_id}" in file or f"_{post_id}_" in file:
-                        if file not in existing_files:
-                            existing_files.append(file)
+        这些帖子不会抓取帖子页，也不会进入下载队列。
+        """
+        if not self.skip_known_md5:
+            return post_ids
+        self.ensure_file_index(download_dir)
+        remaining = []
+        skipped = []
+        for post_id in post_ids:
+            md5 = self.post_metadata.get(str(post_id), {}).get('md5')
+            if md5 and self.md5_file_index.get(md5.lower()):
+                skipped.append(post_id)
+            else:
+                remaining.append(post_id)
+        if not skipped:
+            return remaining
         
-        return existing_files
+        self.detected_posts.update(skipped)
+        try:
+            self.store.add_posts(skipped)
+        except Exception as e:
+            print(f"❌ 写入帖子记录失败: {e}")
+        self.md5_skipped += len(skipped)
+        with self.lock:
+            print(f"🧬 MD5已在本地存档: {len(skipped)} 个帖子直接记为已处理（不抓取帖子页）")
+        return remaining
+    
+    def find_files_by_post_id(self, post_id, download_dir="downloads"):
+        """根据post_id查找已存在的文件"""
+        self.ensure_file_index(download_dir)
+        return sorted(self.post_file_index.get(str(post_id), ()))
     
-    def sync_existing_files(self, download_dir="downloads"):
-        """同步现有文件到记录中，递归遍历所有文件夹"""
+    def sync_existing_files(self, download_dir="downloads", snapshot=None):
+        """同步现有文件到记录中（基于目录快照），返回使用的快照"""
         if not os.path.exists(download_dir):
             print(f"⚠️ 下载目录 {download_dir} 不存在，将创建该目录")
             os.makedirs(download_dir, exist_ok=True)
-            return
+            return self.snapshot_download_dir(download_dir)
         
         print(f"🔍 正在扫描 {download_dir} 目录...")
+        if snapshot is None:
+            snapshot = self.snapshot_download_dir(download_dir)
+        
         existing_files = set()
-        scanned_dirs = 0
-        scanned_files = 0
+        dir_stats = {}  # 目录 -> [视频文件数, 大小]，按遍历顺序
         total_size = 0
+        for file_info in snapshot["files"]:
+            if not file_info["is_video"]:
+                continue
+            existing_files.add(file_info["filename"])
+            stats = dir_stats.setdefault(file_info["directory"], [0, 0])
+            stats[0] += 1
+            stats[1] += file_info["size"]
+            total_size += file_info["size"]
         
-        # 递归遍历所有子目录
-        for root, dirs, files in os.walk(download_dir):
-            scanned_dirs += 1
-            current_dir = os.path.relpath(root, download_dir)
-            if current_dir == ".":
-                current_dir = "根目录"
-            
-            video_files_in_dir = []
-            dir_size = 0
-            for file in files:
-                scanned_files += 1
-                if file.lower().endswith(('.mp4', '.webm', '.avi', '.mov', '.mkv', '.flv', '.wmv')):
-                    video_files_in_dir.append(file)
-                    existing_files.add(file)
-                    try:
-                        file_size = os.path.getsize(os.path.join(root, file))
-                        dir_size += file_size
-                        total_size += file_size
-                    except OSError:
-                        continue
-            
-            if video_files_in_dir:
-                size_mb = dir_size / (1024 * 1024)
-                print(f"  📁 {current_dir}: 找到 {len(video_files_in_dir)} 个视频文件 ({size_mb:.1f} MB)")
+        for current_dir, (count, dir_size) in dir_stats.items():
+            size_mb = dir_size / (1024 * 1024)
+            print(f"  📁 {current_dir}: 找到 {count} 个视频文件 ({size_mb:.1f} MB)")
         
         total_size_mb = total_size / (1024 * 1024)
-        print(f"📊 扫描完成: {scanned_dirs} 个目录, {scanned_files} 个文件, {len(existing_files)} 个视频文件 (总计 {total_size_mb:.1f} MB)")
+        print(f"📊 扫描完成: {snapshot['dir_count']} 个目录, {len(snapshot['files'])} 个文件, {len(existing_files)} 个视频文件 (总计 {total_size_mb:.1f} MB)")
         
-        # 检查记录中的文件是否仍然存在
+        # 检查记录中位于该目录下的文件是否仍然存在（其它目录的记录不受影响）
+        recorded_in_dir = self.store.load_filenames_in(download_dir)
         missing_files = []
         for recorded_file in list(self.downloaded_files):
-            if recorded_file not in existing_files:
+            if recorded_file in recorded_in_dir and recorded_file not in existing_files:
                 missing_files.append(recorded_file)
         
         # 移除不存在的文件记录
         for missing_file in missing_files:
             self.downloaded_files.discard(missing_file)
+            self.unindex_file(missing_file)
+            self.store.remove_file(missing_file)
         
         # 添加新发现的文件到记录中
         added_count = 0
@@ -398,50 +854,51 @@ class Rule34FixedDownloader:
             print(f"➕ 添加了 {added_count} 个新文件到记录中")
         
         if missing_files or added_count > 0:
-            self.save_downloaded_files(download_dir)
-            print(f"💾 已更新文件记录，当前记录 {len(self.downloaded_files)} 个文件")
+            print(f"💾 文件记录需要更新，当前记录 {len(self.downloaded_files)} 个文件")
         else:
             print(f"✅ 文件记录已是最新状态，当前记录 {len(self.downloaded_files)} 个文件")
+        return snapshot
     
-    def cleanup_zero_size_files(self, download_dir="downloads"):
-        """清理0字节的文件"""
+    def cleanup_zero_size_files(self, download_dir="downloads", snapshot=None):
+        """清理0字节的文件；传入快照时从快照中找出0字节文件，删除后同步更新快照"""
         print(f"🧹 正在检查 {download_dir} 中的0字节文件...")
-        zero_size_files = []
-        
-        for root, dirs, files in os.walk(download_dir):
-            for file in files:
-                if file.lower().endswith(('.mp4', '.webm', '.avi', '.mov', '.mkv', '.flv', '.wmv')):
-                    file_path = os.path.join(root, file)
-                    try:
-                        if os.path.getsize(file_path) == 0:
-                            zero_size_files.append(file_path)
-                    except OSError:
-                        continue
+        if snapshot is None:
+            snapshot = self.snapshot_download_dir(download_dir)
+        zero_size_files = [
+            file_info for file_info in snapshot["files"]
+            if file_info["is_video"] and file_info["size"] == 0
+        ]
         
         if zero_size_files:
             print(f"⚠️ 发现 {len(zero_size_files)} 个0字节文件:")
-            for file_path in zero_size_files:
-                print(f"  🗑️ {file_path}")
+            for file_info in zero_size_files:
+                print(f"  🗑️ {file_info['filepath']}")
             
             # 询问是否删除
             response = input("是否删除这些0字节文件? (y/N): ").strip().lower()
             if response in ['y', 'yes']:
-                deleted_count = 0
-                for file_path in zero_size_files:
+                deleted = []
+                for file_info in zero_size_files:
+                    file_path = file_info["filepath"]
                     try:
                         os.remove(file_path)
                         filename = os.path.basename(file_path)
                         self.downloaded_files.discard(filename)  # 从记录中移除
-                        deleted_count += 1
+                        self.unindex_file(filename)
+                        self.store.remove_file(filename)
+                        deleted.append(file_info)
                         print(f"  ✅ 已删除: {file_path}")
                     except OSError as e:
                         print(f"  ❌ 删除失败: {file_path} - {e}")
                 
-                if deleted_count > 0:
-                    self.save_downloaded_files(download_dir)
-                    print(f"💾 已删除 {deleted_count} 个0字节文件并更新记录")
+                if deleted:
+                    deleted_paths = {file_info["filepath"] for file_info in deleted}
+                    snapshot["files"] = [f for f in snapshot["files"] if f["filepath"] not in deleted_paths]
+                    self.save_downloaded_files(download_dir, snapshot)
+                    print(f"💾 已删除 {len(deleted)} 个0字节文件并更新记录")
         else:
             print("✅ 没有发现0字节文件")
+        return snapshot
     
     def normalize_video_url(self, url):
         """标准化视频URL，统一域名但不解析waifu2x链接"""
@@ -459,32 +916,19 @@ class Rule34FixedDownloader:
         if parsed.query:
             normalized += f"?{parsed.query}"
         
-        print(f"🔍 标准化URL: {url} -> {normalized}")
         return normalized
     
     # 移除get_real_video_url方法 - 不再处理waifu2x链接
     
     def is_valid_video_url(self, url):
         """检查URL是否为有效的视频链接"""
-        # 完全拒绝waifu2x链接
-        if 'waifu2x' in url.lower():
+        # 完全拒绝waifu2x链接（waifu2x.booru.pics / waifu2x.udp.jp / waifu2x.0t0.nu / waifu2x.c64.org 等）
+        url_lower = url.lower()
+        if 'waifu2x' in url_lower:
             return False
-            
-        # 排除无效的URL域名
-        invalid_domains = [
-            'waifu2x.booru.pics',
-            'waifu2x.udp.jp', 
-            'waifu2x.0t0.nu',
-            'waifu2x.c64.org'
-        ]
-        
-        for domain in invalid_domains:
-            if domain in url:
-                return False
         
         # 检查是否为视频文件
-        video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.webm']
-        return any(ext in url.lower() for ext in video_extensions)
+        return any(ext in url_lower for ext in ('.mp4', '.avi', '.mov', '.mkv', '.webm'))
     
     def generate_search_urls(self, tags):
         """根据标签生成搜索URL列表，不预先检测页面数量"""
@@ -494,75 +938,85 @@ class Rule34FixedDownloader:
         print(f"📋 页面数量将在处理过程中动态检测")
         return []  # 返回空列表，让下载过程自己处理
     
+    def fetch_page_text(self, url, ttl, timeout=30):
+        """GET页面文本，启用页面缓存时先查缓存并发送条件请求"""
+        def fetch(headers):
+            response = self.client.get(url, timeout=timeout, headers=headers)
+            return response.status_code, response.headers, response.text
+        
+        if self.page_cache is None:
+            return fetch({})[2]
+        return self.page_cache.get_text(url, ttl, fetch)
+    
     def extract_post_ids_from_page(self, page_url, show_details=True):
         """从搜索结果页面提取所有帖子ID"""
-        # 添加延迟避免请求过快
-        time.sleep(0.5)
+        return [post["post_id"] for post in self.extract_listing_from_page(page_url, show_details) or []]
+    
+    def extract_listing_from_page(self, page_url, show_details=True):
+        """抓取搜索结果页面，返回按页面顺序去重的帖子列表（见 parse_listing）
         
-        # 重试机制处理429错误
-        max_retries = 100
-        for attempt in range(max_retries):
-            try:
-                response = self.session.get(page_url, timeout=30)
-                response.raise_for_status()
-                break  # 成功则跳出重试循环
-                
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 429:  # Too Many Requests
-                    if attempt < max_retries - 1:  # 不是最后一次尝试
-                        wait_time = 3 + attempt  # 递增等待时间：3, 4, 5, 6, 7...
-                        with self.lock:
-                            print(f"⚠️ 页面 {page_url} 遇到429错误，等待 {wait_time} 秒后重试... (尝试 {attempt + 1}/{max_retries})")
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        with self.lock:
-                            print(f"❌ 页面 {page_url} 重试 {max_retries} 次后仍然429错误，跳过")
-                        return []
-                else:
-                    # 其他HTTP错误直接抛出
-                    raise
-            except Exception as e:
-                # 非HTTP错误直接抛出
-                raise
+        429重试耗尽或解析失败时返回None（与没有帖子的空页 [] 区分）
+        """
+        # 限速与429重试由统一的请求层处理
+        try:
+            page_text = self.fetch_page_text(page_url, self.listing_ttl)
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 429:
+                with self.lock:
+                    print(f"❌ 页面 {page_url} 多次重试后仍然429错误")
+                return None
+            # 其他HTTP错误直接抛出
+            raise
+        
+        return self.parse_listing(page_text, show_details)
+    
+    def parse_post_ids(self, page_text, show_details=True):
+        """从搜索结果页面HTML中解析帖子ID"""
+        return [post["post_id"] for post in self.parse_listing(page_text, show_details) or []]
+    
+    def parse_listing(self, page_text, show_details=True):
+        """单次扫描搜索结果页面HTML，返回按页面顺序去重的帖子列表
         
+        每项为 {"post_id", "md5", "folder"}；md5/folder 取自缩略图URL（缩略图文件名即原文件的MD5），
+        只在帖子链接中出现的帖子两者为None。解析失败时返回None。
+        """
         try:
-            
-            # 使用正则表达式提取帖子ID
-            post_ids = []
-            
-            # 方法1: 从缩略图URL提取ID
-            thumbnail_matches = self.thumbnail_pattern.findall(response.text)
-            for match in thumbnail_matches:
-                folder_id, hash_id, query_id = match
-                post_ids.append(query_id)
-            
-            # 方法2: 从帖子链接提取ID
-            post_link_pattern = r'page=post&s=view&id=(\d+)'
-            link_matches = re.findall(post_link_pattern, response.text)
-            post_ids.extend(link_matches)
-            
-            # 去重
-            unique_post_ids = list(set(post_ids))
+            posts = {}  # post_id -> 帖子信息（dict保持页面顺序）
+            for match in self.listing_pattern.finditer(page_text):
+                folder_id, hash_id, query_id, link_id = match.groups()
+                post_id = query_id or link_id
+                post = posts.get(post_id)
+                if post is None:
+                    post = posts[post_id] = {"post_id": post_id, "md5": None, "folder": None}
+                if hash_id and post["md5"] is None and len(hash_id) == 32:
+                    post["md5"] = hash_id.lower()
+                    post["folder"] = folder_id
+            
+            listing = list(posts.values())
             
             # 显示检测进度（如果启用）
             if show_details:
-                with self.lock:
-                    print(f"🔍 页面检测完成: 找到 {len(unique_post_ids)} 个帖子ID")
-                    if unique_post_ids:
-                        print(f"📋 帖子列表:")
-                        for i, post_id in enumerate(unique_post_ids, 1):
-                            print(f"  {i:2d}. 帖子ID: {post_id}")
+                self.print_page_post_ids([post["post_id"] for post in listing])
             
             # 注意：这里不记录帖子，只有在成功下载后才记录
-            # 记录逻辑在 process_single_post 方法中
+            # 记录逻辑在 record_post_result 方法中
             
-            return unique_post_ids
+            return listing
             
         except Exception as e:
             with self.lock:
                 print(f"❌ 页面分析失败: {e}")
-            return []
+            return None
+    
+    def print_page_post_ids(self, post_ids):
+        """显示页面检测到的帖子ID列表"""
+        lines = [f"🔍 页面检测完成: 找到 {len(post_ids)} 个帖子ID"]
+        if post_ids:
+            lines.append(f"📋 帖子列表:")
+            lines.extend(f"  {i:2d}. 帖子ID: {post_id}" for i, post_id in enumerate(post_ids, 1))
+        text = "\n".join(lines)
+        with self.lock:
+            print(text)
     
     def extract_video_url_from_post(self, post_id):
         """从单个帖子提取视频下载链接"""
@@ -570,101 +1024,96 @@ class Rule34FixedDownloader:
         if self.should_stop:
             return []
             
-        post_url = f"https://rule34.xxx/index.php?page=post&s=view&id={post_id}"
+        post_url = self.build_post_url(post_id)
         
-        # 添加1秒延迟避免429错误
-        time.sleep(1)
+        # 限速与429重试由统一的请求层处理
+        try:
+            with self.tracer.span("post.fetch", post_id):
+                page_text = self.fetch_page_text(post_url, self.post_ttl)
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 429:
+                with self.lock:
+                    print(f"❌ 帖子 {post_id} 多次重试后仍然429错误，跳过")
+                return []
+            # 其他HTTP错误直接抛出
+            raise
         
-        # 重试机制处理429错误
-        max_retries = 100
-        for attempt in range(max_retries):
-            try:
-                response = self.session.get(post_url, timeout=30)
-                response.raise_for_status()
-                break  # 成功则跳出重试循环
-                
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 429:  # Too Many Requests
-                    if attempt < max_retries - 1:  # 不是最后一次尝试
-                        wait_time = 3 + attempt  # 递增等待时间：3, 4, 5, 6, 7...
-                        with self.lock:
-                            print(f"⚠️ 帖子 {post_id} 遇到429错误，等待 {wait_time} 秒后重试... (尝试 {attempt + 1}/{max_retries})")
-                        time.sleep(wait_time)
-                        continue
+        with self.tracer.span("post.parse", post_id):
+            return self.parse_video_urls(page_text, post_id)
+    
+    def find_original_links(self, page_text):
+        """快速路径：直接在文本中定位"Original image"锚点并取出href，不构建DOM"""
+        hrefs = []
+        position = 0
+        while True:
+            text_pos = page_text.find('Original image', position)
+            if text_pos < 0:
+                break
+            position = text_pos + len('Original image')
+            tag_start = page_text.rfind('<a', 0, text_pos)
+            if tag_start < 0:
+                continue
+            match = self.original_anchor_pattern.match(page_text, tag_start, text_pos)
+            if match:
+                hrefs.append(html.unescape(match.group(2)))
+        return hrefs
+    
+    def collect_video_urls(self, hrefs, processed_urls, direct_video_urls):
+        """补全相对URL、标准化去重并过滤无效/waifu2x链接，结果追加到 direct_video_urls"""
+        for href in hrefs:
+            if not href:
+                continue
+            # 处理相对URL
+            if href.startswith('//'):
+                href = 'https:' + href
+            elif href.startswith('/'):
+                href = self.base_url + href
+            
+            # 标准化URL并去重
+            normalized_url = self.normalize_video_url(href)
+            
+            if normalized_url and normalized_url not in processed_urls:
+                if self.is_valid_video_url(href):
+                    # 只处理非waifu2x链接
+                    if 'waifu2x' not in href.lower():
+                        direct_video_urls.append(href)
+                        processed_urls.add(normalized_url)
                     else:
-                        with self.lock:
-                            print(f"❌ 帖子 {post_id} 重试 {max_retries} 次后仍然429错误，跳过")
-                        return []
+                        print(f"🚫 跳过waifu2x增强版链接")
                 else:
-                    # 其他HTTP错误直接抛出
-                    raise
-            except Exception as e:
-                # 非HTTP错误直接抛出
-                raise
+                    print(f"❌ URL无效")
+            else:
+                print(f"⚠️ 跳过重复URL")
+    
+    def parse_video_urls(self, page_text, post_id, parser=None):
+        """从帖子页面HTML中解析视频下载链接
         
+        parser 为 fast 时先用快速路径扫描"Original image"锚点，找不到再完整解析，
+        页面中没有任何视频扩展名（图片帖子、已删除帖子）时直接返回；
+        为 soup 时直接使用BeautifulSoup完整解析。默认取 self.post_parser。
+        """
         try:
-            
-            # 使用BeautifulSoup解析HTML
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            video_urls = []
             processed_urls = set()  # 用于去重，存储标准化后的URL
             direct_video_urls = []  # 存储直接视频链接
+            full_parse = True
             
-            # 使用CSS选择器查找Original image链接
-            original_links = soup.select('#post-view > div.sidebar > div:nth-child(6) > ul > li:nth-child(2) > a')
+            # 快速路径：预编译扫描
+            if (parser or self.post_parser) == "fast":
+                self.collect_video_urls(self.find_original_links(page_text), processed_urls, direct_video_urls)
+                # 没有视频扩展名时完整解析和正则都只会得到无效链接，跳过
+                full_parse = bool(direct_video_urls) or bool(self.video_extension_pattern.search(page_text))
             
-            for link in original_links:
-                href = link.get('href')
-                if href:
-                    # 处理相对URL
-                    if href.startswith('//'):
-                        href = 'https:' + href
-                    elif href.startswith('/'):
-                        href = 'https://rule34.xxx' + href
-                    
-                    # 标准化URL并去重
-                    normalized_url = self.normalize_video_url(href)
-                    
-                    if normalized_url and normalized_url not in processed_urls:
-                        if self.is_valid_video_url(href):
-                            # 只处理非waifu2x链接
-                            if 'waifu2x' not in href.lower():
-                                direct_video_urls.append(href)
-                                processed_urls.add(normalized_url)
-                            else:
-                                print(f"🚫 跳过waifu2x增强版链接")
-                        else:
-                            print(f"❌ URL无效")
-                    else:
-                        print(f"⚠️ 跳过重复URL")
+            # 完整解析：使用CSS选择器查找Original image链接
+            if full_parse and not direct_video_urls:
+                soup = BeautifulSoup(page_text, 'html.parser')
+                original_links = soup.select('#post-view > div.sidebar > div:nth-child(6) > ul > li:nth-child(2) > a')
+                self.collect_video_urls([link.get('href') for link in original_links], processed_urls, direct_video_urls)
             
             # 如果通过"Original image"没有找到视频，再用正则表达式查找
-            if not direct_video_urls:
+            if full_parse and not direct_video_urls:
                 # 只匹配非waifu2x的.mp4链接
-                video_pattern = r'href="((?!.*waifu2x)[^"]*\.mp4[^"]*)"'
-                regex_matches = re.findall(video_pattern, response.text, re.IGNORECASE)
-                for match in regex_matches:
-                    if match.startswith('//'):
-                        match = 'https:' + match
-                    elif match.startswith('/'):
-                        match = 'https://rule34.xxx' + match
-                    
-                    # 标准化URL并去重
-                    normalized_url = self.normalize_video_url(match)
-                    
-                    if normalized_url and normalized_url not in processed_urls:
-                        if self.is_valid_video_url(match):
-                            # 只处理非waifu2x链接
-                            if 'waifu2x' not in match.lower():
-                                direct_video_urls.append(match)
-                                processed_urls.add(normalized_url)
-                            else:
-                                print(f"🚫 跳过waifu2x增强版链接")
-                        else:
-                            print(f"❌ URL无效")
-                    else:
-                        print(f"⚠️ 跳过重复URL")
+                regex_matches = self.video_href_pattern.findall(page_text)
+                self.collect_video_urls(regex_matches, processed_urls, direct_video_urls)
             
             # 只使用直接视频链接，完全跳过waifu2x链接
             if direct_video_urls:
@@ -704,136 +1153,470 @@ class Rule34FixedDownloader:
         
         # 生成唯一文件名 - 使用hash格式匹配配置文件中的命名规则
         # 从URL中提取hash部分（如果存在）或使用原始文件名
-        if '_' in name and len(name.split('_')[0]) == 32:  # 32位hash格式
-            hash_part = name.split('_')[0]
-            filename = f"{hash_part}_{post_id}{ext}"
+        hash_part = name.split('_', 1)[0]
+        if '_' in name and len(hash_part) == 32:  # 32位hash格式
+            base = f"{hash_part}_{post_id}"
         else:
             # 如果没有hash格式，使用原始文件名
-            filename = f"{name}_{post_id}{ext}"
+            base = f"{name}_{post_id}"
+        filename = f"{base}{ext}"
         
         filepath = os.path.join(download_dir, filename)
         
         # 检查文件名是否在配置文件中已存在或文件系统中已存在
         counter = 1
         while self.is_file_downloaded(filename) or os.path.exists(filepath):
-            if '_' in name and len(name.split('_')[0]) == 32:
-                hash_part = name.split('_')[0]
-                # 使用更明确的重复文件标识，避免与post_id混淆
-                filename = f"{hash_part}_{post_id}_duplicate_{counter}{ext}"
-            else:
-                filename = f"{name}_{post_id}_duplicate_{counter}{ext}"
+            # 使用更明确的重复文件标识，避免与post_id混淆
+            filename = f"{base}_duplicate_{counter}{ext}"
             filepath = os.path.join(download_dir, filename)
             counter += 1
         
         return filepath
     
-    def download_video(self, video_url, post_id, download_dir="downloads"):
-        """下载单个视频文件"""
-        try:
-            # 检查是否应该停止
-            if self.should_stop:
+    def prepare_download(self, video_url, post_id, download_dir="downloads"):
+        """下载前检查：URL/帖子/文件是否已存在，并登记活跃下载。返回目标路径，已存在时返回None
+        
+        停止信号由调用方在调用前检查，这里返回None只表示文件已存在。
+        """
+        # 检查是否已经下载过这个URL
+        with self.lock:
+            if video_url in self.downloaded_urls:
+                print(f"⚠️ URL已下载过，跳过")
                 return None
                 
-            # 检查是否已经下载过这个URL
-            with self.lock:
-                if video_url in self.downloaded_urls:
-                    print(f"⚠️ URL已下载过，跳过")
-                    return None
-                    
-                print(f"📥 开始下载帖子 {post_id}")
-                # 记录活跃下载任务
-                self.active_downloads.add(f"{post_id}_{video_url}")
-            
-            # 创建下载目录
-            os.makedirs(download_dir, exist_ok=True)
-            
-            # 先检查是否已经有相同post_id的文件存在
-            existing_files = self.find_files_by_post_id(post_id, download_dir)
-            if existing_files:
-                print(f"⚠️ 帖子 {post_id} 的文件已存在: {existing_files[0]}，跳过下载")
-                return None
-            
-            # 生成唯一文件名
-            filepath = self.generate_unique_filename(video_url, post_id, download_dir)
+            print(f"📥 开始下载帖子 {post_id}")
+            # 记录活跃下载任务
+            self.active_downloads.add(f"{post_id}_{video_url}")
+        
+        # 创建下载目录
+        os.makedirs(download_dir, exist_ok=True)
+        
+        # 先检查是否已经有相同post_id的文件存在
+        existing_files = self.find_files_by_post_id(post_id, download_dir)
+        if existing_files:
+            print(f"⚠️ 帖子 {post_id} 的文件已存在: {existing_files[0]}，跳过下载")
+            self.abort_download(video_url, post_id)
+            return None
+        
+        # 生成唯一文件名
+        filepath = self.generate_unique_filename(video_url, post_id, download_dir)
+        filename = os.path.basename(filepath)
+        
+        # 检查生成的文件名是否与已存在的文件重复
+        if self.is_file_downloaded(filename):
+            print(f"⚠️ 文件 {filename} 在配置文件中已存在，跳过下载")
+            self.abort_download(video_url, post_id)
+            return None
+        
+        # 检查文件是否已下载过（包括文件大小检查）
+        exists, reason = self.check_file_exists_with_size(filename, download_dir)
+        if exists:
+            print(f"⚠️ 文件 {filename} 已下载过 ({reason})，跳过")
+            self.abort_download(video_url, post_id)
+            return None
+        
+        return filepath
+    
+    def finish_download(self, video_url, post_id, filepath, md5=None):
+        """下载完成后更新计数和记录"""
+        filename = os.path.basename(filepath)
+        with self.lock:
+            print(f"\n✅ 下载完成: {filename}" + (" (MD5已校验)" if md5 else ""))
+            self.downloaded_count += 1
+            self.downloaded_urls.add(video_url)  # 记录URL避免重复
+            self.add_downloaded_file(filename, filepath, md5)  # 添加文件到记录并更新索引
+            # 移除活跃下载任务
+            self.active_downloads.discard(f"{post_id}_{video_url}")
+    
+    def abort_download(self, video_url, post_id):
+        """移除活跃下载任务"""
+        with self.lock:
+            self.active_downloads.discard(f"{post_id}_{video_url}")
+    
+    def get_part_paths(self, filepath):
+        """返回 (.part 临时文件路径, sidecar 元数据路径)"""
+        part_path = filepath + '.part'
+        return part_path, part_path + '.json'
+    
+    def load_part_meta(self, meta_path):
+        """读取 .part 的 sidecar 元数据（URL、预期长度、ETag）"""
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def save_part_meta(self, meta_path, meta):
+        """写入 sidecar 元数据（先写临时文件再原子替换）"""
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+    
+    def get_resume_state(self, video_url, filepath):
+        """检查是否可以续传，返回 (已下载字节数, 预期总长度, 请求头)"""
+        part_path, meta_path = self.get_part_paths(filepath)
+        headers = {'Accept-Encoding': 'identity'}  # 续传按原始字节计算偏移，不能压缩
+        meta = self.load_part_meta(meta_path)
+        if not meta or meta.get('url') != video_url or not os.path.exists(part_path):
+            return 0, 0, headers
+        if meta.get('segments') is not None:
+            # 分段下载的 .part 是预分配文件，不能按文件大小续传
+            return 0, 0, headers
+        
+        resume_from = os.path.getsize(part_path)
+        expected_length = meta.get('expected_length') or 0
+        if resume_from > 0:
+            headers['Range'] = f"bytes={resume_from}-"
+            # 文件在服务器上变化时 If-Range 会让服务器返回完整内容(200)
+            validator = meta.get('etag') or meta.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+        return resume_from, expected_length, headers
+    
+    def begin_part_file(self, video_url, filepath, resume_from, status_code, response_headers):
+        """根据响应决定续传或重新下载，写入 sidecar，返回 (打开模式, 起始偏移, 预期总长度)"""
+        part_path, meta_path = self.get_part_paths(filepath)
+        content_length = int(response_headers.get('content-length') or 0)
+        
+        if resume_from > 0 and status_code == 206:
+            # Content-Range: bytes START-END/TOTAL
+            match = re.match(r'bytes\s+(\d+)-\d+/(\d+|\*)', response_headers.get('content-range', ''))
+            if match and int(match.group(1)) == resume_from:
+                total = match.group(2)
+                expected_length = int(total) if total != '*' else resume_from + content_length
+                mode = 'ab'
+            else:
+                resume_from, expected_length, mode = 0, 0, 'wb'
+        else:
+            resume_from, expected_length, mode = 0, content_length, 'wb'
+        
+        if mode == 'wb' and status_code == 206:
+            raise IOError("服务器返回的Content-Range与续传偏移不一致")
+        
+        self.save_part_meta(meta_path, {
+            'url': video_url,
+            'expected_length': expected_length,
+            'etag': response_headers.get('etag'),
+            'last_modified': response_headers.get('last-modified')
+        })
+        return mode, resume_from, expected_length
+    
+    def get_expected_md5(self, filename, post_id=None):
+        """预期MD5：优先取文件名开头的32位hash，其次取API元数据"""
+        match = self.md5_filename_pattern.match(filename)
+        if match:
+            return match.group(1)
+        return self.post_metadata.get(str(post_id), {}).get('md5') or None
+    
+    def new_hasher(self, part_path=None):
+        """创建MD5计算器；续传时先读入 .part 中已有的内容。未启用校验时返回None"""
+        if not self.verify_md5:
+            return None
+        hasher = hashlib.md5()
+        if part_path:
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+        return hasher
+    
+    def discard_part_file(self, filepath):
+        """删除 .part 和 sidecar，下次从头下载"""
+        for path in self.get_part_paths(filepath):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def complete_part_file(self, filepath, downloaded_size, expected_length, post_id=None, hasher=None):
+        """校验长度和MD5后把 .part 原子重命名为最终文件，返回校验过的MD5（未校验时为None）
+
+        长度不足时保留 .part 以便续传；MD5不符时删除 .part。两者都抛出 DownloadVerificationError。
+        hasher 为下载过程中增量计算的MD5；为None时（整段续传、分段下载）读取 .part 计算一次。
+        """
+        with self.tracer.span("verify", post_id):
+            part_path, meta_path = self.get_part_paths(filepath)
             filename = os.path.basename(filepath)
-            
-            # 检查生成的文件名是否与已存在的文件重复
-            if self.is_file_downloaded(filename):
-                print(f"⚠️ 文件 {filename} 在配置文件中已存在，跳过下载")
-                return None
-            
-            # 检查文件是否已下载过（包括文件大小检查）
-            exists, reason = self.check_file_exists_with_size(filename, download_dir)
-            if exists:
-                print(f"⚠️ 文件 {filename} 已下载过 ({reason})，跳过")
-                return None
-            
-            # 下载文件
-            response = self.session.get(video_url, stream=True, timeout=60)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded_size = 0
-            
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    # 检查是否应该停止
-                    if self.should_stop:
-                        print(f"\n🛑 检测到停止信号，中断下载: {filename}")
-                        # 移除活跃下载任务
-                        with self.lock:
-                            self.active_downloads.discard(f"{post_id}_{video_url}")
-                        return None
-                    
-                    if chunk:
-                        f.write(chunk)
-                        downloaded_size += len(chunk)
-                        
-                        if total_size > 0:
-                            progress = (downloaded_size / total_size) * 100
-                            with self.lock:
-                                print(f"\r📊 下载进度: {progress:.1f}% ({downloaded_size}/{total_size} 字节)", end='')
-            
+            if expected_length and downloaded_size != expected_length:
+                raise DownloadVerificationError(
+                    f"下载不完整: {downloaded_size}/{expected_length} 字节，已保留 .part 以便续传"
+                )
+            
+            digest = None
+            expected_md5 = self.get_expected_md5(filename, post_id)
+            if self.verify_md5 and expected_md5:
+                if hasher is None:
+                    hasher = self.new_hasher(part_path)
+                digest = hasher.hexdigest()
+                if digest != expected_md5.lower():
+                    self.discard_part_file(filepath)
+                    raise DownloadVerificationError(f"MD5不匹配: 预期 {expected_md5}，实际 {digest}")
+            
+            os.replace(part_path, filepath)
+            try:
+                os.remove(meta_path)
+            except OSError:
+                pass
+            return digest
+    
+    def probe_media(self, video_url):
+        """HEAD探测媒体文件，返回 (大小, 是否支持Range, ETag/Last-Modified)"""
+        response = self.client.head(video_url, timeout=30, allow_redirects=True,
+                                    headers={'Accept-Encoding': 'identity'})
+        size = int(response.headers.get('content-length') or 0)
+        accepts_ranges = response.headers.get('accept-ranges', '').lower() == 'bytes'
+        validator = response.headers.get('etag') or response.headers.get('last-modified')
+        return size, accepts_ranges, validator
+    
+    def plan_segments(self, total_size):
+        """把文件切成若干 [起始, 结束, 已下载字节] 分段"""
+        count = max(1, min(self.segment_count, total_size // self.min_segment_size))
+        step = total_size // count
+        segments = []
+        for i in range(count):
+            start = i * step
+            end = total_size - 1 if i == count - 1 else (i + 1) * step - 1
+            segments.append([start, end, 0])
+        return segments
+    
+    def download_segmented(self, video_url, post_id, filepath, total_size, validator):
+        """分段并行下载到预分配的 .part 文件，支持按分段续传；完成返回校验过的MD5，中断返回False"""
+        part_path, meta_path = self.get_part_paths(filepath)
+        filename = os.path.basename(filepath)
+        
+        meta = self.load_part_meta(meta_path)
+        if (meta and meta.get('url') == video_url and meta.get('expected_length') == total_size
+                and meta.get('segments') and meta.get('etag') == validator and os.path.exists(part_path)):
+            segments = meta['segments']
+            done = sum(segment[2] for segment in segments)
             with self.lock:
-                print(f"\n✅ 下载完成: {filename}")
-                self.downloaded_count += 1
-                self.downloaded_urls.add(video_url)  # 记录URL避免重复
-                self.add_downloaded_file(filename)  # 添加文件到记录
-                # 移除活跃下载任务
-                self.active_downloads.discard(f"{post_id}_{video_url}")
+                print(f"⏯️ 分段续传 {filename}: 已完成 {done}/{total_size} 字节")
+        else:
+            segments = self.plan_segments(total_size)
+            with open(part_path, 'wb') as f:
+                f.truncate(total_size)  # 预分配
+        
+        meta = {'url': video_url, 'expected_length': total_size, 'etag': validator, 'segments': segments}
+        self.save_part_meta(meta_path, meta)
+        
+        with self.lock:
+            print(f"🧩 分段下载 {filename}: {total_size} 字节, {len(segments)} 段")
+        
+        def fetch_segment(index, segment):
+            start, end, done = segment
+            if start + done > end:
+                return
+            headers = {'Accept-Encoding': 'identity', 'Range': f"bytes={start + done}-{end}"}
+            if validator:
+                headers['If-Range'] = validator
+            with self.connection_slots:
+                transfer_start = time.perf_counter()
+                response = self.client.get(video_url, stream=True, timeout=60, headers=headers)
+                with response:
+                    if response.status_code != 206:
+                        raise IOError(f"服务器未按Range返回分段内容 (HTTP {response.status_code})")
+                    slot = self.progress.start_transfer(
+                        threading.current_thread().name, f"{filename}#{index + 1}", end - start + 1, done
+                    )
+                    write_time = bandwidth_wait = 0.0
+                    try:
+                        with open(part_path, 'r+b') as f:
+                            f.seek(start + done)
+                            for chunk in response.iter_content(chunk_size=65536):
+                                if self.should_stop:
+                                    return
+                                if chunk:
+                                    if self.bandwidth_budget:
+                                        bandwidth_wait += self.bandwidth_budget.consume(len(chunk))
+                                    write_start = time.perf_counter()
+                                    f.write(chunk)
+                                    write_time += time.perf_counter() - write_start
+                                    segment[2] += len(chunk)
+                                    slot.add(len(chunk))
+                    finally:
+                        self.progress.end_transfer(slot)
+                        self.trace_transfer(transfer_start, slot, write_time, bandwidth_wait, post_id, segment=index)
+        
+        errors = []
+        with ThreadPoolExecutor(max_workers=len(segments), thread_name_prefix="segment") as executor:
+            for future in [executor.submit(fetch_segment, index, segment)
+                           for index, segment in enumerate(segments)]:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(e)
+        
+        # 保存分段进度，中断或失败后下次从断点继续
+        self.save_part_meta(meta_path, meta)
+        if self.should_stop:
+            return False
+        if errors:
+            raise errors[0]
+        
+        # 分段乱序写入，无法边写边算MD5，完成后读取一次
+        return self.complete_part_file(filepath, sum(segment[2] for segment in segments), total_size, post_id)
+    
+    def download_video(self, video_url, post_id, download_dir="downloads"):
+        """下载单个视频文件：写入 .part，支持 Range 续传，校验通过后原子重命名；校验失败时重新下载
+        
+        返回 (状态, 文件路径)，状态为 downloaded（新下载）/ exists（已存在，路径为None）/
+        stopped（收到停止信号，保留 .part）/ failed（出错或多次校验失败）
+        """
+        if self.should_stop:
+            return "stopped", None
+        start = time.monotonic()
+        try:
+            filepath = self.prepare_download(video_url, post_id, download_dir)
+            if not filepath:
+                return "exists", None
             
-            return filepath
+            with self.tracer.span("download", post_id):
+                for attempt in range(1, self.download_attempts + 1):
+                    try:
+                        result = self.transfer_media(video_url, post_id, filepath)
+                        self.file_seconds.observe(time.monotonic() - start, result="ok" if result else "stopped")
+                        return ("downloaded", result) if result else ("stopped", None)
+                    except DownloadVerificationError as e:
+                        if attempt >= self.download_attempts or self.should_stop:
+                            raise
+                        with self.lock:
+                            print(f"\n⚠️ {os.path.basename(filepath)} 校验失败: {e}，重新下载 "
+                                  f"(尝试 {attempt + 1}/{self.download_attempts})")
             
         except Exception as e:
+            self.file_seconds.observe(time.monotonic() - start, result="error")
             with self.lock:
                 print(f"\n❌ 下载失败: {e}")
                 # 移除活跃下载任务
                 self.active_downloads.discard(f"{post_id}_{video_url}")
-            return None
+            return "failed", None
     
-    def process_single_post(self, post_id, download_dir="downloads"):
-        """处理单个帖子"""
-        # 检查是否应该停止
-        if self.should_stop:
-            return []
-            
-        with self.lock:
-            print(f"🔄 开始处理帖子 {post_id}...")
+    def transfer_media(self, video_url, post_id, filepath):
+        """传输一次媒体文件（分段或单连接），边写边计算MD5；完成返回路径，中断返回None"""
+        filename = os.path.basename(filepath)
+        part_path, _ = self.get_part_paths(filepath)
+        
+        # 大文件分段下载
+        if self.segmented_enabled:
+            total_size, accepts_ranges, validator = self.probe_media(video_url)
+            if accepts_ranges and total_size >= self.segment_threshold:
+                md5 = self.download_segmented(video_url, post_id, filepath, total_size, validator)
+                if md5 is False:
+                    print(f"\n🛑 检测到停止信号，中断下载: {filename}")
+                    self.abort_download(video_url, post_id)
+                    return None
+                self.finish_download(video_url, post_id, filepath, md5)
+                return filepath
         
-        video_urls = self.extract_video_url_from_post(post_id)
-        downloaded_files = []
-        processed_successfully = False
+        resume_from, expected_length, headers = self.get_resume_state(video_url, filepath)
+        if resume_from and resume_from == expected_length:
+            # 上次已经下载完整，只差校验和重命名
+            md5 = self.complete_part_file(filepath, resume_from, expected_length, post_id)
+            self.finish_download(video_url, post_id, filepath, md5)
+            return filepath
+        if resume_from:
+            with self.lock:
+                print(f"⏯️ 续传 {filename}: 从 {resume_from} 字节开始")
+        
+        # 下载文件（占用一个全局媒体连接）
+        self.connection_slots.acquire()
+        transfer_start = time.perf_counter()
+        try:
+            try:
+                response = self.client.get(video_url, stream=True, timeout=60, headers=headers)
+            except requests.exceptions.HTTPError as e:
+                if resume_from and e.response is not None and e.response.status_code == 416:
+                    # 请求范围超出文件末尾：.part 已包含完整内容
+                    md5 = self.complete_part_file(filepath, resume_from, 0, post_id)
+                    self.finish_download(video_url, post_id, filepath, md5)
+                    return filepath
+                raise
+            
+            with response:
+                mode, downloaded_size, total_size = self.begin_part_file(
+                    video_url, filepath, resume_from, response.status_code, response.headers
+                )
+                hasher = self.new_hasher(part_path if mode == 'ab' else None)
+                slot = self.progress.start_transfer(
+                    threading.current_thread().name, filename, total_size, downloaded_size
+                )
+                write_time = bandwidth_wait = 0.0
+                
+                try:
+                    with open(part_path, mode) as f:
+                        for chunk in response.iter_content(chunk_size=65536):
+                            # 检查是否应该停止（保留 .part 以便下次续传）
+                            if self.should_stop:
+                                print(f"\n🛑 检测到停止信号，中断下载: {filename}")
+                                self.abort_download(video_url, post_id)
+                                return None
+                            if chunk:
+                                if self.bandwidth_budget:
+                                    bandwidth_wait += self.bandwidth_budget.consume(len(chunk))
+                                write_start = time.perf_counter()
+                                f.write(chunk)
+                                write_time += time.perf_counter() - write_start
+                                if hasher:
+                                    hasher.update(chunk)
+                                slot.add(len(chunk))
+                finally:
+                    self.progress.end_transfer(slot)
+                    self.trace_transfer(transfer_start, slot, write_time, bandwidth_wait)
+        finally:
+            self.connection_slots.release()
         
+        md5 = self.complete_part_file(filepath, slot.downloaded, total_size, post_id, hasher)
+        self.finish_download(video_url, post_id, filepath, md5)
+        return filepath
+    
+    def trace_transfer(self, started, slot, write_time, bandwidth_wait, post_id=None, **attrs):
+        """记录一次传输的 transfer / disk.write / sleep.bandwidth 三个span"""
+        if not self.tracer.enabled:
+            return
+        self.tracer.record("transfer", time.perf_counter() - started, post_id,
+                           bytes=slot.downloaded - slot.started, **attrs)
+        self.tracer.record("disk.write", write_time, post_id, **attrs)
+        if bandwidth_wait:
+            self.tracer.record("sleep.bandwidth", bandwidth_wait, post_id, **attrs)
+    
+    def get_expected_size(self, post_id, video_urls):
+        """帖子媒体的预计大小（字节）：优先使用API元数据，启用 probe_size 时HEAD探测；未知返回None"""
+        size = self.post_metadata.get(str(post_id), {}).get('size')
+        if size:
+            return int(size)
+        if not self.probe_sizes or self.schedule_policy not in ("shortest", "size_classes"):
+            return None
+        total = 0
         for video_url in video_urls:
-            filepath = self.download_video(video_url, post_id, download_dir)
-            if filepath:
-                downloaded_files.append(filepath)
-                processed_successfully = True
-            else:
-                # 即使文件已存在，也算处理成功
-                processed_successfully = True
-            time.sleep(3)  # 每个视频间隔3秒
+            try:
+                total += self.probe_media(video_url)[0]
+            except Exception:
+                return None
+        return total or None
+    
+    def order_post_ids(self, post_ids):
+        """按调度策略排列待下载的帖子（使用列表阶段已知的大小）"""
+        sizes = {}
+        for post_id in post_ids:
+            size = self.post_metadata.get(str(post_id), {}).get('size')
+            if size:
+                sizes[post_id] = int(size)
+        return DownloadScheduler(self.schedule_policy, size_classes_mb=self.size_classes_mb).order(post_ids, sizes)
+    
+    def record_download_result(self, post_id, downloaded_files, statuses):
+        """所有文件都已下载或已存在时记录帖子，返回是否已记录
         
+        有文件被中断或下载失败时不记录，下次运行会重新处理该帖子并续传 .part
+        """
+        if all(status in ("downloaded", "exists") for status in statuses):
+            self.record_post_result(post_id, downloaded_files, True)
+            return True
+        with self.lock:
+            print(f"⚠️ 帖子 {post_id} 有文件未完成下载，未记录（下次运行将继续）")
+        return False
+    
+    def record_post_result(self, post_id, downloaded_files, processed_successfully):
+        """记录帖子处理结果"""
         # 无论是否下载新文件，都记录帖子为已处理
         if processed_successfully:
             self.add_detected_post(post_id)
@@ -843,152 +1626,413 @@ class Rule34FixedDownloader:
                 print(f"✅ 帖子 {post_id} 文件已存在，已记录")
         else:
             print(f"⚠️ 帖子 {post_id} 无有效视频，未记录")
+    
+    def get_tag_key(self, tags):
+        """标签查询的规范化键（与顺序和分隔符无关）"""
+        return ' '.join(sorted(tag for tag in re.split(r'[+\s]+', tags) if tag))
+    
+    def begin_crawl(self, tags):
+        """开始抓取：读取标签高水位，返回 (实际查询标签, 高水位)；全量模式下高水位为None"""
+        self.crawl_max_post_id = 0
+        watermark = None if self.full_rescan else self.store.get_watermark(self.get_tag_key(tags))
+        if watermark is None:
+            print("📚 全量抓取: 从第一页开始检查所有帖子")
+            return tags, None
+        print(f"📈 增量抓取: 只获取ID大于 {watermark} 的新帖子（设置 full_rescan 可全量重扫）")
+        return f"{tags}+id:>{watermark}", watermark
+    
+    def note_listing_page(self, page_post_ids):
+        """记录本次抓取见到的最大帖子ID"""
+        for post_id in page_post_ids:
+            if str(post_id).isdigit():
+                self.crawl_max_post_id = max(self.crawl_max_post_id, int(post_id))
+    
+    def finish_crawl(self, tags, complete):
+        """抓取完整结束（没有中断、没有未完成页面）时推进标签高水位"""
+        if not complete or self.should_stop or not self.crawl_max_post_id:
+            return
+        tag_key = self.get_tag_key(tags)
+        watermark = max(self.store.get_watermark(tag_key) or 0, self.crawl_max_post_id)
+        self.store.set_watermark(tag_key, watermark)
+        print(f"📈 已更新标签高水位: {tag_key} -> {watermark}")
+    
+    def build_page_url(self, tags, pid):
+        """构建搜索结果页URL"""
+        return f"{self.base_url}/index.php?page=post&s=list&tags={tags}&pid={pid}"
+    
+    def build_post_url(self, post_id):
+        """构建帖子页URL"""
+        return f"{self.base_url}/index.php?page=post&s=view&id={post_id}"
+    
+    def build_api_url(self, tags, page_index):
+        """构建dapi列表URL（pid为页码，每页最多1000个帖子）"""
+        url = (f"{self.api_base_url}/index.php?page=dapi&s=post&q=index&json=1"
+               f"&limit={self.api_page_limit}&pid={page_index}&tags={tags}")
+        if self.api_key and self.user_id:
+            url += f"&api_key={self.api_key}&user_id={self.user_id}"
+        return url
+    
+    def parse_api_posts(self, response_text):
+        """解析dapi的JSON响应，返回帖子元数据列表；响应不是有效的帖子列表时返回None"""
+        if not response_text.strip():
+            return []  # 没有结果时接口返回空内容
+        try:
+            data = json.loads(response_text)
+        except ValueError:
+            return None
+        if isinstance(data, dict):
+            data = data.get('post', data.get('posts'))
+        if not isinstance(data, list):
+            return None
         
-        return downloaded_files
+        posts = []
+        for item in data:
+            if not isinstance(item, dict) or 'id' not in item:
+                continue
+            file_url = item.get('file_url') or ''
+            if file_url.startswith('//'):
+                file_url = 'https:' + file_url
+            posts.append({
+                "post_id": str(item['id']),
+                "file_url": file_url,
+                "md5": item.get('hash') or item.get('md5'),
+                "size": item.get('size') or item.get('file_size'),
+                "tags": item.get('tags', '')
+            })
+        return posts
+    
+    def extract_posts_from_api(self, tags, page_index):
+        """通过dapi接口获取一页帖子，接口不可用时返回None"""
+        api_url = self.build_api_url(tags, page_index)
+        try:
+            page_text = self.fetch_page_text(api_url, self.listing_ttl)
+        except requests.exceptions.RequestException as e:
+            with self.lock:
+                print(f"⚠️ API请求失败: {e}")
+            return None
+        
+        posts = self.parse_api_posts(page_text)
+        if posts is None:
+            with self.lock:
+                print(f"⚠️ API返回了无法识别的内容: {page_text[:100]!r}")
+        return posts
+    
+    def fetch_listing_page(self, tags, page_index, use_api):
+        """抓取一个列表页，返回 (帖子ID列表, {post_id: [视频URL]})；抓取或解析失败时返回None"""
+        with self.tracer.span("listing", page=page_index):
+            if not use_api:
+                page_url = self.build_page_url(tags, page_index * self.posts_per_page)
+                posts = self.extract_listing_from_page(page_url, show_details=False)
+                return self.index_listing_posts(posts) if posts is not None else None
+            
+            posts = self.extract_posts_from_api(tags, page_index)
+            if posts is None:
+                return None
+            return self.index_api_posts(posts)
+    
+    def index_api_posts(self, posts):
+        """记录API帖子元数据，返回 (帖子ID列表, {post_id: [视频URL]})"""
+        post_ids = []
+        known_urls = {}
+        for post in posts:
+            post_ids.append(post["post_id"])
+            self.post_metadata[post["post_id"]] = post
+            if post["file_url"]:
+                if self.is_valid_video_url(post["file_url"]):
+                    known_urls[post["post_id"]] = [post["file_url"]]
+                else:
+                    known_urls[post["post_id"]] = []  # 非视频帖子
+            # file_url为空时回退到抓取帖子页
+        return post_ids, known_urls
+    
+    def index_listing_posts(self, posts):
+        """记录列表页缩略图中的MD5/文件夹（不覆盖API元数据），返回 (帖子ID列表, {})"""
+        for post in posts:
+            if post["md5"]:
+                self.post_metadata.setdefault(post["post_id"], post)
+        return [post["post_id"] for post in posts], {}
+    
+    def check_page_completion(self, page_num, page_post_ids):
+        """页面完成检查，返回未完成的帖子ID列表；有未完成帖子时保存进度"""
+        print(f"💾 步骤3: 检查第 {page_num} 页完成情况...")
+        
+        # 检查是否所有帖子都处理完成
+        remaining_posts = [post_id for post_id in page_post_ids if post_id not in self.detected_posts]
+        
+        if remaining_posts:
+            print(f"⚠️ 第 {page_num} 页还有 {len(remaining_posts)} 个帖子未完成:")
+            for post_id in remaining_posts:
+                print(f"  - 帖子ID: {post_id}")
+            print(f"💾 保存当前进度，下次运行将从第 {page_num} 页继续...")
+            # 保存当前进度并停止
+            self.save_detected_posts()
+        else:
+            print(f"✅ 第 {page_num} 页所有帖子处理完成!")
+        return remaining_posts
+    
+    def print_page_statistics(self, page_num, page_post_ids, remaining_posts, page_downloaded_files,
+                              total_processed_posts, all_downloaded_files):
+        """打印单页统计信息"""
+        print(f"\n📊 第 {page_num} 页统计:")
+        print(f"  总帖子数: {len(page_post_ids)}")
+        print(f"  已处理: {len(page_post_ids) - len(remaining_posts)}")
+        print(f"  剩余: {len(remaining_posts)}")
+        print(f"  下载文件: {len(page_downloaded_files)}")
+        print(f"  累计处理: {total_processed_posts}")
+        print(f"  累计下载: {len(all_downloaded_files)}")
+    
+    def download_page_posts(self, post_ids, download_dir="downloads", known_urls=None):
+        """并发处理一页中的帖子，等待全部结束后返回 (下载文件列表, 已处理帖子数)"""
+        known_urls = known_urls or {}
+        page_downloaded_files = []
+        page_processed_posts = 0
+        page_start = time.monotonic()
+        
+        pipeline = self.get_pipeline()
+        # 提交当前页的任务：解析线程抓取帖子页，下载线程按调度策略从有界队列取出下载
+        future_to_post = {
+            pipeline.submit(post_id, download_dir, known_urls.get(post_id)): post_id 
+            for post_id in self.order_post_ids(post_ids)
+        }
+        pending = set(future_to_post)
+        
+        # 每秒检查一次停止信号，直到所有任务完成
+        while pending:
+            done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                post_id = future_to_post[future]
+                if future.cancelled():
+                    continue
+                try:
+                    downloaded_files = future.result()
+                    if downloaded_files:  # 只有成功下载新文件才计数
+                        page_downloaded_files.extend(downloaded_files)
+                    
+                    # 无论是否下载新文件，都算处理了一个帖子
+                    page_processed_posts += 1
+                    
+                    # 进度基于已处理的帖子数量
+                    progress = (page_processed_posts / len(post_ids)) * 100
+                    
+                    with self.lock:
+                        print(f"📈 页面进度: {progress:.1f}% ({page_processed_posts}/{len(post_ids)}) - 帖子 {post_id}")
+                        
+                except Exception as e:
+                    with self.lock:
+                        print(f"❌ 处理帖子 {post_id} 时出错: {e}")
+            
+            if self.should_stop and pending:
+                print("\n🛑 检测到停止信号，取消剩余任务...")
+                # 取消所有未开始的任务，正在运行的任务会自行检查停止标志
+                for future in pending:
+                    future.cancel()
+        
+        self.page_seconds.observe(time.monotonic() - page_start)
+        return page_downloaded_files, page_processed_posts
     
     def download_videos_by_tags(self, tags, download_dir="downloads"):
         """根据标签下载视频，逐页处理：检测一页→下载一页→记录→下一页"""
+        self.progress.start()
+        try:
+            if self.engine == "async":
+                if async_engine.is_available():
+                    self.async_engine = async_engine.AsyncDownloadEngine(self, max_concurrency=self.async_concurrency)
+                    try:
+                        return self.async_engine.run(tags, download_dir)
+                    finally:
+                        self.async_engine = None
+                print("⚠️ 未安装 aiohttp，asyncio模式不可用，回退到线程池模式")
+            return self.download_pages_threaded(tags, download_dir)
+        finally:
+            self.progress.stop()
+    
+    def download_pages_threaded(self, tags, download_dir="downloads"):
+        """线程池模式的逐页处理循环"""
         print("🚀 Rule34 修复版视频下载器")
         print("="*80)
         print(f"🏷️ 搜索标签: {tags}")
         print(f"📄 页数: 动态检测")
         print(f"🧵 并发线程数: {self.max_workers}")
-        print(f"📦 处理模式: 逐页处理")
+        print(f"📦 处理模式: 逐页处理 ({'API' if self.listing_mode == 'api' else 'HTML'}列表)")
         print("="*80)
         
         # 初始化页面参数
         page_num = 1
-        pid = 0
+        page_index = 0
+        use_api = self.listing_mode == "api"
+        query_tags, _ = self.begin_crawl(tags)
+        crawl_complete = False
         
         all_downloaded_files = []
         total_processed_posts = 0
         
-        # 逐页处理：检测一页，下载一页
-        while True:
-            if self.should_stop:
-                print("\n🛑 检测到停止信号，停止处理...")
-                break
-            
-            print(f"\n🔄 开始处理第 {page_num} 页")
-            print("="*60)
-            
-            # 构建当前页URL
-            page_url = f"https://rule34.xxx/index.php?page=post&s=list&tags={tags}&pid={pid}"
-            print(f"🔗 URL: {page_url}")
-            
-            # 步骤1: 检测当前页的帖子ID
-            print(f"🔍 步骤1: 检测第 {page_num} 页的帖子...")
-            page_post_ids = self.extract_post_ids_from_page(page_url, show_details=True)
-            
-            if not page_post_ids:
-                print(f"📄 第 {page_num} 页没有找到内容，停止搜索")
-                break
-            
-            # 过滤掉已检测的帖子
-            new_post_ids = [post_id for post_id in page_post_ids if post_id not in self.detected_posts]
-            
-            print(f"📋 第 {page_num} 页检测到 {len(page_post_ids)} 个帖子")
-            print(f"🆕 其中 {len(new_post_ids)} 个新帖子需要处理")
-            print(f"⏭️ 跳过已检测: {len(page_post_ids) - len(new_post_ids)} 个")
-            
-            if not new_post_ids:
-                print(f"⏭️ 第 {page_num} 页无新帖子，跳过")
-                # 继续下一页
-                page_num += 1
-                pid += 42
-                time.sleep(5)  # 保持间隔
-                continue
-            
-            # 步骤2: 下载当前页的所有帖子
-            print(f"📥 步骤2: 下载第 {page_num} 页的帖子...")
-            page_downloaded_files = []
-            page_processed_posts = 0
-            
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                # 提交当前页的任务
-                future_to_post = {
-                    executor.submit(self.process_single_post, post_id, download_dir): post_id 
-                    for post_id in new_post_ids
-                }
+        # 列表页预取：单线程按顺序抓取当前页及后续 prefetch_pages 页
+        listing_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="listing")
+        prefetched_pages = {}  # page_index -> Future[(帖子ID列表, 已知视频URL)]
+        
+        try:
+            # 逐页处理：检测一页，下载一页（后续页面在后台预取）
+            while True:
+                if self.should_stop:
+                    print("\n🛑 检测到停止信号，停止处理...")
+                    break
                 
-                # 处理完成的任务
-                try:
-                    for future in as_completed(future_to_post, timeout=1):
-                        # 检查是否应该停止
-                        if self.should_stop:
-                            print("\n🛑 检测到停止信号，取消剩余任务...")
-                            # 取消所有未完成的任务
-                            for f in future_to_post:
-                                f.cancel()
-                            break
-                            
-                        post_id = future_to_post[future]
-                        try:
-                            downloaded_files = future.result()
-                            if downloaded_files:  # 只有成功下载新文件才计数
-                                page_downloaded_files.extend(downloaded_files)
-                            
-                            # 无论是否下载新文件，都算处理了一个帖子
-                            page_processed_posts += 1
-                            
-                            # 进度基于已处理的帖子数量
-                            progress = (page_processed_posts / len(new_post_ids)) * 100
-                            
-                            with self.lock:
-                                print(f"📈 页面进度: {progress:.1f}% ({page_processed_posts}/{len(new_post_ids)}) - 帖子 {post_id}")
-                                
-                        except Exception as e:
-                            with self.lock:
-                                print(f"❌ 处理帖子 {post_id} 时出错: {e}")
-                except TimeoutError:
-                    # 超时检查是否应该停止
-                    if self.should_stop:
-                        print("\n🛑 检测到停止信号，取消剩余任务...")
-                        for f in future_to_post:
-                            f.cancel()
-                        break
-            
-            # 步骤3: 页面完成检查
-            print(f"💾 步骤3: 检查第 {page_num} 页完成情况...")
-            
-            # 检查是否所有帖子都处理完成
-            remaining_posts = [post_id for post_id in page_post_ids if post_id not in self.detected_posts]
-            
-            if remaining_posts:
-                print(f"⚠️ 第 {page_num} 页还有 {len(remaining_posts)} 个帖子未完成:")
-                for post_id in remaining_posts:
-                    print(f"  - 帖子ID: {post_id}")
-                print(f"💾 保存当前进度，下次运行将从第 {page_num} 页继续...")
-                # 保存当前进度并停止
-                self.save_detected_posts()
-                break
-            else:
-                print(f"✅ 第 {page_num} 页所有帖子处理完成!")
+                print(f"\n🔄 开始处理第 {page_num} 页")
+                print("="*60)
+                
+                # 构建当前页URL
+                if use_api:
+                    page_url = self.build_api_url(query_tags, page_index)
+                else:
+                    page_url = self.build_page_url(query_tags, page_index * self.posts_per_page)
+                print(f"🔗 URL: {page_url}")
+                
+                # 提交当前页和预取页的抓取任务
+                for ahead_index in range(page_index, page_index + self.prefetch_pages + 1):
+                    if ahead_index not in prefetched_pages:
+                        prefetched_pages[ahead_index] = listing_executor.submit(
+                            self.fetch_listing_page, query_tags, ahead_index, use_api
+                        )
+                
+                # 步骤1: 检测当前页的帖子ID
+                print(f"🔍 步骤1: 检测第 {page_num} 页的帖子...")
+                listing = prefetched_pages.pop(page_index).result()
+                
+                if listing is None:
+                    for future in prefetched_pages.values():
+                        future.cancel()
+                    prefetched_pages.clear()
+                    if use_api and page_index == 0:
+                        # 第一页API就不可用：整个任务回退到HTML解析模式
+                        print("⚠️ API列表不可用，回退到HTML列表模式")
+                        use_api = False
+                        continue
+                    # 抓取失败不等于没有更多帖子：不标记抓取完整，标签高水位保持不变
+                    print(f"❌ 第 {page_num} 页{'API' if use_api else '列表页'}请求失败，保存进度并停止（不更新高水位）")
+                    self.save_detected_posts()
+                    break
+                
+                page_post_ids, known_urls = listing
+                self.print_page_post_ids(page_post_ids)
+                self.note_listing_page(page_post_ids)
+                
+                if not page_post_ids:
+                    print(f"📄 第 {page_num} 页没有找到内容，停止搜索")
+                    crawl_complete = True
+                    break
+                
+                # 过滤掉已检测的帖子
+                new_post_ids = [post_id for post_id in page_post_ids if post_id not in self.detected_posts]
+                
+                print(f"📋 第 {page_num} 页检测到 {len(page_post_ids)} 个帖子")
+                print(f"🆕 其中 {len(new_post_ids)} 个新帖子需要处理")
+                print(f"⏭️ 跳过已检测: {len(page_post_ids) - len(new_post_ids)} 个")
+                
+                if not new_post_ids:
+                    # 增量模式下 id:> 过滤返回的都是高水位之后的帖子，整页已检测不代表后续页面也已处理，
+                    # 因此与全量模式一样继续翻页，直到空页才算抓取完整
+                    print(f"⏭️ 第 {page_num} 页无新帖子，跳过")
+                    # 继续下一页
+                    page_num += 1
+                    page_index += 1
+                    continue
+                
+                # 本地存档中已有相同MD5文件的帖子不再抓取帖子页
+                new_post_ids = self.skip_known_md5_posts(new_post_ids, download_dir)
+                if not new_post_ids:
+                    print(f"⏭️ 第 {page_num} 页新帖子的文件均已存在，跳过")
+                    self.save_detected_posts()
+                    page_num += 1
+                    page_index += 1
+                    continue
+                
+                # 步骤2: 下载当前页的所有帖子
+                print(f"📥 步骤2: 下载第 {page_num} 页的帖子...")
+                page_downloaded_files, page_processed_posts = self.download_page_posts(
+                    new_post_ids, download_dir, known_urls
+                )
+                
+                # 步骤3: 页面完成检查（所有任务结束后才判定）
+                remaining_posts = self.check_page_completion(page_num, page_post_ids)
+                
+                if remaining_posts:
+                    break
                 all_downloaded_files.extend(page_downloaded_files)
                 total_processed_posts += page_processed_posts
-            
-            print(f"\n📊 第 {page_num} 页统计:")
-            print(f"  总帖子数: {len(page_post_ids)}")
-            print(f"  已处理: {len(page_post_ids) - len(remaining_posts)}")
-            print(f"  剩余: {len(remaining_posts)}")
-            print(f"  下载文件: {len(page_downloaded_files)}")
-            print(f"  累计处理: {total_processed_posts}")
-            print(f"  累计下载: {len(all_downloaded_files)}")
-            
-            # 保存当前进度
-            self.save_detected_posts()
-            
-            # 准备下一页
-            page_num += 1
-            pid += 42
-            
-            # 页面间隔
-            print(f"⏳ 等待5秒后处理下一页...")
-            time.sleep(5)
+                
+                self.print_page_statistics(page_num, page_post_ids, remaining_posts, page_downloaded_files,
+                                           total_processed_posts, all_downloaded_files)
+                
+                # 保存当前进度
+                self.save_detected_posts()
+                
+                # 准备下一页
+                page_num += 1
+                page_index += 1
+        finally:
+            for future in prefetched_pages.values():
+                future.cancel()
+            listing_executor.shutdown(wait=False)
         
+        self.finish_crawl(tags, crawl_complete)
         self.total_posts = total_processed_posts
         return all_downloaded_files
     
+    def download_batch(self, queries):
+        """批量模式：按优先级依次处理多个标签查询
+
+        所有查询共用同一个会话、限速器、页面缓存和下载线程池；帖子记录是全局的，
+        已被前面查询处理过的帖子在后面的查询中直接跳过，不会重复抓取或下载。
+        """
+        results = []
+        for i, query in enumerate(queries, 1):
+            if self.should_stop:
+                print("\n🛑 检测到停止信号，跳过剩余批量任务")
+                break
+            print("\n" + "#"*80)
+            print(f"📦 批量任务 {i}/{len(queries)}: {query['tags']} -> {query['download_dir']} "
+                  f"(优先级 {query['priority']})")
+            print("#"*80)
+            downloaded_files = self.download_videos_by_tags(query['tags'], query['download_dir'])
+            results.append({
+                'tags': query['tags'],
+                'download_dir': query['download_dir'],
+                'priority': query['priority'],
+                'total_posts': self.total_posts,
+                'downloaded_files': downloaded_files
+            })
+        return results
+    
+    def save_batch_results(self, results, filename="download_results.json"):
+        """保存批量下载结果"""
+        data = {
+            'download_time': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'batch': True,
+            'downloaded_count': self.downloaded_count,
+            'md5_skipped_posts': self.md5_skipped,
+            'queries': results
+        }
+        performance = self.get_performance_report()
+        if performance:
+            data['performance'] = performance
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"💾 批量结果已保存到: {filename}")
+    
+    def print_batch_statistics(self, results):
+        """打印批量任务统计"""
+        print("\n" + "="*80)
+        print("📊 批量任务统计")
+        print("="*80)
+        for result in results:
+            print(f"🏷️ {result['tags']}: 处理 {result['total_posts']} 个帖子, "
+                  f"下载 {len(result['downloaded_files'])} 个文件 -> {result['download_dir']}")
+        total_files = sum(len(result['downloaded_files']) for result in results)
+        print(f"📥 合计下载: {total_files} 个文件")
+        self.print_connection_statistics()
+        print("="*80)
+    
     def save_results(self, downloaded_files, tags, filename="download_results.json"):
         """保存下载结果"""
         data = {
@@ -996,8 +2040,12 @@ class Rule34FixedDownloader:
             'tags': tags,
             'total_posts': self.total_posts,
             'downloaded_count': self.downloaded_count,
+            'md5_skipped_posts': self.md5_skipped,
             'downloaded_files': downloaded_files
         }
+        performance = self.get_performance_report()
+        if performance:
+            data['performance'] = performance
         
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
@@ -1013,6 +2061,47 @@ class Rule34FixedDownloader:
             print(f"   📝 示例文件名: {list(self.downloaded_files)[:3]}...")
         print("="*50)
 
+    def get_performance_report(self):
+        """启用计时时返回各阶段 p50/p95/p99 和等待占比，否则返回None"""
+        self.tracer.flush()
+        return self.tracer.summary(self.resolve_stats.workers + self.download_stats.workers)
+    
+    def print_performance_report(self):
+        """打印各阶段耗时分布"""
+        report = self.get_performance_report()
+        if not report:
+            return
+        print(f"⏱️ 阶段耗时 (秒, 明细见 {report['trace_file']}):")
+        print(f"   {'阶段':<18}{'次数':>6}{'合计':>10}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for name, stage in report['stages'].items():
+            print(f"   {name:<18}{stage['count']:>6}{stage['total']:>10.2f}{stage['p50']:>9.3f}"
+                  f"{stage['p95']:>9.3f}{stage['p99']:>9.3f}")
+        print(f"   💤 等待合计 {report['sleep_seconds']:.1f} 秒, 占并发时间的 {report['sleep_share'] * 100:.1f}%")
+    
+    def print_connection_statistics(self):
+        """打印连接池和页面缓存统计"""
+        for name, label in (("page", "页面/API"), ("media", "媒体")):
+            stats = self.pools.stats()[name]
+            if not stats['requests']:
+                continue
+            protocol = " HTTP/2" if stats.get("http2") else ""
+            print(f"🔌 {label}连接池{protocol} (大小 {stats['size']}): {stats['requests']} 个请求, "
+                  f"复用 {stats['hits']} 次, 新建连接 {stats['misses']} 次")
+        if self.page_cache:
+            stats = self.page_cache.stats()
+            print(f"🗂️ 页面缓存: 命中 {stats['hits']}, 304 {stats['revalidated']}, 未命中 {stats['misses']}")
+        if self.md5_skipped:
+            print(f"🧬 MD5索引: {self.md5_skipped} 个帖子的文件已在本地存档，未抓取帖子页")
+        for stage in (self.resolve_stats, self.download_stats):
+            stats = stage.snapshot()
+            blocked = "等待队列空位" if stage is self.resolve_stats else "等待任务"
+            print(f"⚙️ {stats['name']}阶段 ({stats['workers']} 并发): 处理 {stats['items']} 个帖子, "
+                  f"失败 {stats['errors']}, 平均 {stats['avg']:.2f} 秒, {blocked} {stats['blocked']:.1f} 秒")
+        if self.bandwidth_budget:
+            print(f"🚦 带宽预算: {self.bandwidth_budget.rate / (1024 * 1024):.1f} MB/s, "
+                  f"累计限速等待 {self.bandwidth_budget.total_wait:.1f} 秒")
+        self.print_performance_report()
+    
     def print_final_statistics(self, downloaded_files, tags):
         """打印最终统计信息"""
         print("\n" + "="*80)
@@ -1024,6 +2113,7 @@ class Rule34FixedDownloader:
         print(f"❌ 下载失败: {self.total_posts - len(downloaded_files)}")
         print(f"📈 成功率: {(len(downloaded_files)/self.total_posts*100):.1f}%" if self.total_posts > 0 else "0%")
         print(f"🔄 重复文件检查: 已跳过 {len(self.downloaded_files)} 个已存在的文件")
+        self.print_connection_statistics()
         
         if downloaded_files:
             print(f"\n📁 下载的文件:")
@@ -1111,34 +2201,101 @@ def get_user_input():
         
         return tags, max_workers
 
+def run_batch(downloader, batch_file, max_workers, async_concurrency):
+    """批量模式：一个进程内按优先级依次处理批量文件中的所有标签查询"""
+    try:
+        queries = load_batch_queries(batch_file)
+    except Exception as e:
+        print(f"❌ 读取批量任务文件失败 {batch_file}: {e}")
+        return
+    if not queries:
+        print(f"❌ 批量任务文件 {batch_file} 中没有有效的查询")
+        return
+    
+    print(f"📦 批量模式: {len(queries)} 个查询, {max_workers} 个并发线程")
+    for query in queries:
+        print(f"   🏷️ [{query['priority']}] {query['tags']} -> {query['download_dir']}")
+    
+    # 每个查询目录单独扫描（不扫描公共上级目录：可能是根目录或位于不同驱动器），
+    # 文件记录按目录分别替换
+    download_dirs = list(dict.fromkeys(query['download_dir'] for query in queries))
+    for download_dir in download_dirs:
+        print(f"📁 正在自动扫描 {download_dir} 文件夹...")
+        snapshot = downloader.sync_existing_files(download_dir)
+        downloader.save_downloaded_files(download_dir, snapshot)
+        print("\n🧹 检查0字节文件...")
+        downloader.cleanup_zero_size_files(download_dir, snapshot)
+    downloader.print_duplicate_check_info()
+    
+    downloader.set_max_workers(max_workers, async_concurrency)
+    try:
+        results = downloader.download_batch(queries)
+    finally:
+        downloader.close()
+    
+    for download_dir in download_dirs:
+        downloader.save_downloaded_files(download_dir)
+    downloader.save_detected_posts()
+    downloader.save_batch_results(results)
+    downloader.print_batch_statistics(results)
+
 def main():
+    parser = argparse.ArgumentParser(description="Rule34 修复版视频下载器")
+    parser.add_argument('--batch', nargs='?', const=BATCH_FILE, metavar='FILE',
+                        help=f"批量模式：依次下载批量任务文件中的所有标签查询（默认 {BATCH_FILE}）")
+    args = parser.parse_args()
+    
     print("🚀 Rule34 修复版视频下载器")
     print("="*80)
     
+    # 读取存储/引擎相关配置
+    config = load_config()
+    export_json = config.get("export_json", False)
+    engine = config.get("engine", "thread")
+    async_concurrency = config.get("async_concurrency")
+    prefetch_pages = config.get("prefetch_pages", 1)
+    rate_limit = config.get("rate_limit")
+    # load_config 已用默认配置补全，所有选项都显式传给下载器
+    downloader_options = {
+        key: config[key]
+        for key in ("listing_mode", "base_url", "api_base_url", "api_key", "user_id", "post_parser",
+                    "segmented", "max_connections", "progress_interval", "verify_md5", "page_cache",
+                    "full_rescan", "connection_pool", "pipeline", "scheduling", "metrics", "tracing",
+                    "skip_known_md5")
+    }
+    
+    # 创建下载器（线程数在用户输入后设置）
+    downloader = Rule34FixedDownloader(max_workers=1, export_json=export_json,
+                                       engine=engine, async_concurrency=async_concurrency,
+                                       prefetch_pages=prefetch_pages, rate_limit=rate_limit,
+                                       **downloader_options)
+    
+    if args.batch:
+        run_batch(downloader, args.batch, config.get("max_workers", DEFAULT_CONFIG["max_workers"]),
+                  async_concurrency)
+        return
+    
     # 根据默认配置的tags[0]创建下载目录
     download_dir = get_default_download_dir()
     print(f"📁 使用下载目录: {download_dir}")
     
-    # 创建下载器
-    downloader = Rule34FixedDownloader(max_workers=1)  # 先创建默认下载器用于扫描
-    
-    # 自动扫描下载文件夹并生成文件列表
+    # 自动扫描下载文件夹（只遍历一次，后续步骤共用同一份快照）
     print(f"📁 正在自动扫描 {download_dir} 文件夹...")
-    downloader.sync_existing_files(download_dir)
+    snapshot = downloader.sync_existing_files(download_dir)
     
-    # 生成并保存文件列表 JSON
-    print("💾 正在生成文件列表 JSON...")
-    downloader.save_downloaded_files(download_dir)
+    # 生成并保存文件列表
+    print("💾 正在生成文件列表...")
+    downloader.save_downloaded_files(download_dir, snapshot)
     
     # 显示文件列表摘要
-    downloader.generate_file_list_summary(download_dir)
+    downloader.generate_file_list_summary(download_dir, snapshot)
     
     # 显示重复文件检查信息
     downloader.print_duplicate_check_info()
     
     # 清理0字节文件
     print("\n🧹 检查0字节文件...")
-    downloader.cleanup_zero_size_files(download_dir)
+    downloader.cleanup_zero_size_files(download_dir, snapshot)
     
     # 获取用户输入
     tags, max_workers = get_user_input()
@@ -1147,14 +2304,14 @@ def main():
         print("❌ 输入无效，程序退出")
         return
     
-    # 重新创建下载器（使用用户指定的线程数）
-    downloader = Rule34FixedDownloader(max_workers=max_workers)
-    
-    # 重新加载文件记录（确保使用最新的扫描结果）
-    downloader.downloaded_files = downloader.load_downloaded_files()
+    # 使用用户指定的线程数
+    downloader.set_max_workers(max_workers, async_concurrency)
     
     # 开始下载
-    downloaded_files = downloader.download_videos_by_tags(tags, download_dir)
+    try:
+        downloaded_files = downloader.download_videos_by_tags(tags, download_dir)
+    finally:
+        downloader.close()
     
     # 保存文件记录（更新后的）
     downloader.save_downloaded_files(download_dir)
@@ -1,84 +1,169 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-"""
-扫描downloads文件夹并更新已下载文件记录
-"""
-
-import os
-import json
-import hashlib
-from pathlib import Path
-
-def get_file_hash(file_path):
-    """计算文件的MD5哈希值"""
-    hash_md5 = hashlib.md5()
-    try:
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
-    except Exception as e:
-        print(f"计算文件哈希失败 {file_path}: {e}")
-        return None
-
-def scan_downloads_folder():
-    """扫描downloads文件夹并生成已下载文件记录"""
-    downloads_dir = Path("downloads")
-    downloaded_files = {}
-    
-    if not downloads_dir.exists():
-        print("downloads文件夹不存在！")
-        return {}
-    
-    print("开始扫描downloads文件夹...")
-    
-    # 遍历所有子文件夹
-    for subfolder in downloads_dir.iterdir():
-        if subfolder.is_dir():
-            print(f"扫描文件夹: {subfolder.name}")
-            
-            # 遍历子文件夹中的所有文件
-            for file_path in subfolder.rglob("*"):
-                if file_path.is_file():
-                    # 计算文件哈希
-                    file_hash = get_file_hash(file_path)
-                    if file_hash:
-                        # 使用相对路径作为键
-                        relative_path = str(file_path.relative_to(downloads_dir))
-                        downloaded_files[relative_path] = {
-                            "hash": file_hash,
-                            "size": file_path.stat().st_size,
-                            "modified": file_path.stat().st_mtime
-                        }
-                        print(f"  添加文件: {relative_path}")
-    
-    print(f"扫描完成，共找到 {len(downloaded_files)} 个文件")
-    return downloaded_files
-
-def update_downloaded_files_config():
-    """更新已下载文件配置文件"""
-    # 扫描downloads文件夹
-    downloaded_files = scan_downloads_folder()
-    
-    # 保存到配置文件
-    config_file = "downloaded_files_config.json"
-    try:
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(downloaded_files, f, indent=2, ensure_ascii=False)
-        print(f"已更新配置文件: {config_file}")
-        print(f"共记录 {len(downloaded_files)} 个已下载文件")
-    except Exception as e:
-        print(f"保存配置文件失败: {e}")
-
-def main():
-    """主函数"""
-    print("=" * 50)
-    print("扫描downloads文件夹并更新已下载文件记录")
-    print("=" * 50)
-    
-    update_downloaded_files_config()
-    
-    print("\n扫描完成！")
-
-if __name__ == "__main__":
-    main()
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+扫描downloads文件夹并更新已下载文件记录
+
+哈希计算使用进程池并行完成，按 (路径, 大小, 修改时间, inode) 缓存摘要，
+未变化的文件不会重新读取。
+"""
+
+import os
+import json
+import mmap
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+HASH_CACHE_FILE = "scan_hash_cache.json"
+READ_CHUNK_SIZE = 8 * 1024 * 1024
+
+def get_file_hash(file_path):
+    """计算文件的MD5哈希值（内存映射读取，映射失败时按大块读取）"""
+    hash_md5 = hashlib.md5()
+    try:
+        with open(file_path, "rb") as f:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    hash_md5.update(mapped)
+            except ValueError:
+                # 空文件无法映射
+                pass
+            except OSError:
+                f.seek(0)
+                for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                    hash_md5.update(chunk)
+        return hash_md5.hexdigest()
+    except Exception as e:
+        print(f"计算文件哈希失败 {file_path}: {e}")
+        return None
+
+def load_hash_cache(cache_path):
+    """加载哈希缓存: 相对路径 -> {hash, size, modified, inode}"""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_hash_cache(cache_path, cache):
+    """保存哈希缓存（先写临时文件再原子替换）"""
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+
+def hash_files(paths, workers=None):
+    """用进程池并行计算一组文件的哈希，返回 {路径: 哈希}"""
+    if not paths:
+        return {}
+    if workers == 1 or len(paths) == 1:
+        return {path: get_file_hash(path) for path in paths}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(paths, executor.map(get_file_hash, paths, chunksize=4)))
+
+def scan_downloads_folder(downloads_dir="downloads", cache_path=HASH_CACHE_FILE, workers=None,
+                          use_cache=True, stats=None):
+    """扫描downloads文件夹并生成已下载文件记录
+
+    use_cache 为False时重新计算所有哈希（仍会写入缓存）；cache_path 为None时完全不使用缓存文件。
+    stats 字典会被填入扫描统计（文件数、字节数、重新计算数、缓存命中数）
+    """
+    downloads_dir = Path(downloads_dir)
+    downloaded_files = {}
+    stats = stats if stats is not None else {}
+    stats.update({"files": 0, "bytes": 0, "hashed_files": 0, "hashed_bytes": 0, "cached_files": 0})
+
+    if not downloads_dir.exists():
+        print("downloads文件夹不存在！")
+        return {}
+
+    print("开始扫描downloads文件夹...")
+    cache = load_hash_cache(cache_path) if cache_path and use_cache else {}
+
+    # 遍历所有子文件夹，先收集文件信息，未命中缓存的文件统一并行计算哈希
+    entries = []  # (相对路径, 绝对路径, stat)
+    for subfolder in downloads_dir.iterdir():
+        if subfolder.is_dir():
+            print(f"扫描文件夹: {subfolder.name}")
+            for file_path in subfolder.rglob("*"):
+                if file_path.is_file():
+                    entries.append((str(file_path.relative_to(downloads_dir)), str(file_path), file_path.stat()))
+
+    to_hash = []
+    for relative_path, file_path, st in entries:
+        cached = cache.get(relative_path)
+        if (cached and cached.get("size") == st.st_size and cached.get("modified") == st.st_mtime
+                and cached.get("inode") == st.st_ino):
+            downloaded_files[relative_path] = cached
+            stats["cached_files"] += 1
+        else:
+            to_hash.append(file_path)
+        stats["files"] += 1
+        stats["bytes"] += st.st_size
+
+    if to_hash:
+        print(f"需要计算哈希: {len(to_hash)} 个文件（缓存命中 {stats['cached_files']} 个）")
+    hashes = hash_files(to_hash, workers)
+
+    for relative_path, file_path, st in entries:
+        if file_path not in hashes:
+            continue
+        file_hash = hashes[file_path]
+        if file_hash:
+            # 使用相对路径作为键
+            downloaded_files[relative_path] = {
+                "hash": file_hash,
+                "size": st.st_size,
+                "modified": st.st_mtime,
+                "inode": st.st_ino
+            }
+            stats["hashed_files"] += 1
+            stats["hashed_bytes"] += st.st_size
+            print(f"  添加文件: {relative_path}")
+
+    if cache_path:
+        save_hash_cache(cache_path, downloaded_files)
+
+    print(f"扫描完成，共找到 {len(downloaded_files)} 个文件")
+    return downloaded_files
+
+def update_downloaded_files_config(downloads_dir="downloads", workers=None, use_cache=True):
+    """更新已下载文件配置文件"""
+    # 扫描downloads文件夹
+    stats = {}
+    start = time.perf_counter()
+    downloaded_files = scan_downloads_folder(downloads_dir, HASH_CACHE_FILE, workers, use_cache, stats)
+    elapsed = time.perf_counter() - start
+
+    # 保存到配置文件
+    config_file = "downloaded_files_config.json"
+    try:
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump(downloaded_files, f, indent=2, ensure_ascii=False)
+        print(f"已更新配置文件: {config_file}")
+        print(f"共记录 {len(downloaded_files)} 个已下载文件")
+        print(f"耗时 {elapsed:.2f} 秒，重新计算哈希 {stats.get('hashed_files', 0)} 个文件，"
+              f"缓存命中 {stats.get('cached_files', 0)} 个")
+    except Exception as e:
+        print(f"保存配置文件失败: {e}")
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="扫描downloads文件夹并更新已下载文件记录")
+    parser.add_argument('--dir', default="downloads", help="下载目录")
+    parser.add_argument('--workers', type=int, default=None, help="哈希计算进程数（默认CPU核数）")
+    parser.add_argument('--no-cache', action='store_true', help="忽略哈希缓存，重新计算所有文件")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("扫描downloads文件夹并更新已下载文件记录")
+    print("=" * 50)
+
+    update_downloaded_files_config(args.dir, args.workers, not args.no_cache)
+
+    print("\n扫描完成！")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载调度：按策略决定帖子的下载顺序，并可设置所有下载共用的总带宽预算
+
+策略:
+    fifo          按列表页顺序
+    shortest      已知大小的文件从小到大优先（未知大小的排在后面，保持列表顺序）
+    newest        帖子ID从大到小
+    size_classes  按大小分档（默认 <16MB / <128MB / 更大 / 未知）轮流下载
+
+中断运行时，shortest 能留下最多的完整文件；size_classes 避免大文件一直等待。
+"""
+
+import time
+import heapq
+import itertools
+import threading
+from collections import deque
+
+POLICIES = ("fifo", "shortest", "newest", "size_classes")
+DEFAULT_SIZE_CLASSES_MB = (16, 128)
+
+
+class DownloadScheduler:
+    """有界的下载队列，按调度策略出队；队列满时 put 阻塞，close 后 get 取完剩余任务返回None"""
+
+    def __init__(self, policy="shortest", maxsize=0, size_classes_mb=DEFAULT_SIZE_CLASSES_MB):
+        if policy not in POLICIES:
+            print(f"⚠️ 未知的调度策略 {policy}，使用 fifo")
+            policy = "fifo"
+        self.policy = policy
+        self.maxsize = maxsize
+        self.class_bounds = [int(mb * 1024 * 1024) for mb in size_classes_mb]
+        self.cond = threading.Condition()
+        self.heap = []  # fifo / shortest / newest
+        self.classes = [deque() for _ in range(len(self.class_bounds) + 2)]  # 最后一档为未知大小
+        self.next_class = 0
+        self.count = 0
+        self.sequence = itertools.count()
+        self.closed = False
+
+    def size_class(self, size):
+        """大小所在的档位，未知大小为最后一档"""
+        if not size:
+            return len(self.classes) - 1
+        for index, bound in enumerate(self.class_bounds):
+            if size < bound:
+                return index
+        return len(self.class_bounds)
+
+    def sort_key(self, size, post_id, sequence):
+        if self.policy == "shortest":
+            return (0, size, sequence) if size else (1, 0, sequence)
+        if self.policy == "newest":
+            post_id = str(post_id)
+            return (-int(post_id) if post_id.isdigit() else 0, sequence)
+        return (sequence,)
+
+    def order(self, post_ids, sizes):
+        """按策略排列一组帖子ID（提交前排序），sizes 为 {post_id: 字节数}"""
+        if self.policy == "fifo":
+            return list(post_ids)
+        if self.policy == "size_classes":
+            classes = [[] for _ in self.classes]
+            for post_id in post_ids:
+                classes[self.size_class(sizes.get(post_id))].append(post_id)
+            interleaved = itertools.zip_longest(*classes)
+            return [post_id for group in interleaved for post_id in group if post_id is not None]
+        keyed = [(self.sort_key(sizes.get(post_id), post_id, i), post_id) for i, post_id in enumerate(post_ids)]
+        return [post_id for _, post_id in sorted(keyed)]
+
+    def put(self, item, size=None, post_id=None):
+        with self.cond:
+            while self.maxsize and self.count >= self.maxsize:
+                self.cond.wait()
+            sequence = next(self.sequence)
+            if self.policy == "size_classes":
+                self.classes[self.size_class(size)].append(item)
+            else:
+                heapq.heappush(self.heap, (self.sort_key(size, post_id, sequence), sequence, item))
+            self.count += 1
+            self.cond.notify_all()
+
+    def pop(self):
+        """取出下一个任务（调用方持有锁且队列非空）"""
+        if self.policy != "size_classes":
+            return heapq.heappop(self.heap)[2]
+        for offset in range(len(self.classes)):
+            index = (self.next_class + offset) % len(self.classes)
+            if self.classes[index]:
+                self.next_class = index + 1
+                return self.classes[index].popleft()
+
+    def get(self):
+        with self.cond:
+            while not self.count and not self.closed:
+                self.cond.wait()
+            if not self.count:
+                return None
+            item = self.pop()
+            self.count -= 1
+            self.cond.notify_all()
+            return item
+
+    def qsize(self):
+        return self.count
+
+    def close(self):
+        """不再有新任务，等待中的 get 取完剩余任务后返回None"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class BandwidthBudget:
+    """所有下载共用的总带宽预算（令牌桶，单位字节/秒）"""
+
+    def __init__(self, bytes_per_second, burst_seconds=1.0):
+        self.rate = bytes_per_second
+        self.burst = bytes_per_second * burst_seconds
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.total_wait = 0.0
+
+    def reserve(self, size):
+        """预订 size 字节，返回调用方需要等待的秒数"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= size
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.total_wait += delay
+            return delay
+
+    def consume(self, size):
+        """阻塞直到预算允许传输 size 字节，返回等待的秒数"""
+        delay = self.reserve(size)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
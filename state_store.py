@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于SQLite的本地状态存储（已检测帖子、已下载文件）
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+DEFAULT_STATE_DB = "rule34_state.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    post_id TEXT PRIMARY KEY,
+    detected_time TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    filename TEXT PRIMARY KEY,
+    filepath TEXT,
+    size INTEGER,
+    modified_time REAL,
+    post_id TEXT,
+    md5 TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_post_id ON files (post_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _in_directory(filepath, directory):
+    """记录的文件路径是否位于 directory 下；没有记录路径时视为位于任意目录下"""
+    if not filepath:
+        return True
+    directory = os.path.normcase(os.path.abspath(directory))
+    return os.path.normcase(os.path.abspath(filepath)).startswith(os.path.join(directory, ''))
+
+
+class StateStore:
+    """帖子和文件记录的事务性存储，每条记录一次小写入，不再整体重写JSON"""
+
+    def __init__(self, db_path=DEFAULT_STATE_DB):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.migrate()
+
+    def migrate(self):
+        """升级旧版数据库结构"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+        if "md5" not in columns:
+            self.conn.execute("ALTER TABLE files ADD COLUMN md5 TEXT")
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            self.conn.close()
+
+    # ---- meta ----
+
+    def get_meta(self, key, default=None):
+        """读取元数据"""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        """写入元数据"""
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    # ---- 标签高水位 ----
+
+    def get_watermark(self, tag_key):
+        """某个标签查询已完整抓取过的最大帖子ID，没有记录时返回None"""
+        value = self.get_meta(f"watermark:{tag_key}")
+        return int(value) if value else None
+
+    def set_watermark(self, tag_key, post_id):
+        """记录标签查询的最大帖子ID"""
+        self.set_meta(f"watermark:{tag_key}", int(post_id))
+
+    # ---- posts ----
+
+    def load_posts(self):
+        """加载所有已检测帖子ID"""
+        with self.lock:
+            rows = self.conn.execute("SELECT post_id FROM posts").fetchall()
+        return {row[0] for row in rows}
+
+    def add_post(self, post_id):
+        """记录一个已检测帖子"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO posts (post_id, detected_time) VALUES (?, ?)",
+                (str(post_id), datetime.now().isoformat())
+            )
+
+    def add_posts(self, post_ids):
+        """批量记录已检测帖子（单个事务）"""
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO posts (post_id, detected_time) VALUES (?, ?)",
+                    [(str(post_id), now) for post_id in post_ids]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    # ---- files ----
+
+    def load_files(self):
+        """加载所有文件记录"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT filename, filepath, size, modified_time, post_id, md5 FROM files"
+            ).fetchall()
+        return [
+            {"filename": r[0], "filepath": r[1], "size": r[2], "modified_time": r[3], "post_id": r[4], "md5": r[5]}
+            for r in rows
+        ]
+
+    def load_filenames(self):
+        """加载所有已记录文件名"""
+        with self.lock:
+            rows = self.conn.execute("SELECT filename FROM files").fetchall()
+        return {row[0] for row in rows}
+
+    def load_filenames_in(self, directory):
+        """加载记录路径位于 directory 下的文件名（没有记录路径的旧记录也算在内）"""
+        with self.lock:
+            rows = self.conn.execute("SELECT filename, filepath FROM files").fetchall()
+        return {filename for filename, filepath in rows if _in_directory(filepath, directory)}
+
+    def load_file_md5s(self):
+        """加载已校验过MD5的文件记录，返回 {filename: md5}"""
+        with self.lock:
+            rows = self.conn.execute("SELECT filename, md5 FROM files WHERE md5 IS NOT NULL").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def add_file(self, filename, filepath=None, size=None, modified_time=None, post_id=None, md5=None):
+        """记录一个已下载文件，md5 为下载时校验过的摘要"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (filename, filepath, size, modified_time, post_id, md5) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (filename, filepath, size, modified_time, post_id, md5)
+            )
+
+    def remove_file(self, filename):
+        """删除一个文件记录"""
+        with self.lock:
+            self.conn.execute("DELETE FROM files WHERE filename = ?", (filename,))
+
+    def replace_files(self, file_records, directory=None):
+        """用磁盘扫描结果替换文件表（单个事务），大小未变的文件保留已校验的MD5
+
+        directory 为扫描的目录时只替换记录路径位于该目录下的记录，其它目录的记录保留；
+        为None时替换整个文件表
+        """
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                rows = self.conn.execute("SELECT filename, filepath, size, md5 FROM files").fetchall()
+                known_md5 = {
+                    (filename, size): md5
+                    for filename, _, size, md5 in rows
+                    if md5 is not None
+                }
+                if directory is None:
+                    self.conn.execute("DELETE FROM files")
+                else:
+                    self.conn.executemany(
+                        "DELETE FROM files WHERE filename = ?",
+                        [(filename,) for filename, filepath, _, _ in rows if _in_directory(filepath, directory)]
+                    )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO files (filename, filepath, size, modified_time, post_id, md5) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (r["filename"], r.get("filepath"), r.get("size"), r.get("modified_time"), r.get("post_id"),
+                         r.get("md5") or known_md5.get((r["filename"], r.get("size"))))
+                        for r in file_records
+                    ]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    # ---- JSON 导入 / 导出 ----
+
+    def import_json(self, detected_posts_config, downloaded_files_config):
+        """一次性导入旧版JSON记录文件，记录和导入标记在同一个事务中写入，不会重复导入
+
+        任一JSON文件读取或解析失败时不写入标记，下次启动会重新导入（重复导入是幂等的）
+        """
+        if self.get_meta("json_imported"):
+            return 0, 0
+
+        failed = False
+        post_ids = []
+        if os.path.exists(detected_posts_config):
+            try:
+                with open(detected_posts_config, 'r', encoding='utf-8') as f:
+                    config_data = json.load(f)
+                for post_info in config_data.get('posts', []):
+                    if 'post_id' in post_info:
+                        post_ids.append(post_info['post_id'])
+            except Exception as e:
+                failed = True
+                print(f"⚠️ 导入帖子记录失败: {e}")
+
+        file_records = []
+        if os.path.exists(downloaded_files_config):
+            try:
+                with open(downloaded_files_config, 'r', encoding='utf-8') as f:
+                    config_data = json.load(f)
+                for file_info in config_data.get('files', []):
+                    if 'filename' in file_info:
+                        file_records.append({
+                            "filename": file_info['filename'],
+                            "filepath": file_info.get('filepath'),
+                            "size": file_info.get('size'),
+                        })
+            except Exception as e:
+                failed = True
+                print(f"⚠️ 导入文件记录失败: {e}")
+
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO posts (post_id, detected_time) VALUES (?, ?)",
+                    [(str(post_id), now) for post_id in post_ids]
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO files (filename, filepath, size) VALUES (?, ?, ?)",
+                    [(r["filename"], r["filepath"], r["size"]) for r in file_records]
+                )
+                if not failed:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", ("json_imported", now)
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return len(post_ids), len(file_records)
+
+    def export_posts_json(self, path):
+        """导出已检测帖子为JSON（兼容旧格式）"""
+        posts = sorted(self.load_posts())
+        config_data = {
+            "scan_time": datetime.now().isoformat(),
+            "total_posts": len(posts),
+            "posts": [{"post_id": post_id} for post_id in posts]
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(config_data, f, ensure_ascii=False, indent=2)
+        return len(posts)
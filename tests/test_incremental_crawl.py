@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量抓取回归测试：列表页抓取失败时不能把抓取标记为完整，也不能推进标签高水位
+
+使用 benchmarks/stub_server.py 的本地替身站点，让某一页列表总是返回429。
+
+用法:
+    python -m pytest -q tests
+"""
+
+import os
+import io
+import sys
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from rule34_fixed_downloader import Rule34FixedDownloader  # noqa: E402
+from http_client import RetryPolicy  # noqa: E402
+from stub_server import StubSite, start_server  # noqa: E402
+import async_engine  # noqa: E402
+
+POSTS = 126  # 3页HTML列表
+PAGE_SIZE = 42
+FIRST_ID = 10000000
+
+
+class IncrementalCrawlTest(unittest.TestCase):
+    def setUp(self):
+        self.site = StubSite.synthetic(POSTS, 1024, first_id=FIRST_ID, retry_after=0)
+        self.server, server_url = start_server(self.site)
+        self.page_url = server_url.replace("127.0.0.1", "localhost")
+        self.tmp = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def run_crawl(self, engine, listing_mode):
+        """运行一次完整下载，返回 (下载的文件数, 标签高水位)"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            downloader = Rule34FixedDownloader(
+                max_workers=3, state_db="state.db", engine=engine, listing_mode=listing_mode,
+                base_url=self.page_url, api_base_url=self.page_url,
+                rate_limit={"rate": 100, "max_rate": 200}, progress_interval=0, page_cache={"enabled": False}
+            )
+            downloader.client.retry_policy = RetryPolicy(max_429_retries=1, jitter=0)
+            downloader.api_page_limit = PAGE_SIZE
+            try:
+                files = downloader.download_videos_by_tags("stub", "downloads")
+                watermark = downloader.store.get_watermark(downloader.get_tag_key("stub"))
+            finally:
+                downloader.close()
+        return len(files or []), watermark
+
+    def check_failed_page_keeps_watermark(self, engine, listing_mode, failing_page):
+        self.site.failing_pages.add(failing_page)
+        files, watermark = self.run_crawl(engine, listing_mode)
+        self.assertEqual(files, PAGE_SIZE)
+        self.assertIsNone(watermark)
+
+        # 列表页恢复后，下一次运行补齐剩余帖子并推进高水位
+        self.site.failing_pages.clear()
+        files, watermark = self.run_crawl(engine, listing_mode)
+        self.assertEqual(files, POSTS - PAGE_SIZE)
+        self.assertEqual(watermark, FIRST_ID + POSTS)
+
+    def test_thread_html_listing_failure(self):
+        self.check_failed_page_keeps_watermark("thread", "html", ("listing", PAGE_SIZE))
+
+    def test_thread_api_listing_failure(self):
+        self.check_failed_page_keeps_watermark("thread", "api", ("api", 1))
+
+    @unittest.skipUnless(async_engine.is_available(), "需要安装 aiohttp")
+    def test_async_html_listing_failure(self):
+        self.check_failed_page_keeps_watermark("async", "html", ("listing", PAGE_SIZE))
+
+    @unittest.skipUnless(async_engine.is_available(), "需要安装 aiohttp")
+    def test_async_api_listing_failure(self):
+        self.check_failed_page_keeps_watermark("async", "api", ("api", 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
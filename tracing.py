@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可选的分阶段计时：每个阶段记录一个 span 写入JSONL文件，运行结束时汇总各阶段的
+p50/p95/p99 和等待（sleep）时间占比
+
+span 名称:
+    listing            抓取一个列表页
+    post.fetch         抓取帖子页
+    post.parse         解析帖子页中的视频链接
+    download           下载一个文件（含校验失败后的重试）
+    transfer           一次传输（网络读取 + 写盘）
+    disk.write         该次传输累计的写盘时间
+    verify             校验并重命名 .part
+    sleep.rate_limit   限速器等待
+    sleep.backoff      429/5xx/连接错误的重试退避
+    sleep.bandwidth    该次传输累计的带宽预算等待
+
+嵌套的 span 自动继承外层的帖子ID（线程和asyncio任务各自独立）。
+"""
+
+import json
+import math
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+current_post = contextvars.ContextVar("trace_post", default=None)
+
+
+def percentile(sorted_values, q):
+    """最近秩法百分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Tracer:
+    """span 记录器；path 为None时不记录任何内容"""
+
+    def __init__(self, path=None):
+        self.enabled = path is not None
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8') if self.enabled else None
+        self.lock = threading.Lock()
+        self.durations = {}  # span名称 -> [秒]
+        self.wall_start = time.monotonic()
+
+    @contextmanager
+    def span(self, name, post_id=None, **attrs):
+        """记录 with 块的耗时；给出 post_id 时内部的 span 都归属于该帖子"""
+        if not self.enabled:
+            yield
+            return
+        token = current_post.set(str(post_id)) if post_id is not None else None
+        start_time = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            if token is not None:
+                current_post.reset(token)
+            if error:
+                attrs['error'] = error
+            self.record(name, duration, post_id, start_time, **attrs)
+
+    def record(self, name, duration, post_id=None, start_time=None, **attrs):
+        """记录一个已结束的 span（用于累计值，如一次传输的写盘总时间）"""
+        if not self.enabled:
+            return
+        entry = {
+            "name": name,
+            "post_id": str(post_id) if post_id is not None else current_post.get(),
+            "start": round(start_time if start_time is not None else time.time() - duration, 6),
+            "duration": round(duration, 6),
+            "thread": threading.current_thread().name
+        }
+        entry.update(attrs)
+        line = json.dumps(entry, ensure_ascii=False)
+        with self.lock:
+            self.durations.setdefault(name, []).append(duration)
+            if self.file:
+                self.file.write(line + '\n')
+
+    def sleep(self, kind, seconds):
+        """记录一次等待"""
+        if seconds > 0:
+            self.record(f"sleep.{kind}", seconds)
+
+    def summary(self, workers=1):
+        """各阶段统计和等待占比
+
+        sleep_share = 等待总时间 / (墙钟时间 × 并发数)，即并发容量中花在等待上的比例
+        """
+        if not self.enabled:
+            return None
+        wall = time.monotonic() - self.wall_start
+        with self.lock:
+            durations = {name: sorted(values) for name, values in self.durations.items()}
+        stages = {}
+        for name, values in sorted(durations.items()):
+            stages[name] = {
+                "count": len(values),
+                "total": round(sum(values), 3),
+                "p50": round(percentile(values, 50), 4),
+                "p95": round(percentile(values, 95), 4),
+                "p99": round(percentile(values, 99), 4)
+            }
+        sleep_seconds = sum(stage["total"] for name, stage in stages.items() if name.startswith("sleep."))
+        return {
+            "trace_file": self.path,
+            "wall_seconds": round(wall, 3),
+            "workers": workers,
+            "sleep_seconds": round(sleep_seconds, 3),
+            "sleep_share": round(sleep_seconds / (wall * max(1, workers)), 4) if wall > 0 else 0.0,
+            "stages": stages
+        }
+
+    def flush(self):
+        if self.file:
+            with self.lock:
+                self.file.flush()
+
+    def close(self):
+        if self.file:
+            with self.lock:
+                self.file.close()
+                self.file = None
+            self.enabled = False